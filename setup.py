@@ -56,7 +56,8 @@ setup(
     install_requires=[
         'websauna',
         'Markdown',
-        'rfeed'
+        'rfeed',
+        'PyYAML',
     ],
     extras_require={
         # Dependencies for running test suite
@@ -74,6 +75,20 @@ setup(
             'pytest-timeout',
             'webtest',
             'factory_boy',
+            'Pygments',
+            'Pillow',
+        ],
+        # Brotli compressed variants of cached pages
+        'brotli': [
+            'brotli',
+        ],
+        # Responsive variants of images in posts
+        'images': [
+            'Pillow',
+        ],
+        # Syntax highlighting of code blocks in posts
+        'highlight': [
+            'Pygments',
         ],
         # Dependencies to make releases
         'dev': [
@@ -91,5 +106,10 @@ setup(
         'paste.app_factory': [
             'main = websauna.blog.demo:main'
         ],
+        'console_scripts': [
+            'ws-blog-import = websauna.blog.scripts.import_posts:main',
+            'ws-blog-export = websauna.blog.scripts.export_posts:main',
+            'ws-blog-derive = websauna.blog.scripts.derive_posts:main',
+        ],
     }
 )
@@ -25,10 +25,16 @@ class AddonInitializer:
         """Include our package templates folder in Jinja 2 configuration."""
 
         self.config.add_jinja2_search_path('websauna.blog:templates', name='.html', prepend=False)
+        self.config.add_jinja2_extension('websauna.blog.fragments.FragmentCacheExtension', name='.html')
 
         from . import templatevars
         self.config.include(templatevars)
 
+    @after(Initializer.configure_static)
+    def configure_static(self):
+        """Serve the stylesheet of highlighted code and other assets of this addon."""
+        self.config.registry.static_asset_policy.add_static_view('websauna-blog-static', 'websauna.blog:static')
+
     def configure_addon_views(self):
         """Configure views for your application.
 
@@ -36,6 +42,11 @@ class AddonInitializer:
         """
 
         self.config.add_route('blog_tag', '/blog/tag/{tag}', factory="websauna.blog.views.blog_container_factory")
+        self.config.add_route('blog_data', '/blog/by/{key}/{value}', factory="websauna.blog.views.blog_container_factory")
+        self.config.add_route('blog_api_posts', '/blog/api/posts', factory="websauna.blog.views.blog_container_factory")
+        self.config.add_route('blog_api_post', '/blog/api/posts/{slug}', factory="websauna.blog.views.blog_container_factory")
+        self.config.add_route('blog_api_tags', '/blog/api/tags', factory="websauna.blog.views.blog_container_factory")
+        self.config.add_route('blog_api_tag_posts', '/blog/api/tags/{tag}/posts', factory="websauna.blog.views.blog_container_factory")
         self.config.add_route('blog', '/blog/*traverse', factory="websauna.blog.views.blog_container_factory")
 
         from . import views
@@ -44,6 +55,112 @@ class AddonInitializer:
         from . import rss
         self.config.scan(rss)
 
+        from . import api
+        self.config.scan(api)
+
+    def configure_view_counter(self):
+        """Set up the write-behind post view counter configured by ``blog.view_counter`` setting."""
+        from .counters import create_view_counter
+        from .interfaces import IViewCounter
+
+        counter = create_view_counter(self.config.registry)
+        if counter:
+            self.config.registry.registerUtility(counter, IViewCounter)
+
+    def configure_cache(self):
+        """Set up the content cache configured by ``blog.cache`` setting and drop cached pages when posts change."""
+        from .cache import create_cache
+        from .events import PostsChanged
+        from .interfaces import IBlogCache
+        from .neighbours import add_neighbours
+        from .pagecache import invalidate_changed
+        from .slugcache import invalidate_slugs
+
+        cache = create_cache(self.config.registry)
+        if cache:
+            self.config.registry.registerUtility(cache, IBlogCache)
+
+        # Extends the event before other subscribers see it
+        self.config.add_subscriber(add_neighbours, PostsChanged)
+        self.config.add_subscriber(invalidate_changed, PostsChanged)
+        self.config.add_subscriber(invalidate_slugs, PostsChanged)
+
+    def configure_purge(self):
+        """Set up purging of changed pages from caching proxies configured by ``blog.purge`` setting."""
+        from .events import PostsChanged
+        from .interfaces import IPurgeBackend
+        from .purge import create_purger
+        from .purge import purge_changed
+
+        purger = create_purger(self.config.registry)
+        if purger:
+            self.config.registry.registerUtility(purger, IPurgeBackend)
+            self.config.add_subscriber(purge_changed, PostsChanged)
+
+    def configure_read_replica(self):
+        """Serve public views from the read replica set in ``blog.read_replica_url``."""
+        from .events import PostsChanged
+        from .interfaces import IReadReplica
+        from .replica import create_read_replica
+        from .replica import stick_to_primary
+
+        replica = create_read_replica(self.config.registry)
+        if replica:
+            self.config.registry.registerUtility(replica, IReadReplica)
+            self.config.add_subscriber(stick_to_primary, PostsChanged)
+
+    def configure_invalidation_bus(self):
+        """Broadcast content changes to other worker processes with the bus set in ``blog.invalidation_bus``."""
+        from pyramid.events import NewRequest
+
+        from .bus import create_bus
+        from .bus import publish_changed
+        from .bus import start_listener
+        from .events import PostsChanged
+        from .interfaces import IInvalidationBus
+
+        bus = create_bus(self.config.registry)
+        if bus:
+            self.config.registry.registerUtility(bus, IInvalidationBus)
+            self.config.add_subscriber(publish_changed, PostsChanged)
+            self.config.add_subscriber(start_listener, NewRequest)
+
+    def configure_rendering(self):
+        """Render Markdown in a process pool configured by ``blog.rendering`` settings."""
+        from .interfaces import IMarkdownRenderer
+        from .rendering import create_renderer
+
+        self.config.registry.registerUtility(create_renderer(self.config.registry), IMarkdownRenderer)
+
+    def configure_images(self):
+        """Make responsive variants of post images if ``blog.images.path`` is set."""
+        from .images import create_image_processor
+        from .interfaces import IImageProcessor
+
+        processor = create_image_processor(self.config.registry)
+        if processor:
+            self.config.registry.registerUtility(processor, IImageProcessor)
+
+    def configure_derivatives(self):
+        """Compute rendered HTML and other derived values of saved posts with the runner set in ``blog.derivatives.runner``."""
+        from .derivatives import on_posts_changed
+        from .events import PostsChanged
+
+        self.config.add_subscriber(on_posts_changed, PostsChanged)
+
+        if self.config.registry.settings.get("blog.derivatives.runner") == "celery":
+            from . import tasks
+            self.config.scan(tasks)
+
+    def configure_warmup(self):
+        """Precompile templates and prerender pages when the application has been created, if ``blog.warmup`` is set."""
+        from pyramid.events import ApplicationCreated
+        from pyramid.settings import asbool
+
+        if asbool(self.config.registry.settings.get("blog.warmup", False)):
+            from .warmup import on_application_created
+            self.config.add_subscriber(on_application_created, ApplicationCreated)
+
     def run(self):
 
         # This will make sure our initialization hooks are called later
@@ -51,6 +168,15 @@ class AddonInitializer:
 
         # Run our custom initialization code which does not have a good hook
         self.configure_addon_views()
+        self.configure_view_counter()
+        self.configure_cache()
+        self.configure_purge()
+        self.configure_read_replica()
+        self.configure_invalidation_bus()
+        self.configure_rendering()
+        self.configure_images()
+        self.configure_derivatives()
+        self.configure_warmup()
 
 
 def includeme(config: Configurator):
@@ -6,11 +6,14 @@ import string
 # Pyramid
 import colander
 import deform
+from pyramid.decorator import reify
 from pyramid.httpexceptions import HTTPFound
+from pyramid.httpexceptions import HTTPNotFound
 from pyramid.view import view_config
 
 # Websauna
 from websauna.system.admin.views import Add as DefaultAdd
+from websauna.system.admin.views import Delete as DefaultDelete
 from websauna.system.admin.views import Edit as DefaultEdit
 from websauna.system.admin.views import Listing as DefaultListing
 from websauna.system.admin.views import Show as DefaultShow
@@ -30,11 +33,25 @@ from websauna.utils.slug import SlugDecodeError
 from websauna.utils.slug import slug_to_uuid
 from websauna.utils.slug import uuid_to_slug
 
+from . import bulk
 from .admins import PostAdmin
 from .admins import TagAdmin
+from .events import notify_posts_changed
 from .models import Post
 from .models import Tag
-from .views import get_post_resource
+from .rendering import get_renderer
+from .revisions import get_revisions
+from .revisions import get_snapshot_interval
+from .revisions import rebuild_body
+from .revisions import record_revision
+from .slughistory import is_slug_taken
+from .slughistory import record_slug_change
+from .views import blog_container_factory
+
+
+def get_editor_name(request: Request) -> str:
+    """Who is making changes, recorded in the revision history."""
+    return request.user.friendly_name if request.user else None
 
 
 @colander.deferred
@@ -88,9 +105,9 @@ def deferred_is_good_slug(node, kwargs):
             if c not in allowed:
                 raise colander.Invalid(node, "Slug contained invalid character: {}".format(c))
 
-        # Catch double slug attempts here, otherwise we will get HTTP 500 due to SQL level error
-        existing_post = dbsession.query(Post).filter_by(slug=value).one_or_none()
-        if existing_post and (existing_post != currently_edited_post):
+        # Catch double slug attempts here, otherwise we will get HTTP 500 due to SQL level error.
+        # Former slugs of other posts still redirect to them and are taken too.
+        if is_slug_taken(dbsession, value, currently_edited_post.id if currently_edited_post else None):
             raise colander.Invalid(node, "Slug already exists: {}".format(value))
 
     return is_good_slug
@@ -136,14 +153,41 @@ class PostSchema(CSRFSchema):
         objectify(self, appstruct, obj)
 
 
-@view_overrides(context=PostAdmin)
+class SelectColumn(listing.Column):
+    """Checkbox for picking rows to a bulk action form."""
+
+    header_template = "admin/column_header_select.html"
+    body_template = "admin/column_body_select.html"
+
+    def __init__(self, id: str = "select", name: str = "", form_id: str = "bulk-actions"):
+        super(SelectColumn, self).__init__(id=id, name=name)
+        self.form_id = form_id
+
+    def get_value(self, view, obj):
+        return uuid_to_slug(obj.id)
+
+
+def get_selected_ids(request: Request) -> list:
+    """Decode ids picked with :py:class:`SelectColumn`."""
+    ids = []
+    for value in request.POST.getall("ids"):
+        try:
+            ids.append(slug_to_uuid(value))
+        except SlugDecodeError:
+            continue
+    return ids
+
+
+@view_overrides(context=PostAdmin, renderer="admin/post_listing.html")
 class PostListing(DefaultListing):
     """Show all blog posts."""
     table = listing.Table(
         columns=[
+            SelectColumn(),
             listing.Column("title", "Title"),
             listing.Column("created_at", "Created"),
             listing.Column("published_at", "Published"),
+            listing.Column("view_count", "Views"),
             listing.ControlsColumn()
         ]
     )
@@ -166,6 +210,8 @@ class PostAdd(DefaultAdd):
         obj.ensure_slug(dbsession)
         dbsession.add(obj)
         dbsession.flush()
+        record_revision(dbsession, obj, None, get_snapshot_interval(self.request.registry), author=get_editor_name(self.request))
+        notify_posts_changed(self.request, post_ids=[obj.id], tags=[tag.title for tag in obj.tags], slugs=[obj.slug])
 
 
 class PostEditSchema(CSRFSchema):
@@ -220,11 +266,27 @@ class PostEdit(DefaultEdit):
         form = deform.Form(schema, buttons=self.get_buttons(), resource_registry=ResourceRegistry(self.request))
         return form
 
+    def save_changes(self, form: deform.Form, appstruct: dict, obj: Post):
+        """Store the previous body in the revision history."""
+        previous_body = obj.body
+        previous_slug = obj.slug
+        previous_tags = [tag.title for tag in obj.tags]
+        super(PostEdit, self).save_changes(form, appstruct, obj)
+        record_slug_change(self.request.dbsession, obj, previous_slug)
+        record_revision(self.request.dbsession, obj, previous_body, get_snapshot_interval(self.request.registry), author=get_editor_name(self.request))
+        notify_posts_changed(self.request, post_ids=[obj.id], tags=previous_tags + [tag.title for tag in obj.tags], slugs=[previous_slug, obj.slug])
+
 
 @view_overrides(context=PostAdmin.Resource, renderer="admin/post_show.html")
 class PostShow(DefaultShow):
     """Show blog post technical details."""
 
+    def show(self):
+        """Add a preview of the rendered body."""
+        data = super(PostShow, self).show()
+        data["preview_html"] = get_renderer(self.request.registry).render(data["obj"].body)[0]
+        return data
+
     @property
     def resource_buttons(self):
         """Customize buttons toolbar."""
@@ -235,13 +297,14 @@ class PostShow(DefaultShow):
         view_on_site = ResourceButton(id="btn-view-on-site", name="View on site")
 
         def link_on_site(context, request):
-            resource = get_post_resource(request, context.get_object().slug)
+            # Wrap the post loaded from the primary, a lagging replica may not have it yet
+            resource = blog_container_factory(request).wrap_post(context.get_object())
             return request.resource_url(resource)
         view_on_site.get_link = link_on_site
         buttons.append(view_on_site)
 
         # Publish button
-        if not self.get_object().published_at:
+        if not self.get_object().is_published():
             change_publish_status = TraverseLinkButton(id="btn-change-publish-status", name="Publish", view_name="change_publish_status")
         else:
             change_publish_status = TraverseLinkButton(id="btn-change-publish-status", name="Unpublish", view_name="change_publish_status")
@@ -250,6 +313,8 @@ class PostShow(DefaultShow):
         change_publish_status.template = "crud/form_button.html"
         buttons.append(change_publish_status)
 
+        buttons.append(TraverseLinkButton(id="btn-revisions", name="Revisions", view_name="revisions"))
+
         return buttons
 
 
@@ -258,29 +323,193 @@ def change_publish_status(context: PostAdmin.Resource, request: Request):
     """Change publish status."""
 
     post = context.get_object()
-    if post.published_at:
+    if post.is_published():
         post.published_at = None
         messages.add(request, kind="info", msg="The post has been retracted.", msg_id="msg-unpublished")
     else:
         post.published_at = now()
         messages.add(request, kind="info", msg="The post has been published.", msg_id="msg-published")
 
+    notify_posts_changed(request, post_ids=[post.id], tags=[tag.title for tag in post.tags], slugs=[post.slug])
+
     # Back to show page
     return HTTPFound(request.resource_url(context, "show"))
 
 
+@view_config(context=PostAdmin.Resource, name="revisions", route_name="admin", renderer="admin/post_revisions.html", permission="view")
+def post_revisions(context: PostAdmin.Resource, request: Request):
+    """Browse the revision history of a post."""
+    post = context.get_object()
+    revisions = get_revisions(request.dbsession, post.id).all()
+    current_view_name = "Revisions"
+    return locals()
+
+
+def get_requested_revision(request: Request) -> int:
+    try:
+        return int(request.params["revision"])
+    except (KeyError, ValueError):
+        raise HTTPNotFound()
+
+
+@view_config(context=PostAdmin.Resource, name="revision", route_name="admin", renderer="admin/post_revision.html", permission="view")
+def post_revision(context: PostAdmin.Resource, request: Request):
+    """Show the post body as it was in one revision."""
+    post = context.get_object()
+    revision = get_requested_revision(request)
+    try:
+        body = rebuild_body(request.dbsession, post.id, revision)
+    except KeyError:
+        raise HTTPNotFound()
+    current_view_name = "Revision {}".format(revision)
+    return locals()
+
+
+@view_config(context=PostAdmin.Resource, name="restore_revision", route_name="admin", request_method="POST", permission="edit")
+def restore_revision(context: PostAdmin.Resource, request: Request):
+    """Bring back the body of an earlier revision.
+
+    The restored body is recorded as a new revision, so the history is never rewritten.
+    """
+    post = context.get_object()
+    revision = get_requested_revision(request)
+    try:
+        body = rebuild_body(request.dbsession, post.id, revision)
+    except KeyError:
+        raise HTTPNotFound()
+
+    previous_body = post.body
+    post.body = body
+    record_revision(request.dbsession, post, previous_body, get_snapshot_interval(request.registry), author=get_editor_name(request))
+    notify_posts_changed(request, post_ids=[post.id])
+    messages.add(request, kind="info", msg="Restored revision {}.".format(revision), msg_id="msg-revision-restored")
+    return HTTPFound(request.resource_url(context, "show"))
+
+
+@view_overrides(context=PostAdmin.Resource)
+class PostDelete(DefaultDelete):
+    """Drop cached copies of the deleted post."""
+
+    def delete_object(self):
+        post = self.get_object()
+        notify_posts_changed(self.request, post_ids=[post.id], tags=[tag.title for tag in post.tags], slugs=[post.slug])
+        return super(PostDelete, self).delete_object()
+
+
+#: Bulk actions available on the post listing: action id -> (function, needs tag, message)
+POST_BULK_ACTIONS = {
+    "publish": (lambda dbsession, ids, tag: bulk.publish_posts(dbsession, ids), False, "Published {} posts."),
+    "unpublish": (lambda dbsession, ids, tag: bulk.unpublish_posts(dbsession, ids), False, "Retracted {} posts."),
+    "add_tag": (bulk.add_tag, True, "Tagged {} posts."),
+    "remove_tag": (bulk.remove_tag, True, "Untagged {} posts."),
+    "delete": (lambda dbsession, ids, tag: bulk.delete_posts(dbsession, ids), False, "Deleted {} posts."),
+}
+
+
+@view_config(context=PostAdmin, name="bulk_action", route_name="admin", request_method="POST", permission="edit")
+def post_bulk_action(context: PostAdmin, request: Request):
+    """Apply an action to all posts selected on the listing.
+
+    The action runs as one set based SQL statement in the request transaction.
+    """
+    listing_url = request.resource_url(context, "listing")
+    ids = get_selected_ids(request)
+    action = POST_BULK_ACTIONS.get(request.POST.get("action"))
+    tag = request.POST.get("tag", "").strip()
+
+    if not ids or not action:
+        messages.add(request, kind="warning", msg="Select posts and an action.", msg_id="msg-bulk-nothing-selected")
+        return HTTPFound(listing_url)
+
+    func, needs_tag, msg = action
+    if needs_tag and not tag:
+        messages.add(request, kind="warning", msg="Give a tag for the action.", msg_id="msg-bulk-tag-missing")
+        return HTTPFound(listing_url)
+
+    dbsession = request.dbsession
+
+    # Deleted posts and their tags cannot be looked up afterwards
+    slugs = bulk.get_post_slugs(dbsession, ids)
+    tags = bulk.get_post_tags(dbsession, ids)
+    if tag:
+        tags.add(tag)
+
+    count = func(dbsession, ids, tag)
+    notify_posts_changed(request, post_ids=ids, tags=tags, slugs=slugs)
+    messages.add(request, kind="info", msg=msg.format(count), msg_id="msg-bulk-done")
+    return HTTPFound(listing_url)
+
+
 def tag_navigate_url_getter(request, resource):
     # TODO: move all strings to ENUMs
     return request.route_url("blog_tag", tag=resource.obj.title)
 
 
-@view_overrides(context=TagAdmin)
+@view_overrides(context=TagAdmin, renderer="admin/tag_listing.html")
 class TagListing(DefaultListing):
-    """Show blog tags."""
+    """Show blog tags with their post counts."""
 
     table = listing.Table(
         columns=[
+            SelectColumn(form_id="tag-actions"),
             listing.Column("title", "Title", navigate_url_getter=tag_navigate_url_getter),
+            listing.Column("post_count", "Posts", getter=lambda view, column, tag: view.post_counts.get(tag.id, (0, 0))[0]),
+            listing.Column("published_count", "Published", getter=lambda view, column, tag: view.post_counts.get(tag.id, (0, 0))[1]),
             listing.ControlsColumn(name="Admin Actions"),
         ]
     )
+
+    def order_query(self, query):
+        return query.order_by(Tag.title)
+
+    @reify
+    def post_counts(self) -> dict:
+        """Post counts of all tags, loaded with one query when the first count is rendered."""
+        return bulk.get_tag_post_counts(self.request.dbsession)
+
+
+@view_config(context=TagAdmin, name="bulk_action", route_name="admin", request_method="POST", permission="edit")
+def tag_bulk_action(context: TagAdmin, request: Request):
+    """Merge, rename or delete tags selected on the listing."""
+    listing_url = request.resource_url(context, "listing")
+    dbsession = request.dbsession
+    action = request.POST.get("action")
+    title = request.POST.get("title", "").strip()
+    ids = get_selected_ids(request)
+
+    if action == "delete_orphans":
+        tags = bulk.delete_orphan_tags(dbsession)
+        notify_posts_changed(request, tags=tags)
+        messages.add(request, kind="info", msg="Deleted {} unused tags.".format(len(tags)), msg_id="msg-bulk-done")
+        return HTTPFound(listing_url)
+
+    if not ids or action not in ("merge", "rename", "delete"):
+        messages.add(request, kind="warning", msg="Select tags and an action.", msg_id="msg-bulk-nothing-selected")
+        return HTTPFound(listing_url)
+
+    if action in ("merge", "rename") and not title:
+        messages.add(request, kind="warning", msg="Give the new tag title.", msg_id="msg-bulk-tag-missing")
+        return HTTPFound(listing_url)
+
+    if action == "rename" and len(ids) != 1:
+        messages.add(request, kind="warning", msg="Select exactly one tag to rename.", msg_id="msg-bulk-rename-one")
+        return HTTPFound(listing_url)
+
+    tags = bulk.get_tag_titles(dbsession, ids)
+
+    if action == "merge":
+        bulk.merge_tags(dbsession, ids, title)
+        msg = "Merged {} tags to {}.".format(len(tags), title)
+    elif action == "rename":
+        bulk.rename_tag(dbsession, ids[0], title)
+        msg = "Renamed tag to {}.".format(title)
+    else:
+        bulk.delete_tags(dbsession, ids)
+        msg = "Deleted {} tags.".format(len(tags))
+
+    if title:
+        tags.add(title)
+
+    notify_posts_changed(request, tags=tags)
+    messages.add(request, kind="info", msg=msg, msg_id="msg-bulk-done")
+    return HTTPFound(listing_url)
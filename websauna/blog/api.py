@@ -0,0 +1,244 @@
+"""Read-only JSON API under ``/blog/api/``.
+
+* ``/blog/api/posts`` posts, newest first
+
+* ``/blog/api/posts/{slug}`` one post
+
+* ``/blog/api/tags`` tags with the number of visible posts
+
+* ``/blog/api/tags/{tag}/posts`` posts with a tag
+
+Lists take ``fields`` (comma separated, see :py:data:`LIST_FIELDS`), ``limit`` (default 20, at most 100) and ``cursor``, the ``next`` value of the previous page. Only the columns of the requested fields are selected and rows are serialized from tuples, so a page is one query without loading posts. Paging is keyset based and stays fast deep into the archive.
+
+Posts are filtered with :py:meth:`websauna.blog.views.BlogContainer.filter_visible`, the same rule as in the post ACL: visitors see published posts, admins also drafts. Responses carry an ``ETag`` of their content and the usual :py:func:`cache headers <websauna.blog.httpcaching.cache_headers>`.
+"""
+
+# Standard Library
+import base64
+import binascii
+import datetime
+import json
+import re
+import typing as t
+import uuid
+from collections import OrderedDict
+from urllib.parse import quote
+
+# Pyramid
+from pyramid.httpexceptions import HTTPBadRequest
+from pyramid.httpexceptions import HTTPMovedPermanently
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.httpexceptions import HTTPNotModified
+from pyramid.response import Response
+from pyramid.view import view_config
+
+# SQLAlchemy
+import sqlalchemy as sa
+import sqlalchemy.dialects.postgresql as psql
+
+# Websauna
+from websauna.system.http import Request
+
+from .httpcaching import Validator
+from .httpcaching import cache_headers
+from .httpcaching import make_etag
+from .models import AssociationPostsTags
+from .models import Post
+from .models import Tag
+from .permissions import has_permission
+from .replica import get_read_dbsession
+from .views import BlogContainer
+from .views import MovedPostResource
+from .views import PostResource
+
+
+DEFAULT_LIMIT = 20
+
+MAX_LIMIT = 100
+
+UTC_OFFSET = re.compile(r"([+-]\d\d):(\d\d)$")
+
+#: Fields of posts in lists, name to column expression
+LIST_FIELDS = OrderedDict([
+    ("id", Post.id),
+    ("slug", Post.slug),
+    ("title", Post.title),
+    ("author", Post.author),
+    ("excerpt", sa.func.coalesce(sa.func.nullif(Post.excerpt, ""), Post.derived["excerpt"].astext)),
+    ("published_at", Post.published_at),
+    ("created_at", Post.created_at),
+    ("updated_at", Post.updated_at),
+    ("reading_time", Post.derived["reading_time"].astext.cast(sa.Integer)),
+    ("tags", sa.select([sa.func.array_agg(psql.aggregate_order_by(Tag.title, Tag.title))]).select_from(AssociationPostsTags.__table__.join(Tag.__table__)).where(AssociationPostsTags.post_id == Post.id).as_scalar()),
+])
+
+#: Extra fields of a single post
+POST_FIELDS = OrderedDict([
+    ("body", Post.body),
+])
+
+#: Fields computed from other fields or outside the query
+VIRTUAL_FIELDS = {"url", "body_html"}
+
+DEFAULT_LIST_FIELDS = ["id", "slug", "title", "author", "excerpt", "published_at", "tags", "url"]
+
+DEFAULT_POST_FIELDS = DEFAULT_LIST_FIELDS + ["updated_at", "reading_time", "body_html"]
+
+
+def to_json(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError("Cannot serialize {!r}".format(value))
+
+
+def json_response(request: Request, data) -> Response:
+    """JSON response with an ETag of the content, ``304 Not Modified`` if the client has it already."""
+    body = json.dumps(data, default=to_json).encode("utf-8")
+    validator = Validator(make_etag(body), None)
+    response = HTTPNotModified() if validator.matches(request) else Response(body=body, content_type="application/json", charset="utf-8")
+    validator.apply(response)
+    return response
+
+
+def bad_request(message: str) -> HTTPBadRequest:
+    return HTTPBadRequest(json_body={"error": message})
+
+
+def get_fields(request: Request, available: t.Iterable[str], default: t.List[str]) -> t.List[str]:
+    """Fields asked with ``fields`` parameter."""
+    fields = request.GET.get("fields")
+    if not fields:
+        return default
+
+    fields = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise bad_request("Unknown fields: {}".format(", ".join(unknown)))
+    return fields
+
+
+def get_limit(request: Request) -> int:
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise bad_request("Bad limit")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def encode_cursor(sort_value: datetime.datetime, post_id: uuid.UUID) -> str:
+    data = json.dumps([sort_value.isoformat(), str(post_id)])
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> t.Tuple[datetime.datetime, uuid.UUID]:
+    try:
+        sort_value, post_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        # Parse isoformat() output, strptime of older Pythons does not take a colon in the offset
+        sort_value = UTC_OFFSET.sub(r"\1\2", sort_value)
+        timestamp = datetime.datetime.strptime(sort_value, "%Y-%m-%dT%H:%M:%S.%f%z" if "." in sort_value else "%Y-%m-%dT%H:%M:%S%z")
+        return timestamp, uuid.UUID(post_id)
+    except (ValueError, TypeError, UnicodeError, binascii.Error):
+        raise bad_request("Bad cursor")
+
+
+def get_post_url(blog_container: BlogContainer, slug: str) -> str:
+    return "{}{}/".format(blog_container.request.resource_url(blog_container), quote(slug))
+
+
+def serialize_rows(blog_container: BlogContainer, rows, fields: t.List[str]) -> t.List[dict]:
+    items = []
+    for row in rows:
+        values = row._asdict()
+        item = OrderedDict()
+        for field in fields:
+            if field == "url":
+                item[field] = get_post_url(blog_container, values["slug"])
+            elif field == "tags":
+                item[field] = values[field] or []
+            else:
+                item[field] = values[field]
+        items.append(item)
+    return items
+
+
+def list_posts(blog_container: BlogContainer, request: Request, tag: t.Optional[str] = None) -> dict:
+    """One page of posts as a dict with ``items`` and ``next`` cursor."""
+    fields = get_fields(request, list(LIST_FIELDS) + ["url"], DEFAULT_LIST_FIELDS)
+    limit = get_limit(request)
+
+    # Visitors only see published posts, admins order drafts by their creation
+    sort_column = sa.func.coalesce(Post.published_at, Post.created_at) if blog_container.can_view_drafts else Post.published_at
+
+    selected = set(fields) | ({"slug"} if "url" in fields else set())
+    columns = [column.label(name) for name, column in LIST_FIELDS.items() if name in selected]
+    columns += [sort_column.label("_sort"), Post.id.label("_id")]
+
+    q = blog_container.filter_visible(get_read_dbsession(request).query(*columns))
+    if tag:
+        q = q.filter(Post.tags.any(Tag.title == tag))
+
+    cursor = request.GET.get("cursor")
+    if cursor:
+        sort_value, post_id = decode_cursor(cursor)
+        q = q.filter(sa.tuple_(sort_column, Post.id) < sa.tuple_(sort_value, post_id))
+
+    rows = q.order_by(sort_column.desc(), Post.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]._sort, rows[limit - 1]._id) if len(rows) > limit else None
+
+    return {"items": serialize_rows(blog_container, rows[:limit], fields), "next": next_cursor}
+
+
+@view_config(route_name="blog_api_posts", request_method="GET", decorator=cache_headers)
+def api_posts(blog_container: BlogContainer, request: Request):
+    """List posts."""
+    return json_response(request, list_posts(blog_container, request))
+
+
+@view_config(route_name="blog_api_tag_posts", request_method="GET", decorator=cache_headers)
+def api_tag_posts(blog_container: BlogContainer, request: Request):
+    """List posts with a tag."""
+    return json_response(request, list_posts(blog_container, request, tag=request.matchdict["tag"]))
+
+
+@view_config(route_name="blog_api_post", request_method="GET", decorator=cache_headers)
+def api_post(blog_container: BlogContainer, request: Request):
+    """Show one post. Former slugs redirect to the current one."""
+    fields = get_fields(request, list(LIST_FIELDS) + list(POST_FIELDS) + list(VIRTUAL_FIELDS), DEFAULT_POST_FIELDS)
+    slug = request.matchdict["slug"]
+
+    try:
+        resource = blog_container[slug]
+    except KeyError:
+        raise HTTPNotFound(json_body={"error": "No such post"})
+
+    if isinstance(resource, MovedPostResource):
+        target = resource.get_target()
+        if target is None:
+            raise HTTPNotFound(json_body={"error": "No such post"})
+        return HTTPMovedPermanently(location=request.route_url("blog_api_post", slug=target.__name__, _query=request.GET))
+
+    if not isinstance(resource, PostResource) or not has_permission(request, "view", resource):
+        raise HTTPNotFound(json_body={"error": "No such post"})
+
+    all_fields = OrderedDict(list(LIST_FIELDS.items()) + list(POST_FIELDS.items()))
+    selected = set(fields) | {"slug"}
+    columns = [column.label(name) for name, column in all_fields.items() if name in selected]
+    row = get_read_dbsession(request).query(*columns).filter(Post.id == resource.summary.id).one()
+
+    item = serialize_rows(blog_container, [row], [field for field in fields if field != "body_html"])[0]
+    if "body_html" in fields:
+        item["body_html"] = resource.get_body_as_html()
+
+    return json_response(request, item)
+
+
+@view_config(route_name="blog_api_tags", request_method="GET", decorator=cache_headers)
+def api_tags(blog_container: BlogContainer, request: Request):
+    """List tags with visible posts and their post counts."""
+    q = get_read_dbsession(request).query(Tag.title, sa.func.count(Post.id)).join(AssociationPostsTags, AssociationPostsTags.tag_id == Tag.id).join(Post, Post.id == AssociationPostsTags.post_id)
+    q = blog_container.filter_visible(q).group_by(Tag.title).order_by(Tag.title)
+
+    items = [OrderedDict([("title", title), ("posts", count), ("url", request.route_url("blog_api_tag_posts", tag=title))]) for title, count in q]
+    return json_response(request, {"items": items})
@@ -0,0 +1,152 @@
+"""Set based operations on many posts and tags at once.
+
+Each operation is a single SQL statement regardless of how many rows it touches. ORM objects already loaded in the session are not refreshed.
+"""
+
+# Standard Library
+import typing as t
+import uuid
+
+# SQLAlchemy
+import sqlalchemy as sa
+import sqlalchemy.dialects.postgresql as psql
+from sqlalchemy.orm import Session
+
+# Websauna
+from websauna.utils.time import now
+
+from .models import AssociationPostsTags
+from .models import Post
+from .models import Tag
+
+
+def upsert_tags(dbsession: Session, titles: t.Iterable[str]) -> t.Dict[str, uuid.UUID]:
+    """Make sure tags exist.
+
+    :return: Map of tag title to tag id
+    """
+    titles = set(titles)
+    if not titles:
+        return {}
+
+    stmt = psql.insert(Tag.__table__).values([{"title": title} for title in titles]).on_conflict_do_nothing(index_elements=["title"])
+    dbsession.execute(stmt)
+    return dict(dbsession.query(Tag.title, Tag.id).filter(Tag.title.in_(titles)))
+
+
+def get_post_slugs(dbsession: Session, post_ids: t.List[uuid.UUID]) -> t.Set[str]:
+    return {slug for slug, in dbsession.query(Post.slug).filter(Post.id.in_(post_ids))}
+
+
+def get_post_tags(dbsession: Session, post_ids: t.List[uuid.UUID]) -> t.Set[str]:
+    """Titles of all tags used by any of the posts."""
+    q = dbsession.query(Tag.title).join(AssociationPostsTags, AssociationPostsTags.tag_id == Tag.id).filter(AssociationPostsTags.post_id.in_(post_ids)).distinct()
+    return {title for title, in q}
+
+
+def publish_posts(dbsession: Session, post_ids: t.List[uuid.UUID]) -> int:
+    """Publish drafts and scheduled posts now. Already published posts keep their publishing time.
+
+    :return: Number of published posts
+    """
+    timestamp = now()
+    return dbsession.query(Post).filter(Post.id.in_(post_ids), sa.not_(Post.published_clause(timestamp))).update({"published_at": timestamp, "updated_at": timestamp}, synchronize_session=False)
+
+
+def unpublish_posts(dbsession: Session, post_ids: t.List[uuid.UUID]) -> int:
+    """Turn published posts back to drafts. Scheduled posts stay scheduled.
+
+    :return: Number of retracted posts
+    """
+    timestamp = now()
+    return dbsession.query(Post).filter(Post.id.in_(post_ids), Post.published_clause(timestamp)).update({"published_at": None, "updated_at": timestamp}, synchronize_session=False)
+
+
+def add_tag(dbsession: Session, post_ids: t.List[uuid.UUID], title: str) -> int:
+    """Tag posts, creating the tag if needed.
+
+    :return: Number of posts which did not have the tag before
+    """
+    tag_id = upsert_tags(dbsession, [title])[title]
+    select = sa.select([Post.id, sa.literal(tag_id, type_=psql.UUID(as_uuid=True))]).where(Post.id.in_(post_ids))
+    stmt = psql.insert(AssociationPostsTags.__table__).from_select(["post_id", "tag_id"], select).on_conflict_do_nothing()
+    return dbsession.execute(stmt).rowcount
+
+
+def remove_tag(dbsession: Session, post_ids: t.List[uuid.UUID], title: str) -> int:
+    """Untag posts.
+
+    :return: Number of posts which had the tag
+    """
+    tag_ids = dbsession.query(Tag.id).filter(Tag.title == title).subquery()
+    return dbsession.query(AssociationPostsTags).filter(AssociationPostsTags.post_id.in_(post_ids), AssociationPostsTags.tag_id.in_(tag_ids)).delete(synchronize_session=False)
+
+
+def delete_posts(dbsession: Session, post_ids: t.List[uuid.UUID]) -> int:
+    """Delete posts with their tag associations. Revisions are deleted by the database.
+
+    :return: Number of deleted posts
+    """
+    dbsession.query(AssociationPostsTags).filter(AssociationPostsTags.post_id.in_(post_ids)).delete(synchronize_session=False)
+    return dbsession.query(Post).filter(Post.id.in_(post_ids)).delete(synchronize_session=False)
+
+
+def get_tag_post_counts(dbsession: Session) -> t.Dict[uuid.UUID, t.Tuple[int, int]]:
+    """Count posts of every tag with one aggregate query.
+
+    :return: Map of tag id to (all posts, published posts). Scheduled posts are not published yet.
+    """
+    q = dbsession.query(AssociationPostsTags.tag_id, sa.func.count(), sa.func.count().filter(Post.published_clause(now()))).join(Post, Post.id == AssociationPostsTags.post_id).group_by(AssociationPostsTags.tag_id)
+    return {tag_id: (total, published) for tag_id, total, published in q}
+
+
+def get_tag_titles(dbsession: Session, tag_ids: t.List[uuid.UUID]) -> t.Set[str]:
+    return {title for title, in dbsession.query(Tag.title).filter(Tag.id.in_(tag_ids))}
+
+
+def merge_tags(dbsession: Session, tag_ids: t.List[uuid.UUID], title: str) -> uuid.UUID:
+    """Move posts of tags to one tag and delete the merged tags.
+
+    :param title: Title of the tag to merge to. Created if it does not exist.
+    :return: Id of the tag merged to
+    """
+    target_id = upsert_tags(dbsession, [title])[title]
+    source_ids = [tag_id for tag_id in tag_ids if tag_id != target_id]
+    if not source_ids:
+        return target_id
+
+    select = sa.select([AssociationPostsTags.post_id, sa.literal(target_id, type_=psql.UUID(as_uuid=True))]).where(AssociationPostsTags.tag_id.in_(source_ids)).distinct()
+    dbsession.execute(psql.insert(AssociationPostsTags.__table__).from_select(["post_id", "tag_id"], select).on_conflict_do_nothing())
+    delete_tags(dbsession, source_ids)
+    return target_id
+
+
+def rename_tag(dbsession: Session, tag_id: uuid.UUID, title: str) -> uuid.UUID:
+    """Rename a tag. If there already is a tag with the new title, the tags are merged.
+
+    :return: Id of the renamed tag
+    """
+    if dbsession.query(Tag.id).filter(Tag.title == title, Tag.id != tag_id).first():
+        return merge_tags(dbsession, [tag_id], title)
+
+    dbsession.query(Tag).filter(Tag.id == tag_id).update({"title": title}, synchronize_session=False)
+    return tag_id
+
+
+def delete_tags(dbsession: Session, tag_ids: t.List[uuid.UUID]) -> int:
+    """Delete tags and untag their posts.
+
+    :return: Number of deleted tags
+    """
+    dbsession.query(AssociationPostsTags).filter(AssociationPostsTags.tag_id.in_(tag_ids)).delete(synchronize_session=False)
+    return dbsession.query(Tag).filter(Tag.id.in_(tag_ids)).delete(synchronize_session=False)
+
+
+def delete_orphan_tags(dbsession: Session) -> t.Set[str]:
+    """Delete tags which are not used by any post.
+
+    :return: Titles of deleted tags
+    """
+    used = sa.exists().where(AssociationPostsTags.tag_id == Tag.id)
+    stmt = Tag.__table__.delete().where(~used).returning(Tag.__table__.c.title)
+    return {title for title, in dbsession.execute(stmt)}
@@ -0,0 +1,283 @@
+"""Invalidation bus broadcasting content changes to all worker processes.
+
+A :py:class:`~websauna.blog.events.PostsChanged` event fires only in the process which made the change. Caches in the memory of other workers, on this node or others, would serve stale posts, rolls and slugs until they expire. With ``blog.invalidation_bus`` set, every committed change is published to all processes, which fire it locally as a ``remote`` event, dropping their matching cache entries.
+
+Backends:
+
+* ``off`` (default)
+
+* ``redis`` Redis pub/sub in the Redis configured for the site
+
+* ``postgres`` PostgreSQL ``LISTEN/NOTIFY`` in the site database, no extra services needed
+
+The channel is set with ``blog.invalidation_bus.channel`` (default ``blog_invalidate``). Each process listens in a background thread started on its first request, so it runs in the forked web server worker. When the connection breaks, the listener reconnects and clears the local memory cache, as messages may have been lost meanwhile.
+"""
+
+# Standard Library
+import json
+import logging
+import os
+import re
+import select
+import threading
+import typing as t
+import uuid
+
+# Pyramid
+from pyramid.events import NewRequest
+from pyramid.registry import Registry
+from zope.interface import implementer
+
+# SQLAlchemy
+import sqlalchemy as sa
+
+# Websauna
+from websauna.system.core.redis import get_redis
+from websauna.system.model.meta import get_default_engine
+
+from .cache import MemoryCache
+from .cache import get_cache
+from .events import PostsChanged
+from .interfaces import IInvalidationBus
+from .warmup import is_warmup_request
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Largest message in bytes, PostgreSQL limits notification payloads to 8000 bytes
+MAX_MESSAGE_SIZE = 7000
+
+CHANNEL_NAME = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+_origin = None
+
+
+def get_origin() -> str:
+    """Id of this process, telling apart own messages.
+
+    Generated per process id, as workers forked from a preloaded application share module state.
+    """
+    global _origin
+    pid = os.getpid()
+    if _origin is None or _origin[0] != pid:
+        _origin = (pid, "{}-{}".format(pid, uuid.uuid4().hex))
+    return _origin[1]
+
+
+def encode_messages(event: PostsChanged) -> t.List[str]:
+    """Serialize an event to one or more JSON messages within :py:data:`MAX_MESSAGE_SIZE`."""
+    items = [("post_ids", str(post_id)) for post_id in sorted(event.post_ids, key=str)]
+    items += [("tags", title) for title in sorted(event.tags)]
+    items += [("slugs", slug) for slug in sorted(event.slugs)]
+
+    def new_message():
+        return {"origin": get_origin(), "post_ids": [], "tags": [], "slugs": []}
+
+    messages = []
+    message = new_message()
+    size = len(json.dumps(message))
+    for field, value in items:
+        item_size = len(json.dumps(value)) + 2
+        if size + item_size > MAX_MESSAGE_SIZE and size > len(json.dumps(new_message())):
+            messages.append(json.dumps(message))
+            message = new_message()
+            size = len(json.dumps(message))
+        message[field].append(value)
+        size += item_size
+
+    messages.append(json.dumps(message))
+    return messages
+
+
+def decode_event(registry: Registry, message: str) -> t.Optional[PostsChanged]:
+    """Turn a message to a remote event, ``None`` for messages sent by this process."""
+    data = json.loads(message)
+    if data["origin"] == get_origin():
+        return None
+    return PostsChanged(registry, post_ids=[uuid.UUID(post_id) for post_id in data["post_ids"]], tags=data["tags"], slugs=data["slugs"], remote=True)
+
+
+def receive(registry: Registry, message: t.Optional[str]):
+    """Fire a received change in this process."""
+    if message is None:
+        # Changes may have been missed, start over
+        cache = get_cache(registry)
+        if isinstance(cache, MemoryCache):
+            cache.clear()
+        return
+
+    try:
+        event = decode_event(registry, message)
+    except (ValueError, KeyError) as e:
+        logger.error("Bad invalidation message %r: %s", message, e)
+        return
+
+    if event is None:
+        return
+
+    try:
+        registry.notify(event)
+    except Exception as e:
+        # Keep listening
+        logger.exception(e)
+        logger.error("Could not handle %r", event)
+
+
+class InvalidationBus:
+    """Base class for buses listening in a reconnecting background thread."""
+
+    #: Seconds between reconnect attempts
+    reconnect_delay = 5.0
+
+    #: Seconds between checks whether the bus was closed
+    poll_interval = 1.0
+
+    def __init__(self, registry: Registry, channel: str = "blog_invalidate"):
+        self.registry = registry
+        self.channel = channel
+        self.listener = None
+        self.listener_lock = threading.Lock()
+        self.closed = threading.Event()
+
+    def publish(self, messages: t.List[str]):
+        raise NotImplementedError()
+
+    def listen(self, callback: t.Callable[[t.Optional[str]], None], subscribed: t.Callable[[], None]):
+        """Subscribe and pass messages to ``callback`` until closed. Call ``subscribed`` once subscribed."""
+        raise NotImplementedError()
+
+    def ensure_listener(self, callback: t.Callable[[t.Optional[str]], None]):
+        if self.listener and self.listener.is_alive():
+            return
+
+        with self.listener_lock:
+            if self.listener and self.listener.is_alive():
+                return
+            self.closed.clear()
+            self.listener = threading.Thread(target=self.run_listener, args=(callback,), name="blog-invalidation-bus", daemon=True)
+            self.listener.start()
+
+    def run_listener(self, callback: t.Callable[[t.Optional[str]], None]):
+        connected_before = False
+
+        def subscribed():
+            nonlocal connected_before
+            if connected_before:
+                callback(None)
+            connected_before = True
+
+        while not self.closed.is_set():
+            try:
+                self.listen(callback, subscribed)
+            except Exception as e:
+                logger.exception(e)
+                logger.error("Invalidation bus listener failed, reconnecting in %s seconds", self.reconnect_delay)
+                self.closed.wait(self.reconnect_delay)
+
+    def close(self):
+        """Stop listening."""
+        self.closed.set()
+        if self.listener:
+            self.listener.join()
+
+
+@implementer(IInvalidationBus)
+class RedisBus(InvalidationBus):
+    """Redis pub/sub bus."""
+
+    def publish(self, messages: t.List[str]):
+        redis = get_redis(self.registry)
+        for message in messages:
+            redis.publish(self.channel, message)
+
+    def listen(self, callback: t.Callable[[t.Optional[str]], None], subscribed: t.Callable[[], None]):
+        pubsub = get_redis(self.registry).pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self.channel)
+            subscribed()
+            while not self.closed.is_set():
+                message = pubsub.get_message(timeout=self.poll_interval)
+                if message and message["type"] == "message":
+                    callback(message["data"].decode("utf-8"))
+        finally:
+            pubsub.close()
+
+
+@implementer(IInvalidationBus)
+class PostgresBus(InvalidationBus):
+    """PostgreSQL ``LISTEN/NOTIFY`` bus."""
+
+    def publish(self, messages: t.List[str]):
+        engine = get_default_engine(self.registry)
+        with engine.connect() as connection:
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+            for message in messages:
+                connection.execute(sa.text("SELECT pg_notify(:channel, :payload)"), channel=self.channel, payload=message)
+
+    def listen(self, callback: t.Callable[[t.Optional[str]], None], subscribed: t.Callable[[], None]):
+        connection = get_default_engine(self.registry).raw_connection()
+        # Keep the listening connection out of the pool for good
+        connection.detach()
+        try:
+            dbapi_connection = connection.connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute('LISTEN "{}"'.format(self.channel))
+            subscribed()
+
+            while not self.closed.is_set():
+                if select.select([dbapi_connection], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    callback(dbapi_connection.notifies.pop(0).payload)
+        finally:
+            connection.close()
+
+
+def create_bus(registry: Registry) -> t.Optional[IInvalidationBus]:
+    """Create an invalidation bus based on ``blog.invalidation_bus`` setting."""
+    settings = registry.settings
+    backend = settings.get("blog.invalidation_bus", "off").strip()
+    channel = settings.get("blog.invalidation_bus.channel", "blog_invalidate").strip()
+
+    if not CHANNEL_NAME.match(channel):
+        raise RuntimeError("Bad blog.invalidation_bus.channel: {}".format(channel))
+
+    if backend == "redis":
+        return RedisBus(registry, channel)
+    elif backend == "postgres":
+        return PostgresBus(registry, channel)
+    elif backend == "off":
+        return None
+
+    raise RuntimeError("Unknown blog.invalidation_bus backend: {}".format(backend))
+
+
+def publish_changed(event: PostsChanged):
+    """Broadcast a change made in this process."""
+    bus = event.registry.queryUtility(IInvalidationBus)
+    if bus is None or event.remote:
+        return
+
+    try:
+        bus.publish(encode_messages(event))
+    except Exception as e:
+        # Other subscribers of the event must still run
+        logger.exception(e)
+        logger.error("Could not publish %r to the invalidation bus", event)
+
+
+def start_listener(event: NewRequest):
+    """Listen to the bus in this worker process.
+
+    Warm-up requests run before web servers fork their workers, a listener thread started there would not survive the fork.
+    """
+    if is_warmup_request(event.request):
+        return
+
+    registry = event.request.registry
+    bus = registry.queryUtility(IInvalidationBus)
+    if bus is not None:
+        bus.ensure_listener(lambda message: receive(registry, message))
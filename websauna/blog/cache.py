@@ -0,0 +1,202 @@
+"""Cache backends for rendered blog content.
+
+The backend is chosen with ``blog.cache`` setting:
+
+* ``off`` (default) no caching
+
+* ``memory`` LRU cache in the memory of each worker process, bounded by ``blog.cache.max_entries``
+
+* ``redis`` shared cache in the Redis configured for the site
+
+Each entry can carry tags. Cached content is tagged with :py:func:`post_key` of every post it shows, :py:func:`tag_key` of every tag it shows and :py:data:`ROLL_KEY` if it lists posts, so a :py:class:`websauna.blog.events.PostsChanged` event drops exactly the stale entries. The same keys are sent to caching proxies as surrogate keys, so they contain no spaces.
+"""
+
+# Standard Library
+import logging
+import pickle
+import threading
+import time
+import typing as t
+import uuid
+from collections import OrderedDict
+from urllib.parse import quote
+
+# Pyramid
+from pyramid.registry import Registry
+from zope.interface import implementer
+
+# Websauna
+from websauna.system.core.redis import get_redis
+
+from .events import PostsChanged
+from .interfaces import IBlogCache
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Tag of everything listing posts: blog roll, tag rolls and the feed
+ROLL_KEY = "roll"
+
+
+def post_key(post_id: uuid.UUID) -> str:
+    """Tag of everything showing a post."""
+    return "post-{}".format(post_id)
+
+
+def tag_key(title: str) -> str:
+    """Tag of everything showing a tag. The title is percent-encoded, so distinct tags never share a key."""
+    return "tag-{}".format(quote(title, safe=""))
+
+
+def get_changed_keys(event: PostsChanged) -> t.List[str]:
+    """Keys of content made stale by a change. Every change affects the rolls."""
+    keys = [ROLL_KEY]
+    keys += [post_key(post_id) for post_id in sorted(event.post_ids, key=str)]
+    keys += sorted({tag_key(title) for title in event.tags})
+    return keys
+
+
+@implementer(IBlogCache)
+class MemoryCache:
+    """Per process LRU cache.
+
+    Values are stored as is, callers must not modify what they get.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+
+        #: key -> (expires at, value, tags), least recently used first
+        self.entries = OrderedDict()
+
+        #: tag -> set of keys
+        self.tags = {}
+
+        self.lock = threading.Lock()
+
+    def _remove(self, key: str):
+        expires_at, value, tags = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            if entry[0] <= time.time():
+                self._remove(key)
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value, ttl: float, tags: t.Iterable[str] = ()):
+        tags = tuple(tags)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+            self.entries[key] = (time.time() + ttl, value, tags)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def delete(self, key: str):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def invalidate_tags(self, tags: t.Iterable[str]):
+        with self.lock:
+            for tag in tags:
+                for key in self.tags.pop(tag, ()):
+                    if key in self.entries:
+                        self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+
+
+@implementer(IBlogCache)
+class RedisCache:
+    """Cache shared by all processes in Redis.
+
+    Values are pickled. Tags are Redis sets of the keys stored with the tag.
+    """
+
+    #: Tag sets outlive the entries in them at least this long, seconds
+    tag_ttl = 7 * 24 * 3600
+
+    def __init__(self, redis, prefix: str = "blog:cache:"):
+        self.redis = redis
+        self.prefix = prefix
+        self.tag_prefix = prefix.rstrip(":") + "-tag:"
+
+    def get(self, key: str):
+        data = self.redis.get(self.prefix + key)
+        if data is None:
+            return None
+        return pickle.loads(data)
+
+    def set(self, key: str, value, ttl: float, tags: t.Iterable[str] = ()):
+        ttl = max(1, int(ttl))
+        pipe = self.redis.pipeline()
+        pipe.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=ttl)
+        for tag in tags:
+            pipe.sadd(self.tag_prefix + tag, key)
+            pipe.expire(self.tag_prefix + tag, max(ttl, self.tag_ttl))
+        pipe.execute()
+
+    def delete(self, key: str):
+        self.redis.delete(self.prefix + key)
+
+    def invalidate_tags(self, tags: t.Iterable[str]):
+        tag_names = [self.tag_prefix + tag for tag in tags]
+        if not tag_names:
+            return
+
+        pipe = self.redis.pipeline()
+        for name in tag_names:
+            pipe.smembers(name)
+        keys = set()
+        for members in pipe.execute():
+            keys.update(members)
+
+        names = [self.prefix + (key.decode("utf-8") if isinstance(key, bytes) else key) for key in keys]
+        self.redis.delete(*(names + tag_names))
+
+    def clear(self):
+        for pattern in (self.prefix + "*", self.tag_prefix + "*"):
+            for name in self.redis.scan_iter(match=pattern):
+                self.redis.delete(name)
+
+
+def create_cache(registry: Registry) -> t.Optional[IBlogCache]:
+    """Create the cache backend configured in the settings."""
+    settings = registry.settings
+    backend = settings.get("blog.cache", "off")
+
+    if backend == "memory":
+        return MemoryCache(max_entries=int(settings.get("blog.cache.max_entries", 1000)))
+    elif backend == "redis":
+        return RedisCache(get_redis(registry))
+    elif backend == "off":
+        return None
+
+    raise RuntimeError("Unknown blog.cache backend: {}".format(backend))
+
+
+def get_cache(registry: Registry) -> t.Optional[IBlogCache]:
+    """Get the configured cache or ``None`` if caching is off."""
+    return registry.queryUtility(IBlogCache)
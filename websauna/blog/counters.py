@@ -0,0 +1,231 @@
+"""Write-behind view counters for blog posts.
+
+Incrementing ``Post.view_count`` with an ``UPDATE`` per page view would make concurrent requests queue on the row lock of a popular post. Instead views are aggregated in the worker memory or in Redis and written to the database as one batched ``UPDATE ... FROM (VALUES ...)`` statement every ``blog.view_counter.flush_interval`` seconds. A crashing worker loses at most the views of one flush window.
+
+Only page views rendered by the application are counted. Pages served by a caching proxy under ``blog.http_cache.s_maxage``, or answered by browsers from their cache under ``max_age``, never reach the application and are not counted; use the proxy logs for those. Pages served from the application's own page cache are counted.
+"""
+
+# Standard Library
+import atexit
+import functools
+import logging
+import threading
+import time
+import typing as t
+import uuid
+from collections import Counter
+
+# Pyramid
+import transaction
+from pyramid.registry import Registry
+from zope.interface import implementer
+
+# SQLAlchemy
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+# Websauna
+from websauna.system.core.redis import get_redis
+from websauna.system.model.meta import create_dbsession
+
+from .interfaces import IViewCounter
+from .models import Post
+from .warmup import is_warmup_request
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Read and delete the pending counts atomically
+DRAIN_SCRIPT = """
+local counts = redis.call("HGETALL", KEYS[1])
+redis.call("DEL", KEYS[1])
+return counts
+"""
+
+
+def build_flush_statement(deltas: t.Dict[uuid.UUID, int]) -> sa.sql.expression.TextClause:
+    """Build one ``UPDATE`` statement adding ``deltas`` to the view counts of posts.
+
+    Rows are listed in post id order, so that concurrent flushes from several workers lock the rows in the same order and cannot deadlock.
+
+    The statement does not touch ``updated_at``, views are not edits.
+    """
+    values = []
+    params = {}
+    for idx, (post_id, delta) in enumerate(sorted(deltas.items(), key=lambda item: str(item[0]))):
+        values.append("(CAST(:id_{idx} AS uuid), :delta_{idx})".format(idx=idx))
+        params["id_{}".format(idx)] = str(post_id)
+        params["delta_{}".format(idx)] = int(delta)
+
+    sql = (
+        "UPDATE {table} SET view_count = {table}.view_count + v.delta "
+        "FROM (VALUES {values}) AS v(id, delta) "
+        "WHERE {table}.id = v.id"
+    ).format(table=Post.__tablename__, values=", ".join(values))
+
+    return sa.text(sql).bindparams(**params)
+
+
+class ViewCounter:
+    """Base class for counters flushed by a background thread."""
+
+    def __init__(self, registry: Registry, flush_interval: float = 30.0):
+        self.registry = registry
+        self.flush_interval = flush_interval
+        self.flusher = None
+        self.flusher_lock = threading.Lock()
+        self.atexit_registered = False
+
+    def increment(self, post_id: uuid.UUID):
+        raise NotImplementedError()
+
+    def drain(self) -> t.Dict[uuid.UUID, int]:
+        """Take out all pending counts."""
+        raise NotImplementedError()
+
+    def restore(self, deltas: t.Dict[uuid.UUID, int]):
+        """Put back counts that could not be written."""
+        raise NotImplementedError()
+
+    def flush(self, dbsession: Session) -> int:
+        deltas = self.drain()
+        if deltas:
+            dbsession.execute(build_flush_statement(deltas))
+        return len(deltas)
+
+    def flush_now(self):
+        """Write pending counts in a transaction of their own."""
+        deltas = self.drain()
+        if not deltas:
+            return
+
+        tm = transaction.TransactionManager()
+        dbsession = create_dbsession(self.registry, manager=tm)
+        try:
+            with tm:
+                dbsession.execute(build_flush_statement(deltas))
+        except Exception as e:
+            logger.exception(e)
+            logger.error("Could not flush view counts of %d posts, retrying on the next flush", len(deltas))
+            self.restore(deltas)
+        finally:
+            dbsession.close()
+
+    def ensure_flusher(self):
+        """Start the flush thread on the first counted view.
+
+        The thread is started lazily, so that it runs in the forked web server worker and not in the process which loaded the application.
+        """
+        if self.flusher and self.flusher.is_alive():
+            return
+
+        with self.flusher_lock:
+            if self.flusher and self.flusher.is_alive():
+                return
+            self.flusher = threading.Thread(target=self.run_flusher, name="blog-view-counter", daemon=True)
+            self.flusher.start()
+            # A restarted thread must not add another exit handler
+            if not self.atexit_registered:
+                atexit.register(self.flush_now)
+                self.atexit_registered = True
+
+    def run_flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush_now()
+            except Exception as e:
+                # E.g. Redis is down while draining, keep flushing later
+                logger.exception(e)
+                logger.error("View count flush failed, retrying in %s seconds", self.flush_interval)
+
+
+@implementer(IViewCounter)
+class MemoryViewCounter(ViewCounter):
+    """Aggregate views in the memory of the worker process."""
+
+    def __init__(self, registry: Registry, flush_interval: float = 30.0):
+        super(MemoryViewCounter, self).__init__(registry, flush_interval)
+        self.pending = Counter()
+        self.lock = threading.Lock()
+
+    def increment(self, post_id: uuid.UUID):
+        with self.lock:
+            self.pending[post_id] += 1
+        self.ensure_flusher()
+
+    def drain(self) -> t.Dict[uuid.UUID, int]:
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+        return pending
+
+    def restore(self, deltas: t.Dict[uuid.UUID, int]):
+        with self.lock:
+            self.pending.update(deltas)
+
+
+@implementer(IViewCounter)
+class RedisViewCounter(ViewCounter):
+    """Aggregate views in a Redis hash shared by all workers.
+
+    Pending counts survive worker crashes. The hash is read and deleted in one Lua script, so each view is written by exactly one worker and no counts are left behind half drained.
+    """
+
+    key = "blog:view_counts"
+
+    def increment(self, post_id: uuid.UUID):
+        get_redis(self.registry).hincrby(self.key, str(post_id), 1)
+        self.ensure_flusher()
+
+    def drain(self) -> t.Dict[uuid.UUID, int]:
+        values = get_redis(self.registry).eval(DRAIN_SCRIPT, 1, self.key)
+        counts = dict(zip(values[::2], values[1::2]))
+        return {uuid.UUID(post_id.decode("ascii")): int(count) for post_id, count in counts.items()}
+
+    def restore(self, deltas: t.Dict[uuid.UUID, int]):
+        pipe = get_redis(self.registry).pipeline()
+        for post_id, delta in deltas.items():
+            pipe.hincrby(self.key, str(post_id), delta)
+        pipe.execute()
+
+
+def create_view_counter(registry: Registry) -> t.Optional[IViewCounter]:
+    """Create a view counter based on ``blog.view_counter`` setting.
+
+    Possible values are ``memory`` (default), ``redis`` and ``off``.
+    """
+    settings = registry.settings
+    backend = settings.get("blog.view_counter", "memory").strip()
+    flush_interval = float(settings.get("blog.view_counter.flush_interval", 30))
+
+    if backend == "memory":
+        return MemoryViewCounter(registry, flush_interval)
+    elif backend == "redis":
+        return RedisViewCounter(registry, flush_interval)
+    elif backend == "off":
+        return None
+
+    raise RuntimeError("Unknown blog.view_counter backend: {}".format(backend))
+
+
+def count_view(request, post_id: uuid.UUID):
+    """Record a post page view if view counting is enabled."""
+    counter = request.registry.queryUtility(IViewCounter)
+    if counter:
+        counter.increment(post_id)
+
+
+def counted(view):
+    """View decorator counting a view of the post in the context.
+
+    Use as the outermost decorator, so that pages served from the page cache are counted too. :py:mod:`Warm-up <websauna.blog.warmup>` requests are not counted.
+    """
+
+    @functools.wraps(view)
+    def wrapper(context, request):
+        if not is_warmup_request(request):
+            count_view(request, context.summary.id)
+        return view(context, request)
+
+    return wrapper
@@ -0,0 +1,210 @@
+"""Values derived from post bodies, computed after the post is saved.
+
+Rendered HTML, word count, reading time, table of contents, a plain text excerpt and the image for social media cards are computed with the :py:mod:`rendering service <websauna.blog.rendering>` and the :py:mod:`image processor <websauna.blog.images>` in the background when a :py:class:`~websauna.blog.events.PostsChanged` event tells a post was saved, and stored in ``Post.body_html`` and ``Post.derived``. Request handlers read the stored values, or compute them inline if the body has changed since.
+
+How the work is run is set with ``blog.derivatives.runner``:
+
+* ``thread`` (default) a background thread in the web process
+
+* ``celery`` a Celery task, needs Websauna task configuration
+
+* ``inline`` right after the commit in the request, for tests
+
+* ``off`` only compute inline when needed
+
+Stored values fire :py:class:`~websauna.blog.events.PostsChanged` for their posts, so cached pages and feeds made while they were stale are dropped.
+
+A body which could not be rendered, e.g. because rendering timed out, is not stored. The post is rendered inline until it is saved again or the values are filled in with the command below.
+
+Posts saved before derivatives were introduced, or while the runner was ``off``, are filled in with the ``ws-blog-derive`` command.
+"""
+
+# Standard Library
+import hashlib
+import html
+import logging
+import math
+import re
+import threading
+import typing as t
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Pyramid
+import transaction
+from pyramid.registry import Registry
+
+# SQLAlchemy
+from sqlalchemy.orm import Session
+
+# Websauna
+from websauna.system.model.meta import create_dbsession
+
+from .events import PostsChanged
+from .images import get_image_processor
+from .interfaces import IImageProcessor
+from .interfaces import IMarkdownRenderer
+from .models import Post
+from .rendering import get_renderer
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Words read per minute for the reading time
+WORDS_PER_MINUTE = 200
+
+#: Length of the generated excerpt in characters
+EXCERPT_LENGTH = 300
+
+#: Posts updated per transaction
+BATCH_SIZE = 100
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def body_hash(body: str) -> str:
+    return hashlib.sha1((body or "").encode("utf-8")).hexdigest()
+
+
+def html_to_text(body_html: str) -> str:
+    text = re.sub(r"<[^>]+>", " ", body_html)
+    return re.sub(r"\s+", " ", html.unescape(text)).strip()
+
+
+def flatten_toc(tokens: t.List[dict]) -> t.List[dict]:
+    toc = []
+    for token in tokens:
+        toc.append({"level": token["level"], "id": token["id"], "name": token["name"]})
+        toc.extend(flatten_toc(token.get("children", [])))
+    return toc
+
+
+def make_excerpt(body_html: str) -> str:
+    """First paragraph as plain text, shortened at a word boundary."""
+    match = re.search(r"<p>(.*?)</p>", body_html, re.DOTALL)
+    text = html_to_text(match.group(1) if match else body_html)
+    if len(text) <= EXCERPT_LENGTH:
+        return text
+    return text[:EXCERPT_LENGTH].rsplit(" ", 1)[0] + "…"
+
+
+def compute_derivatives(body: str, renderer: t.Optional[IMarkdownRenderer] = None, images: t.Optional[IImageProcessor] = None) -> t.Tuple[str, dict]:
+    """Render a post body.
+
+    :param renderer: Defaults to rendering in the current process
+    :param images: Image processor for responsive images, if configured
+    :return: Tuple (HTML, derived values). ``degraded`` is set in derived values if the body could not be rendered and HTML is escaped text.
+    """
+    renderer = renderer or get_renderer(None)
+    body_html, toc, rendered = renderer.render(body)
+
+    image = None
+    if images and rendered:
+        body_html, image = images.process(body_html)
+
+    word_count = len(html_to_text(body_html).split())
+
+    derived = {
+        "hash": body_hash(body),
+        "word_count": word_count,
+        "reading_time": max(1, math.ceil(word_count / WORDS_PER_MINUTE)),
+        "toc": flatten_toc(toc),
+        "excerpt": make_excerpt(body_html),
+        "degraded": not rendered,
+        "image": image,
+    }
+    return body_html, derived
+
+
+def is_current(derived: t.Optional[dict], body: str) -> bool:
+    """Were derived values computed from the body, and rendered successfully."""
+    return bool(derived) and not derived.get("degraded") and derived.get("hash") == body_hash(body)
+
+
+def is_fresh(post: Post) -> bool:
+    """Were the stored derivatives computed from the current body."""
+    return is_current(post.derived, post.body)
+
+
+def update_derivatives(dbsession: Session, post_ids: t.List[uuid.UUID], renderer: t.Optional[IMarkdownRenderer] = None, images: t.Optional[IImageProcessor] = None, force: bool = False) -> t.List[uuid.UUID]:
+    """Compute and store derivatives of posts whose body changed.
+
+    ``updated_at`` is kept, deriving values is not an edit. Bodies which could not be rendered are left as they are, to be retried later.
+
+    :param force: Recompute up to date derivatives too, e.g. after changing the rendering settings
+    :return: Ids of updated posts
+    """
+    updated = []
+    q = dbsession.query(Post.id, Post.body, Post.derived).filter(Post.id.in_(post_ids))
+    for post_id, body, derived in q.all():
+        if not force and is_current(derived, body):
+            continue
+
+        body_html, derived = compute_derivatives(body, renderer, images)
+        if derived["degraded"]:
+            logger.warning("Could not render post %s, its derived values are not stored", post_id)
+            continue
+
+        dbsession.query(Post).filter(Post.id == post_id).update({"body_html": body_html, "derived": derived, "updated_at": Post.updated_at}, synchronize_session=False)
+        updated.append(post_id)
+    return updated
+
+
+def run_update(registry: Registry, post_ids: t.List[uuid.UUID], force: bool = False, batch_size: int = BATCH_SIZE) -> int:
+    """Update derivatives in transactions of their own and notify the updated posts.
+
+    :return: Number of updated posts
+    """
+    updated = 0
+    for idx in range(0, len(post_ids), batch_size):
+        batch = post_ids[idx:idx + batch_size]
+        tm = transaction.TransactionManager()
+        dbsession = create_dbsession(registry, manager=tm)
+        try:
+            with tm:
+                updated_ids = update_derivatives(dbsession, batch, get_renderer(registry), get_image_processor(registry), force=force)
+            updated += len(updated_ids)
+            if updated_ids:
+                registry.notify(PostsChanged(registry, post_ids=updated_ids))
+        except Exception as e:
+            logger.exception(e)
+            logger.error("Could not update derivatives of %d posts, they are computed inline until the next save", len(batch))
+        finally:
+            dbsession.close()
+    return updated
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Background thread created on first use, so that it runs in the forked web server worker."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1)
+        return _executor
+
+
+def schedule_update(registry: Registry, post_ids: t.List[uuid.UUID]):
+    """Run derivative updates with the configured runner."""
+    runner = registry.settings.get("blog.derivatives.runner", "thread")
+    post_ids = sorted(post_ids, key=str)
+
+    if runner == "thread":
+        get_executor().submit(run_update, registry, post_ids)
+    elif runner == "celery":
+        from .tasks import update_post_derivatives
+        update_post_derivatives.apply_async_instant(args=[[str(post_id) for post_id in post_ids]])
+    elif runner == "inline":
+        run_update(registry, post_ids)
+    elif runner != "off":
+        raise RuntimeError("Unknown blog.derivatives.runner: {}".format(runner))
+
+
+def on_posts_changed(event: PostsChanged):
+    """Queue derivatives of saved posts. Posts already up to date are skipped by the job.
+
+    Changes made in other processes are left to the process which made them.
+    """
+    if event.post_ids and not event.remote:
+        schedule_update(event.registry, list(event.post_ids))
@@ -0,0 +1,68 @@
+"""Blog content change events.
+
+Views changing posts or tags call :py:func:`notify_posts_changed`. All notifications within one transaction are merged and fired as a single :py:class:`PostsChanged` event after the transaction commits, so subscribers dropping cached content run once per batch and never see uncommitted data.
+"""
+
+# Standard Library
+import typing as t
+import uuid
+
+# Pyramid
+from pyramid.registry import Registry
+
+# Websauna
+from websauna.system.http import Request
+
+
+class PostsChanged:
+    """Posts were added, edited, published, retracted or deleted, or their tags changed.
+
+    Every change also affects the blog roll and the feed.
+    """
+
+    def __init__(self, registry: Registry, request: t.Optional[Request] = None, post_ids: t.Iterable[uuid.UUID] = (), tags: t.Iterable[str] = (), slugs: t.Iterable[str] = (), remote: bool = False):
+        self.registry = registry
+
+        #: Request which made the change. ``None`` if the change was made outside the HTTP request.
+        self.request = request
+
+        #: The change was made in another process and received from the :py:mod:`invalidation bus <websauna.blog.bus>`. Subscribers with effects outside this process, like purging proxies, skip remote events.
+        self.remote = remote
+
+        #: Ids of changed posts
+        self.post_ids = set(post_ids)
+
+        #: Titles of tags whose tag roll changed
+        self.tags = set(tags)
+
+        #: Post slugs which now point elsewhere, e.g. old and new slug of an edited post
+        self.slugs = set(slugs)
+
+    def update(self, post_ids: t.Iterable[uuid.UUID] = (), tags: t.Iterable[str] = (), slugs: t.Iterable[str] = ()):
+        self.post_ids.update(post_ids)
+        self.tags.update(tags)
+        self.slugs.update(slugs)
+
+    def __repr__(self):
+        return "<PostsChanged posts:{} tags:{} slugs:{}{}>".format(len(self.post_ids), sorted(self.tags), sorted(self.slugs), " remote" if self.remote else "")
+
+
+def notify_posts_changed(request: Request, post_ids: t.Iterable[uuid.UUID] = (), tags: t.Iterable[str] = (), slugs: t.Iterable[str] = ()):
+    """Fire :py:class:`PostsChanged` when the current transaction has been committed.
+
+    Several calls within the same transaction fire only one event.
+    """
+    txn = request.tm.get()
+    pending = getattr(request, "_blog_posts_changed", None)
+
+    if not pending or pending[0] is not txn:
+        event = PostsChanged(request.registry, request)
+
+        def after_commit(success: bool):
+            if success:
+                request.registry.notify(event)
+
+        txn.addAfterCommitHook(after_commit)
+        pending = request._blog_posts_changed = (txn, event)
+
+    pending[1].update(post_ids=post_ids, tags=tags, slugs=slugs)
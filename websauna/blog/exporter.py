@@ -0,0 +1,143 @@
+"""Bulk export of posts to JSON Lines or a Markdown front matter tree.
+
+Posts are read through a server side cursor in batches and the tags of each batch are loaded with one extra query, so exporting does not load the table in memory. The Markdown export writes the same front matter format :py:mod:`websauna.blog.importer` reads.
+"""
+
+# Standard Library
+import datetime
+import json
+import logging
+import os
+import typing as t
+import uuid
+
+# SQLAlchemy
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+import yaml
+
+from .models import AssociationPostsTags
+from .models import Post
+from .models import Tag
+
+
+logger = logging.getLogger(__name__)
+
+#: Post columns included in the export
+EXPORT_COLUMNS = ("id", "slug", "title", "author", "excerpt", "body", "created_at", "published_at", "updated_at", "view_count", "other_data")
+
+
+def iter_batches(dbsession: Session, since: t.Optional[datetime.datetime] = None, batch_size: int = 500) -> t.Iterator[t.List[dict]]:
+    """Read posts in batches of dictionaries with ``tags`` list.
+
+    :param since: Only export posts created or updated at or after this time
+    """
+    columns = [getattr(Post, name) for name in EXPORT_COLUMNS]
+    q = dbsession.query(*columns).order_by(Post.created_at, Post.id)
+    if since:
+        q = q.filter(sa.func.coalesce(Post.updated_at, Post.created_at) >= since)
+
+    q = q.execution_options(stream_results=True).yield_per(batch_size)
+
+    batch = []
+    for row in q:
+        batch.append(dict(zip(EXPORT_COLUMNS, row)))
+        if len(batch) >= batch_size:
+            yield load_tags(dbsession, batch)
+            batch = []
+
+    if batch:
+        yield load_tags(dbsession, batch)
+
+
+def load_tags(dbsession: Session, batch: t.List[dict]) -> t.List[dict]:
+    """Fill in ``tags`` for a batch of posts with one query."""
+    tags = {}
+    q = dbsession.query(AssociationPostsTags.post_id, Tag.title).join(Tag, Tag.id == AssociationPostsTags.tag_id).filter(AssociationPostsTags.post_id.in_([post["id"] for post in batch])).order_by(Tag.title)
+    for post_id, title in q:
+        tags.setdefault(post_id, []).append(title)
+
+    for post in batch:
+        post["tags"] = tags.get(post["id"], [])
+    return batch
+
+
+def iter_posts(dbsession: Session, since: t.Optional[datetime.datetime] = None, batch_size: int = 500) -> t.Iterator[dict]:
+    for batch in iter_batches(dbsession, since, batch_size):
+        yield from batch
+
+
+def to_json(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError("Cannot export {}".format(type(value)))
+
+
+def export_jsonl(dbsession: Session, out: t.TextIO, since: t.Optional[datetime.datetime] = None, batch_size: int = 500) -> int:
+    """Write one JSON object per post per line.
+
+    :return: Number of exported posts
+    """
+    count = 0
+    for post in iter_posts(dbsession, since, batch_size):
+        out.write(json.dumps(post, default=to_json, ensure_ascii=False))
+        out.write("\n")
+        count += 1
+    return count
+
+
+def to_markdown(post: dict) -> str:
+    """Format a post as Markdown with YAML front matter."""
+    front_matter = dict(post["other_data"] or {})
+    front_matter.update({
+        "title": post["title"],
+        "slug": post["slug"],
+        "author": post["author"],
+        "tags": post["tags"],
+        "excerpt": post["excerpt"],
+        "created_at": post["created_at"],
+    })
+
+    if post["published_at"]:
+        front_matter["date"] = post["published_at"]
+    else:
+        front_matter["draft"] = True
+
+    if post["updated_at"]:
+        front_matter["updated_at"] = post["updated_at"]
+
+    return "---\n{}---\n\n{}".format(yaml.safe_dump(front_matter, default_flow_style=False, allow_unicode=True), post["body"])
+
+
+def get_markdown_path(directory: str, slug: str) -> t.Optional[str]:
+    """File of a post in the export directory, ``None`` if the slug would point elsewhere."""
+    if not slug or "/" in slug or os.sep in slug or (os.altsep and os.altsep in slug) or slug.startswith("."):
+        return None
+
+    directory = os.path.realpath(directory)
+    path = os.path.realpath(os.path.join(directory, slug + ".md"))
+    return path if os.path.dirname(path) == directory else None
+
+
+def export_markdown(dbsession: Session, directory: str, since: t.Optional[datetime.datetime] = None, batch_size: int = 500) -> int:
+    """Write each post to ``<slug>.md`` file in a directory.
+
+    Posts whose slug is not a plain file name are skipped and logged.
+
+    :return: Number of exported posts
+    """
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for post in iter_posts(dbsession, since, batch_size):
+        path = get_markdown_path(directory, post["slug"])
+        if path is None:
+            logger.error("Skipped post %s, slug %r is not a safe file name", post["id"], post["slug"])
+            continue
+
+        with open(path, "wt", encoding="utf-8") as f:
+            f.write(to_markdown(post))
+        count += 1
+    return count
@@ -0,0 +1,71 @@
+"""Jinja ``{% cache %}`` tag for caching rendered per-post snippets.
+
+.. code-block:: html+jinja
+
+    {% cache "byline", post_resource.post %}
+      {% include "blog/byline.html" %}
+    {% endcache %}
+
+The fragment is stored in the :py:mod:`blog cache <websauna.blog.cache>` keyed by the fragment name, the post id, ``updated_at`` and whether the post is published yet. Editing a post changes the key, and tag changes drop the fragment through the post and tag keys it is stored with. Without a configured cache the block is rendered every time.
+
+Bylines show relative times like "3 hours ago", so fragments of recent posts are kept only for a short while. ``blog.cache.fragment_ttl`` (default one day) caps the lifetime.
+"""
+
+# Standard Library
+import typing as t
+
+# Pyramid
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+# Websauna
+from websauna.utils.time import now
+
+from .cache import get_cache
+from .cache import post_key
+from .cache import tag_key
+from .models import Post
+
+
+def get_fragment_ttl(registry, post: Post) -> int:
+    """Keep a fragment about as long as its relative times stay the same."""
+    ttl = int(registry.settings.get("blog.cache.fragment_ttl", 86400))
+    age = (now() - (post.published_at or post.created_at)).total_seconds()
+    if age < 3600:
+        return min(ttl, 60)
+    elif age < 86400:
+        return min(ttl, 600)
+    return min(ttl, 3600)
+
+
+def get_fragment_key(request, name: str, post: Post) -> str:
+    updated_at = post.updated_at.timestamp() if post.updated_at else 0
+    return "fragment:{}:{}:{}:{}:{}".format(name, post.id, updated_at, int(post.is_published()), request.application_url)
+
+
+class FragmentCacheExtension(Extension):
+    """Add ``{% cache name, post %}...{% endcache %}`` tag."""
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        name = parser.parse_expression()
+        parser.stream.expect("comma")
+        post = parser.parse_expression()
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        args = [nodes.Name("request", "load"), name, post]
+        return nodes.CallBlock(self.call_method("_render", args), [], [], body).set_lineno(lineno)
+
+    def _render(self, request, name: str, post: Post, caller: t.Callable[[], str]) -> str:
+        cache = get_cache(request.registry) if request else None
+        if cache is None:
+            return caller()
+
+        key = get_fragment_key(request, name, post)
+        html = cache.get(key)
+        if html is None:
+            html = caller()
+            tags = [post_key(post.id)] + [tag_key(tag.title) for tag in post.tags]
+            cache.set(key, html, get_fragment_ttl(request.registry, post), tags=tags)
+        return html
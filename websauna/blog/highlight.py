@@ -0,0 +1,149 @@
+"""Syntax highlighting of fenced code blocks.
+
+When ``blog.rendering.highlight`` is set, post bodies are rendered with the ``fenced_code`` extension and code blocks with a language are highlighted with Pygments, which must be installed with ``websauna.blog[highlight]``::
+
+    ```python
+    print("Hello")
+    ```
+
+Only blocks written by ``fenced_code`` are highlighted. ``<pre><code>`` written as raw HTML in the body is left as the author wrote it.
+
+Highlighting costs several times more than rendering the rest of the Markdown. Each highlighted block is cached in the memory of the rendering process by a hash of its language and source, so editing a post re-highlights only the changed blocks.
+
+The stylesheet is not generated per page, but shipped as ``websauna.blog:static/pygments.css``. Regenerate it for another Pygments style with::
+
+    python -c "from websauna.blog.highlight import get_stylesheet; print(get_stylesheet('monokai'))" > websauna/blog/static/pygments.css
+"""
+
+# Standard Library
+import hashlib
+import html
+import re
+import threading
+import typing as t
+from collections import OrderedDict
+
+from markdown.extensions import Extension
+from markdown.postprocessors import Postprocessor
+from markdown.preprocessors import Preprocessor
+
+
+try:
+    import pygments
+    from pygments.formatters import HtmlFormatter
+    from pygments.lexers import get_lexer_by_name
+    from pygments.util import ClassNotFound
+except ImportError:
+    pygments = None
+
+
+#: CSS class of the ``<div>`` around highlighted code, the same as ``codehilite`` uses
+CSS_CLASS = "codehilite"
+
+#: Code blocks as written by ``fenced_code`` extension
+CODE_BLOCK = re.compile(r'<pre><code class="(?:language-)?(?P<lang>[^"\s]+)">(?P<code>.*?)</code></pre>', re.DOTALL)
+
+
+class BlockCache:
+    """Bounded LRU of highlighted code blocks."""
+
+    def __init__(self, max_entries: int = 2000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> t.Optional[str]:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+#: Highlighted blocks of this process
+block_cache = BlockCache()
+
+
+def get_block_key(lang: str, code: str) -> str:
+    data = "{}\0{}".format(lang.lower(), code).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+def highlight_block(lang: str, code: str) -> t.Optional[str]:
+    """Highlight source code, using the cached result when the same block has been highlighted before.
+
+    :return: Highlighted HTML or ``None`` if Pygments is not installed or does not know the language
+    """
+    if not pygments:
+        return None
+
+    key = get_block_key(lang, code)
+    highlighted = block_cache.get(key)
+    if highlighted is None:
+        try:
+            lexer = get_lexer_by_name(lang)
+        except ClassNotFound:
+            return None
+        highlighted = pygments.highlight(code, lexer, HtmlFormatter(cssclass=CSS_CLASS))
+        block_cache.set(key, highlighted)
+
+    return highlighted
+
+
+def get_stylesheet(style: str = "default") -> str:
+    """CSS for highlighted blocks."""
+    return HtmlFormatter(style=style, cssclass=CSS_CLASS).get_style_defs(".{}".format(CSS_CLASS))
+
+
+class FenceMarker(Preprocessor):
+    """Remember which stashed HTML blocks ``fenced_code`` adds, by the stash size before and after it runs."""
+
+    def __init__(self, md, extension: "HighlightExtension", attr: str):
+        super(FenceMarker, self).__init__(md)
+        self.extension = extension
+        self.attr = attr
+
+    def run(self, lines: t.List[str]) -> t.List[str]:
+        setattr(self.extension, self.attr, len(self.md.htmlStash.rawHtmlBlocks))
+        return lines
+
+
+class HighlightPostprocessor(Postprocessor):
+    """Replace stashed fenced code blocks with highlighted ones."""
+
+    def __init__(self, md, extension: "HighlightExtension"):
+        super(HighlightPostprocessor, self).__init__(md)
+        self.extension = extension
+
+    def run(self, text: str) -> str:
+
+        def replace(match):
+            highlighted = highlight_block(match.group("lang"), html.unescape(match.group("code")))
+            return highlighted if highlighted is not None else match.group(0)
+
+        blocks = self.md.htmlStash.rawHtmlBlocks
+        for idx in range(self.extension.fences_start, self.extension.fences_end):
+            blocks[idx] = CODE_BLOCK.sub(replace, blocks[idx])
+        return text
+
+
+class HighlightExtension(Extension):
+    """Markdown extension for fenced code blocks with cached highlighting."""
+
+    #: Range of stashed HTML blocks written by ``fenced_code`` in the current document
+    fences_start = fences_end = 0
+
+    def extendMarkdown(self, md):
+        md.registerExtension(self)
+        # fenced_code runs at 25, before raw HTML blocks are stashed at 20
+        md.preprocessors.register(FenceMarker(md, self, "fences_start"), "blog_fences_start", 25.1)
+        md.preprocessors.register(FenceMarker(md, self, "fences_end"), "blog_fences_end", 24.9)
+        # Run before the stashed blocks are put back to the HTML at 30
+        md.postprocessors.register(HighlightPostprocessor(md, self), "blog_highlight", 31)
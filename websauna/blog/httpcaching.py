@@ -0,0 +1,175 @@
+"""HTTP caching headers of the public blog pages.
+
+Pages shown to anonymous visitors are public for ``blog.http_cache.max_age`` seconds in browsers and ``blog.http_cache.s_maxage`` seconds in shared caches, but never past the publishing time of the next scheduled post. They carry the keys of the posts, tags and rolls they show in the ``blog.http_cache.surrogate_key_header`` header (default ``Surrogate-Key``), so a caching proxy can drop them when :py:mod:`websauna.blog.purge` tells it to. Pages of logged in users are private.
+
+Pages send a weak ``ETag`` and ``Last-Modified`` computed from a few columns before anything is rendered. Clients and crawlers repeating the request with ``If-None-Match`` or ``If-Modified-Since`` get ``304 Not Modified`` without the page being rendered.
+
+``If-None-Match`` is preferred. The roll ``Last-Modified`` does not move back when a post is deleted or retracted, or move at all when posts are retagged, but the ETag changes because it includes the post count and a signature of the tags of the listed posts.
+"""
+
+# Standard Library
+import datetime
+import functools
+import hashlib
+import typing as t
+
+# Pyramid
+from pyramid.httpexceptions import HTTPNotModified
+
+# SQLAlchemy
+import sqlalchemy as sa
+from sqlalchemy.orm import aliased
+
+# Websauna
+from websauna.system.http import Request
+
+from .cache import get_cache
+from .models import AssociationPostsTags
+from .models import Post
+from .models import Tag
+from .pagecache import get_page_tags
+from .pagecache import limit_to_schedule
+from .replica import get_read_dbsession
+
+
+class Validator:
+    """ETag and Last-Modified of a page."""
+
+    def __init__(self, etag: str, last_modified: t.Optional[datetime.datetime]):
+        self.etag = etag
+        self.last_modified = last_modified.replace(microsecond=0) if last_modified else None
+
+    def matches(self, request: Request) -> bool:
+        """Does the client already have this version of the page."""
+        if request.if_none_match:
+            return self.etag in request.if_none_match
+
+        if request.if_modified_since and self.last_modified:
+            return self.last_modified <= request.if_modified_since
+
+        return False
+
+    def apply(self, response):
+        response.headers["ETag"] = 'W/"{}"'.format(self.etag)
+        if self.last_modified:
+            response.last_modified = self.last_modified
+
+
+def make_etag(*parts) -> str:
+    return hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def post_validator(post_resource, request: Request) -> Validator:
+    """Validate a post page by its timestamps, tags and neighbours, read from the post summary without loading the post."""
+    post = post_resource.summary
+    tags = sorted(post.tags)
+    neighbours = post_resource.neighbours
+    links = [(neighbour["id"], neighbour["slug"], neighbour["title"]) if neighbour else None for neighbour in (neighbours["previous"], neighbours["next"])]
+    last_modified = max(timestamp for timestamp in (post.created_at, post.published_at, post.updated_at) if timestamp)
+    etag = make_etag(post.id, post.slug, post.updated_at, post.published_at, ",".join(tags), links, neighbours["tag"], request.authenticated_userid)
+    return Validator(etag, last_modified)
+
+
+def roll_validator(blog_container, request: Request, filter_posts: t.Optional[t.Callable] = None) -> Validator:
+    """Validate a listing page by the latest timestamps, the number and ids of the listed posts and a signature of their tags.
+
+    Works for the blog roll, tag rolls and the feed.
+
+    :param filter_posts: Limits a post query to the listed posts, for rolls other than the tag rolls
+    """
+    dbsession = get_read_dbsession(request)
+    id_signature = sa.func.sum(sa.func.hashtext(sa.cast(Post.id, sa.Text)))
+    q = dbsession.query(sa.func.max(Post.created_at), sa.func.max(Post.published_at), sa.func.max(Post.updated_at), sa.func.count(Post.id), id_signature)
+    q = blog_container.filter_visible(q)
+
+    # Tag lines change with bulk tagging, tag renames and merges, which do not touch the posts
+    # Aliased, so that the tag roll filter below is not correlated to it
+    shown_tag = aliased(Tag)
+    association = sa.cast(AssociationPostsTags.post_id, sa.Text) + ":" + shown_tag.title
+    tags_q = dbsession.query(sa.func.count(), sa.func.sum(sa.func.hashtext(association)))
+    tags_q = tags_q.select_from(AssociationPostsTags).join(shown_tag, shown_tag.id == AssociationPostsTags.tag_id).join(Post, Post.id == AssociationPostsTags.post_id)
+    tags_q = blog_container.filter_visible(tags_q)
+
+    tag = request.matchdict.get("tag") if request.matchdict else None
+    if tag:
+        q = q.filter(Post.tags.any(Tag.title == tag))
+        tags_q = tags_q.filter(Post.tags.any(Tag.title == tag))
+
+    if filter_posts:
+        q = filter_posts(q)
+        tags_q = filter_posts(tags_q)
+
+    created_at, published_at, updated_at, count, ids = q.one()
+    tag_count, tag_signature = tags_q.one()
+    timestamps = [timestamp for timestamp in (created_at, published_at, updated_at) if timestamp]
+    last_modified = max(timestamps) if timestamps else None
+    etag = make_etag(created_at, published_at, updated_at, count, ids, tag_count, tag_signature, request.authenticated_userid)
+    return Validator(etag, last_modified)
+
+
+def data_roll_validator(blog_container, request: Request) -> Validator:
+    """Validate a metadata roll by the posts having its ``other_data`` value only, so changes of other posts keep it valid."""
+    contains = {request.matchdict["key"]: request.matchdict["value"]}
+    validator = roll_validator(blog_container, request, lambda query: blog_container.filter_by_data(query, contains=contains))
+    return Validator(make_etag(validator.etag, sorted(contains.items())), validator.last_modified)
+
+
+def conditional_get(validator: t.Callable[[object, Request], Validator]):
+    """Create a view decorator answering conditional GETs with 304 before calling the view.
+
+    Use outside :py:func:`websauna.blog.pagecache.page_cache`, e.g. ``@view_config(decorator=(cache_headers, conditional_get(post_validator), page_cache))``.
+    """
+
+    def decorator(view):
+
+        @functools.wraps(view)
+        def wrapper(context, request: Request):
+            if request.method not in ("GET", "HEAD"):
+                return view(context, request)
+
+            current = validator(context, request)
+            if current.matches(request):
+                response = HTTPNotModified()
+                current.apply(response)
+                return response
+
+            response = view(context, request)
+            if response.status_code == 200:
+                current.apply(response)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def get_surrogate_key_header(registry) -> str:
+    return registry.settings.get("blog.http_cache.surrogate_key_header", "Surrogate-Key")
+
+
+def cache_headers(view):
+    """View decorator adding ``Cache-Control`` and surrogate key headers, also to ``304`` responses."""
+
+    @functools.wraps(view)
+    def wrapper(context, request: Request):
+        response = view(context, request)
+        if request.method not in ("GET", "HEAD") or response.status_code not in (200, 304):
+            return response
+
+        if request.authenticated_userid is not None or "Set-Cookie" in response.headers:
+            response.cache_control = "private, no-cache"
+            return response
+
+        settings = request.registry.settings
+        max_age = int(settings.get("blog.http_cache.max_age", 0))
+        s_maxage = int(settings.get("blog.http_cache.s_maxage", 0))
+        longest = max(max_age, s_maxage)
+        if longest:
+            expires = limit_to_schedule(request, longest, get_cache(request.registry))
+            max_age, s_maxage = min(max_age, expires), min(s_maxage, expires)
+
+        response.cache_control = "public, max-age={}, s-maxage={}".format(max_age, s_maxage) if s_maxage else "public, max-age={}".format(max_age)
+        response.headers[get_surrogate_key_header(request.registry)] = " ".join(get_page_tags(context, request))
+        return response
+
+    return wrapper
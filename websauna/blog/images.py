@@ -0,0 +1,225 @@
+"""Responsive images in rendered post HTML.
+
+Markdown turns ``![Alt](/images/photo.jpg)`` into a plain ``<img>`` of the full size original. When ``blog.images.path`` is set, rendered post HTML is post-processed: images under ``blog.images.url`` are read from ``blog.images.path`` and resized to each of ``blog.images.widths`` smaller than the original. The tags are rewritten with ``srcset``, ``sizes``, ``width``, ``height`` and ``loading="lazy"``.
+
+Variants are written to the ``_variants`` folder of ``blog.images.path`` and named by the hash of the original content, so each is generated once and a replaced original gets new URLs. The folder must be served under ``blog.images.url`` like the originals.
+
+The first image of a post, in the variant closest to the preferred 1200 pixels, is stored in the derived values for social media cards.
+
+Needs Pillow, install with ``websauna.blog[images]``.
+"""
+
+# Standard Library
+import hashlib
+import html
+import importlib.util
+import logging
+import os
+import re
+import threading
+import typing as t
+from collections import OrderedDict
+from html.parser import HTMLParser
+from urllib.parse import quote
+from urllib.parse import unquote
+
+# Pyramid
+from pyramid.registry import Registry
+from pyramid.settings import aslist
+from zope.interface import implementer
+
+from .interfaces import IImageProcessor
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Folder of generated variants under the image folder
+VARIANTS_DIR = "_variants"
+
+#: Preferred width of images shown on social media cards
+SOCIAL_IMAGE_WIDTH = 1200
+
+#: Pillow save options of formats which are resized. Others, like possibly animated GIFs, are only measured.
+SAVE_OPTIONS = {
+    "JPEG": {"quality": 85, "optimize": True},
+    "PNG": {"optimize": True},
+    "WEBP": {"quality": 85},
+}
+
+#: Content hashes of originals remembered
+HASH_CACHE_SIZE = 1000
+
+IMG_TAG = re.compile(r"<img\b[^>]*>")
+
+#: End of a tag, new attributes are inserted before it
+TAG_END = re.compile(r"\s*/?>$")
+
+
+class AttributeParser(HTMLParser):
+    """Read the attributes of one tag, quoted in any way, unquoted or boolean."""
+
+    def __init__(self):
+        super(AttributeParser, self).__init__(convert_charrefs=True)
+        self.attributes = {}
+
+    def handle_starttag(self, tag, attrs):
+        for name, value in attrs:
+            self.attributes.setdefault(name, value)
+
+    handle_startendtag = handle_starttag
+
+
+def parse_attributes(tag: str) -> t.Dict[str, t.Optional[str]]:
+    """Attributes of a tag with entities decoded, ``None`` values for boolean attributes."""
+    parser = AttributeParser()
+    parser.feed(tag)
+    parser.close()
+    return parser.attributes
+
+
+def pick_social_image(variants: t.List[dict]) -> dict:
+    """Largest variant not wider than the preferred social media image width."""
+    fitting = [variant for variant in variants if variant["width"] <= SOCIAL_IMAGE_WIDTH]
+    return fitting[-1] if fitting else variants[0]
+
+
+@implementer(IImageProcessor)
+class ImageProcessor:
+    """Resize local images to variants on disk and rewrite their tags."""
+
+    def __init__(self, url: str, path: str, widths: t.Iterable[int] = (480, 960, 1600)):
+        self.url = url if url.endswith("/") else url + "/"
+        self.path = os.path.realpath(path)
+        self.variants_path = os.path.join(self.path, VARIANTS_DIR)
+        self.widths = sorted(widths)
+
+        #: Content hashes of originals by (path, modification time, size), least recently used first
+        self.hashes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_local_path(self, src: str) -> t.Optional[str]:
+        """Map an image URL to a file under the image folder."""
+        if not src.startswith(self.url):
+            return None
+
+        name = unquote(src[len(self.url):].split("?", 1)[0].split("#", 1)[0])
+        path = os.path.realpath(os.path.join(self.path, name))
+        if not path.startswith(self.path + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def get_content_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        key = (path, stat.st_mtime, stat.st_size)
+        with self.lock:
+            digest = self.hashes.get(key)
+            if digest is not None:
+                self.hashes.move_to_end(key)
+        if digest is None:
+            with open(path, "rb") as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+            with self.lock:
+                self.hashes[key] = digest
+                while len(self.hashes) > HASH_CACHE_SIZE:
+                    self.hashes.popitem(last=False)
+        return digest
+
+    def make_variants(self, path: str) -> t.List[dict]:
+        """Generate missing variants of an original.
+
+        :return: Variants and the original as dicts with ``url``, ``width`` and ``height``, narrowest first
+        """
+        # Imported on first use, Pillow is slow to import
+        import PIL.Image
+
+        with PIL.Image.open(path) as image:
+            width, height = image.size
+            original = {"url": self.url + quote(os.path.relpath(path, self.path).replace(os.sep, "/")), "width": width, "height": height}
+            save_options = SAVE_OPTIONS.get(image.format)
+            if save_options is None:
+                return [original]
+
+            digest = self.get_content_hash(path)
+            extension = os.path.splitext(path)[1].lower()
+            variants = []
+            for variant_width in self.widths:
+                if variant_width >= width:
+                    break
+
+                variant_height = max(1, round(height * variant_width / width))
+                name = "{}-{}{}".format(digest, variant_width, extension)
+                target = os.path.join(self.variants_path, name)
+                if not os.path.exists(target):
+                    os.makedirs(self.variants_path, exist_ok=True)
+                    # Write under a temporary name, so that a half written file is never served
+                    temp = "{}.{}.tmp".format(target, os.getpid())
+                    image.resize((variant_width, variant_height), PIL.Image.LANCZOS).save(temp, format=image.format, **save_options)
+                    os.replace(temp, target)
+
+                variants.append({"url": "{}{}/{}".format(self.url, VARIANTS_DIR, name), "width": variant_width, "height": variant_height})
+
+        variants.append(original)
+        return variants
+
+    def rewrite_tag(self, tag: str) -> t.Tuple[str, t.Optional[t.List[dict]]]:
+        """Add variants and dimensions to one ``<img>`` tag.
+
+        Attributes the tag has are kept as written, missing ones are added at the end.
+
+        :return: Tuple (new tag, variants or ``None`` if the image is not local)
+        """
+        attributes = parse_attributes(tag)
+        if "srcset" in attributes:
+            return tag, None
+
+        variants = None
+        path = self.get_local_path(attributes.get("src") or "")
+        if path:
+            try:
+                variants = self.make_variants(path)
+            except (OSError, ValueError) as e:
+                logger.warning("Could not make variants of image %s: %s", path, e)
+
+        new_attributes = OrderedDict([("loading", "lazy")])
+        if variants:
+            original = variants[-1]
+            new_attributes["width"] = original["width"]
+            new_attributes["height"] = original["height"]
+            if len(variants) > 1:
+                new_attributes["srcset"] = ", ".join("{} {}w".format(variant["url"], variant["width"]) for variant in variants)
+                new_attributes["sizes"] = "(max-width: {width}px) 100vw, {width}px".format(width=original["width"])
+
+        added = "".join(' {}="{}"'.format(name, html.escape(str(value))) for name, value in new_attributes.items() if name not in attributes)
+        end = TAG_END.search(tag)
+        return tag[:end.start()] + added + tag[end.start():], variants
+
+    def process(self, body_html: str) -> t.Tuple[str, t.Optional[dict]]:
+        social_images = []
+
+        def replace(match):
+            tag, variants = self.rewrite_tag(match.group(0))
+            if variants:
+                social_images.append(pick_social_image(variants))
+            return tag
+
+        body_html = IMG_TAG.sub(replace, body_html)
+        return body_html, social_images[0] if social_images else None
+
+
+def create_image_processor(registry: Registry) -> t.Optional[IImageProcessor]:
+    """Create an image processor if ``blog.images.path`` is set."""
+    settings = registry.settings
+    path = settings.get("blog.images.path", "").strip()
+    if not path:
+        return None
+
+    if importlib.util.find_spec("PIL") is None:
+        raise RuntimeError("blog.images.path is set, but Pillow is not installed. Install websauna.blog[images].")
+
+    widths = [int(width) for width in aslist(settings.get("blog.images.widths", "480 960 1600"))]
+    return ImageProcessor(settings.get("blog.images.url", "/images/"), path, widths)
+
+
+def get_image_processor(registry: t.Optional[Registry]) -> t.Optional[IImageProcessor]:
+    return registry.queryUtility(IImageProcessor) if registry is not None else None
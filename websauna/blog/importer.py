@@ -0,0 +1,308 @@
+"""Bulk import of Markdown files with YAML front matter.
+
+Each file looks like::
+
+    ---
+    title: Hello world
+    slug: hello-world
+    author: Mikko Ohtamaa
+    tags: [websauna, python]
+    date: 2017-05-01 10:00:00
+    excerpt: The first post.
+    ---
+
+    Markdown body text.
+
+Recognized front matter keys are ``title``, ``slug``, ``author``, ``tags`` (list or comma separated string), ``excerpt``, ``date`` or ``published_at``, ``created_at``, ``updated`` or ``updated_at`` and ``draft``. Other keys are stored in ``Post.other_data``. Without a ``slug`` the file name is used. Slugs are slugified like generated ones.
+
+Values are checked against the column types and lengths when a file is read, so a bad file fails alone. Files are streamed from the directory tree in batches. Each batch is one transaction using bulk inserts, so memory use does not depend on the archive size. If the database still rejects a batch, its files are retried one per transaction and only the rejected ones are reported failed. Posts are keyed on slug: posts whose slug exists, or is the former slug of a post, are skipped, so an interrupted import can be run again.
+
+When a registry is given, :py:class:`~websauna.blog.events.PostsChanged` is fired for the posts of each committed batch. Cached rolls and slug lookups are dropped and derived values are scheduled as for posts saved in the admin.
+"""
+
+# Standard Library
+import datetime
+import logging
+import os
+import typing as t
+import uuid
+
+# Pyramid
+import transaction
+from pyramid.registry import Registry
+
+# SQLAlchemy
+import sqlalchemy.dialects.postgresql as psql
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+import yaml
+from slugify import slugify
+
+# Websauna
+from websauna.utils.time import now
+
+from .bulk import upsert_tags
+from .events import PostsChanged
+from .models import AssociationPostsTags
+from .models import Post
+from .models import PostSlugHistory
+from .models import Tag
+
+
+logger = logging.getLogger(__name__)
+
+
+#: File name extensions picked up by the importer
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+
+#: Front matter keys mapped to post columns
+KNOWN_KEYS = {"title", "slug", "author", "tags", "excerpt", "date", "published_at", "created_at", "updated", "updated_at", "draft"}
+
+DATE_FORMATS = ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+class ArchiveImportError(Exception):
+    """A file could not be imported."""
+
+
+class ImportStats:
+    """Running totals of an import."""
+
+    def __init__(self):
+        self.processed = 0
+        self.imported = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def __str__(self):
+        return "Processed {} files: {} imported, {} skipped, {} failed".format(self.processed, self.imported, self.skipped, self.failed)
+
+
+def iter_markdown_files(path: str) -> t.Iterator[str]:
+    """Walk the directory tree in a stable order and yield Markdown file paths."""
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(MARKDOWN_EXTENSIONS):
+                yield os.path.join(dirpath, filename)
+
+
+def parse_date(value) -> t.Optional[datetime.datetime]:
+    """Convert a front matter date to UTC datetime."""
+    if value is None or value == "":
+        return None
+
+    if isinstance(value, str):
+        for fmt in DATE_FORMATS:
+            try:
+                value = datetime.datetime.strptime(value.strip(), fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ArchiveImportError("Could not parse date: {}".format(value))
+
+    if not isinstance(value, datetime.date):
+        raise ArchiveImportError("Not a date: {!r}".format(value))
+
+    if not isinstance(value, datetime.datetime):
+        # YAML gives plain dates for 2017-05-01
+        value = datetime.datetime(value.year, value.month, value.day)
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+
+    return value.astimezone(datetime.timezone.utc)
+
+
+def parse_tags(value) -> t.List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    elif not isinstance(value, (list, tuple)):
+        value = [value]
+    return [check_length("tag", str(tag).strip(), Tag.title) for tag in value if str(tag).strip()]
+
+
+def check_length(name: str, value: t.Optional[str], column) -> t.Optional[str]:
+    """Reject values longer than a string column takes."""
+    if value is not None and len(value) > column.type.length:
+        raise ArchiveImportError("{} is {} characters, the limit is {}".format(name.capitalize(), len(value), column.type.length))
+    return value
+
+
+def to_text(value) -> t.Optional[str]:
+    """Front matter value as a string, YAML gives numbers and dates for unquoted values."""
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        raise ArchiveImportError("Expected text, got {!r}".format(value))
+    return str(value)
+
+
+def to_json(value):
+    """Make front matter values storable in JSONB."""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {str(k): to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    return value
+
+
+def split_front_matter(text: str) -> t.Tuple[dict, str]:
+    """Separate YAML front matter from Markdown body."""
+    if not text.startswith("---"):
+        return {}, text
+
+    lines = text.splitlines(keepends=True)
+    for idx in range(1, len(lines)):
+        if lines[idx].rstrip() in ("---", "..."):
+            front_matter = yaml.safe_load("".join(lines[1:idx])) or {}
+            if not isinstance(front_matter, dict):
+                raise ArchiveImportError("Front matter is not a mapping")
+            return front_matter, "".join(lines[idx + 1:]).lstrip("\n")
+
+    raise ArchiveImportError("Front matter is not terminated")
+
+
+def parse_markdown_file(path: str) -> dict:
+    """Read one file to a dictionary of post column values and ``tags``."""
+    with open(path, "rt", encoding="utf-8") as f:
+        try:
+            front_matter, body = split_front_matter(f.read())
+        except yaml.YAMLError as e:
+            raise ArchiveImportError("Bad front matter: {}".format(e)) from e
+
+    title = to_text(front_matter.get("title"))
+    if not title:
+        raise ArchiveImportError("Title missing")
+
+    slug = slugify(to_text(front_matter.get("slug")) or os.path.splitext(os.path.basename(path))[0])
+    if not slug:
+        raise ArchiveImportError("Slug is empty")
+
+    published_at = parse_date(front_matter.get("published_at", front_matter.get("date")))
+    if front_matter.get("draft"):
+        published_at = None
+
+    return {
+        "id": uuid.uuid4(),
+        "title": check_length("title", title, Post.title),
+        "slug": check_length("slug", slug, Post.slug),
+        "author": check_length("author", to_text(front_matter.get("author")), Post.author),
+        "excerpt": to_text(front_matter.get("excerpt")) or "",
+        "body": body,
+        "published_at": published_at,
+        "created_at": parse_date(front_matter.get("created_at")) or published_at or now(),
+        "updated_at": parse_date(front_matter.get("updated_at", front_matter.get("updated"))),
+        "other_data": {key: to_json(value) for key, value in front_matter.items() if key not in KNOWN_KEYS},
+        "view_count": 0,
+        "tags": parse_tags(front_matter.get("tags")),
+    }
+
+
+def import_batch(dbsession: Session, entries: t.List[dict]) -> t.List[uuid.UUID]:
+    """Insert posts which do not exist yet, their tags and tag associations.
+
+    :return: Ids of inserted posts
+    """
+    slugs = [entry["slug"] for entry in entries]
+    existing = {slug for slug, in dbsession.query(Post.slug).filter(Post.slug.in_(slugs))}
+    # Former slugs keep redirecting to their posts
+    existing.update(slug for slug, in dbsession.query(PostSlugHistory.slug).filter(PostSlugHistory.slug.in_(slugs)))
+
+    new_entries = {}
+    for entry in entries:
+        if entry["slug"] not in existing:
+            new_entries.setdefault(entry["slug"], entry)
+
+    if not new_entries:
+        return []
+
+    tag_ids = upsert_tags(dbsession, (tag for entry in new_entries.values() for tag in entry["tags"]))
+
+    post_table = Post.__table__
+    rows = [{key: value for key, value in entry.items() if key != "tags"} for entry in new_entries.values()]
+    stmt = psql.insert(post_table).values(rows).on_conflict_do_nothing(index_elements=["slug"]).returning(post_table.c.slug)
+    inserted = {slug for slug, in dbsession.execute(stmt)}
+
+    associations = [
+        {"post_id": new_entries[slug]["id"], "tag_id": tag_ids[tag]}
+        for slug in inserted
+        for tag in set(new_entries[slug]["tags"])
+    ]
+    if associations:
+        dbsession.execute(psql.insert(AssociationPostsTags.__table__).values(associations).on_conflict_do_nothing())
+
+    return [new_entries[slug]["id"] for slug in inserted]
+
+
+def notify_imported(registry: Registry, entries: t.List[dict], imported: t.List[uuid.UUID]):
+    """Fire the change event of committed posts."""
+    imported = set(imported)
+    entries = [entry for entry in entries if entry["id"] in imported]
+    registry.notify(PostsChanged(
+        registry,
+        post_ids=imported,
+        tags={tag for entry in entries for tag in entry["tags"]},
+        slugs=[entry["slug"] for entry in entries]))
+
+
+def import_archive(dbsession: Session, path: str, batch_size: int = 200, tm: transaction.TransactionManager = transaction.manager, progress: t.Optional[t.Callable[[ImportStats], None]] = None, registry: t.Optional[Registry] = None) -> ImportStats:
+    """Import a directory tree of Markdown files.
+
+    Every batch is committed separately, an interrupted import resumes by running it again.
+
+    :param progress: Called with running :py:class:`ImportStats` after each batch
+    :param registry: Fire :py:class:`~websauna.blog.events.PostsChanged` for imported posts in this registry
+    """
+    stats = ImportStats()
+    batch = []
+    filenames = []
+
+    def commit(entries: t.List[dict]) -> t.List[uuid.UUID]:
+        with tm:
+            imported = import_batch(dbsession, entries)
+        stats.imported += len(imported)
+        stats.skipped += len(entries) - len(imported)
+        if registry is not None and imported:
+            notify_imported(registry, entries, imported)
+        return imported
+
+    def flush_batch():
+        try:
+            commit(batch)
+        except SQLAlchemyError as e:
+            logger.warning("Batch of %d files rejected, importing them one by one: %s", len(batch), e)
+            for entry, filename in zip(batch, filenames):
+                try:
+                    commit([entry])
+                except SQLAlchemyError as e:
+                    logger.error("Could not import %s: %s", filename, e)
+                    stats.failed += 1
+        batch.clear()
+        filenames.clear()
+        if progress:
+            progress(stats)
+
+    for filename in iter_markdown_files(path):
+        stats.processed += 1
+        try:
+            batch.append(parse_markdown_file(filename))
+            filenames.append(filename)
+        except (ArchiveImportError, OSError, UnicodeDecodeError) as e:
+            logger.error("Could not import %s: %s", filename, e)
+            stats.failed += 1
+            continue
+
+        if len(batch) >= batch_size:
+            flush_batch()
+
+    if batch:
+        flush_batch()
+
+    return stats
@@ -0,0 +1,100 @@
+"""Pluggable utilities of the blog addon.
+
+The concrete implementations are chosen in the INI settings and registered in the application registry when the addon is included.
+"""
+
+# Pyramid
+from zope.interface import Interface
+
+
+class IViewCounter(Interface):
+    """Aggregate post page views and periodically write them to the database."""
+
+    def increment(post_id):
+        """Count one view of a post."""
+
+    def flush(dbsession):
+        """Write all pending view counts to the database using ``dbsession``.
+
+        The caller is responsible for committing the transaction.
+
+        :return: Number of posts updated
+        """
+
+
+class IBlogCache(Interface):
+    """Key value cache for rendered blog content.
+
+    Entries can be tagged, so that everything depending on a post or the blog roll can be dropped at once when the content changes.
+    """
+
+    def get(key):
+        """Get a cached value.
+
+        :return: The value or ``None`` if there is no fresh entry
+        """
+
+    def set(key, value, ttl, tags=()):
+        """Store a value for ``ttl`` seconds.
+
+        :param tags: Invalidating any of these tags drops the entry
+        """
+
+    def delete(key):
+        """Drop one entry."""
+
+    def invalidate_tags(tags):
+        """Drop all entries stored with any of the tags."""
+
+    def clear():
+        """Drop everything."""
+
+
+class IPurgeBackend(Interface):
+    """Drop pages from a caching proxy in front of the site."""
+
+    def purge(keys):
+        """Drop all pages sent with any of the surrogate keys."""
+
+
+class IMarkdownRenderer(Interface):
+    """Render post bodies from Markdown to HTML."""
+
+    def render(text):
+        """Render Markdown. Never raises, failures degrade to escaped text.
+
+        :return: Tuple (HTML, table of contents tokens, whether rendering succeeded)
+        """
+
+
+class IImageProcessor(Interface):
+    """Post-process images in rendered post HTML."""
+
+    def process(body_html):
+        """Rewrite ``<img>`` tags with resized variants.
+
+        :return: Tuple (HTML, image for social media cards as dict with ``url``, ``width`` and ``height``, or ``None``)
+        """
+
+
+class IReadReplica(Interface):
+    """Database replica serving public read-only views."""
+
+    def create_dbsession():
+        """Create a read-only session not joined to the transaction manager. The caller closes it."""
+
+    def is_stale():
+        """Should reads go to the primary, because content changed in this process a moment ago."""
+
+
+class IInvalidationBus(Interface):
+    """Broadcast content changes to all worker processes of the site."""
+
+    def publish(messages):
+        """Send encoded change messages to all subscribed processes, including this one."""
+
+    def ensure_listener(callback):
+        """Start receiving messages in a background thread if not running yet.
+
+        ``callback`` is called with each received message, or with ``None`` when messages may have been lost during a reconnect.
+        """
@@ -1,6 +1,8 @@
 """Place your SQLAlchemy models in this file."""
 # Standard Library
+import datetime
 from typing import List
+from typing import Optional
 
 # SQLAlchemy
 import sqlalchemy as sa
@@ -38,7 +40,7 @@ class Post(Base):
 
     created_at = sa.Column(UTCDateTime, default=now, nullable=False)
 
-    #: When this post was made public. If this is set the post is considered to be public, otherwise it's only admin accessible draft.
+    #: When this post is made public. Until then, or if this is not set, the post is only admin accessible draft. A time in the future schedules the post.
     published_at = sa.Column(UTCDateTime, default=None, nullable=True)
 
     #: When this post wast last edited
@@ -65,11 +67,27 @@ class Post(Base):
     #: Mixed bag of all other properties
     other_data = sa.Column(NestedMutationDict.as_mutable(psql.JSONB), default=dict)
 
+    #: Body rendered to HTML by :py:mod:`websauna.blog.derivatives`. Loaded only when accessed.
+    body_html = sa.orm.deferred(sa.Column(sa.Text(), nullable=True))
+
+    #: Values computed from the body in the background: ``hash`` of the body they were computed from, ``word_count``, ``reading_time``, ``toc`` and ``excerpt``
+    derived = sa.Column(psql.JSONB, nullable=True)
+
+    #: How many times the post page has been viewed. Written in batches by :py:mod:`websauna.blog.counters`, do not increment directly.
+    view_count = sa.Column(sa.Integer, nullable=False, default=0, server_default="0")
+
     # By default order latest posts first
     __mapper_args__ = {
         "order_by": created_at.desc()
     }
 
+    __table_args__ = (
+        # Containment queries on other_data, see BlogContainer.filter_by_data
+        sa.Index("ix_blog_post_other_data", "other_data", postgresql_using="gin", postgresql_ops={"other_data": "jsonb_path_ops"}),
+        # Keyset queries of previous and next posts, see websauna.blog.neighbours
+        sa.Index("ix_blog_post_published_at_id", "published_at", "id"),
+    )
+
     def ensure_slug(self, dbsession) -> str:
         """Make sure post has a slug.
 
@@ -89,8 +107,8 @@ class Post(Base):
             if attempt >= 2:
                 generated_slug += "-" + str(attempt)
 
-            # Check for existing hit
-            if not dbsession.query(Post).filter_by(slug=generated_slug).one_or_none():
+            # Check for existing hit, former slugs of other posts still redirect and are taken
+            if not dbsession.query(Post).filter_by(slug=generated_slug).one_or_none() and not dbsession.query(PostSlugHistory).get(generated_slug):
                 self.slug = generated_slug
                 return self.slug
 
@@ -99,6 +117,22 @@ class Post(Base):
     def get_tag_list(self) -> List[str]:
         return self.tags
 
+    def is_published(self, timestamp: Optional[datetime.datetime] = None) -> bool:
+        """Is this post visible to everyone at ``timestamp``, now by default."""
+        return self.published_at is not None and self.published_at <= (timestamp or now())
+
+    def is_scheduled(self, timestamp: Optional[datetime.datetime] = None) -> bool:
+        """Is this post going to be published after ``timestamp``, now by default."""
+        return self.published_at is not None and self.published_at > (timestamp or now())
+
+    @classmethod
+    def published_clause(cls, timestamp: Optional[datetime.datetime] = None):
+        """SQL condition matching posts visible to everyone, the query counterpart of :py:meth:`is_published`.
+
+        The time is taken in Python, not with SQL ``now()``, so queries agree with permission checks done for the same request.
+        """
+        return sa.and_(cls.published_at != None, cls.published_at <= (timestamp or now()))  # noQA
+
 
 class Tag(Base):
     """Tag model."""
@@ -121,3 +155,59 @@ class Tag(Base):
     #: Human friendly representation of model object.
     def __str__(self) -> str:
         return self.title
+
+
+class PostRevision(Base):
+    """Stored version of a post body.
+
+    Revisions are kept out of the ``Post`` table and are never loaded when a post is read. Each revision stores either a full ``snapshot`` of the body or a ``delta`` against the previous revision, see :py:mod:`websauna.blog.revisions`.
+    """
+
+    __tablename__ = ADDON_PREFIX + "post_revision"
+
+    id = sa.Column(psql.UUID(as_uuid=True), primary_key=True, server_default=sa.text("uuid_generate_v4()"))
+
+    #: Post id. :class:`uuid.UUID`
+    post_id = sa.Column(psql.UUID(as_uuid=True), sa.ForeignKey("blog_post.id", ondelete="CASCADE"), nullable=False)
+
+    #: Running revision number within the post, starting from 1
+    revision = sa.Column(sa.Integer, nullable=False)
+
+    created_at = sa.Column(UTCDateTime, default=now, nullable=False)
+
+    #: Who saved this revision, as plain text
+    author = sa.Column(sa.String(256), nullable=True)
+
+    #: Full body text. Set on every Nth revision.
+    snapshot = sa.Column(sa.Text(), nullable=True)
+
+    #: Line based edit operations against the previous revision. Set when ``snapshot`` is not.
+    delta = sa.Column(psql.JSONB, nullable=True)
+
+    #: Length of the body text of this revision
+    size = sa.Column(sa.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        sa.UniqueConstraint("post_id", "revision"),
+    )
+
+    def is_snapshot(self) -> bool:
+        return self.snapshot is not None
+
+
+class PostSlugHistory(Base):
+    """Former slug of a post.
+
+    Old post URLs redirect to the current slug. Looked up by the primary key only when no post has the slug.
+    """
+
+    __tablename__ = ADDON_PREFIX + "post_slug_history"
+
+    #: Former slug
+    slug = sa.Column(sa.String(256), primary_key=True)
+
+    #: Post id. :class:`uuid.UUID`
+    post_id = sa.Column(psql.UUID(as_uuid=True), sa.ForeignKey("blog_post.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    #: When the post stopped using this slug
+    changed_at = sa.Column(UTCDateTime, default=now, nullable=False)
@@ -0,0 +1,143 @@
+"""Previous and next post links of post pages.
+
+Neighbours are the adjacent published posts in ``(published_at, id)`` order, optionally within one tag of the post. Each is found with one keyset query on the ``(published_at, id)`` index, selecting only the id, title and slug. The result is cached like the post summaries of :py:mod:`websauna.blog.slugcache`, tagged with the keys of the post and both neighbours, so editing or retracting a neighbour drops it.
+
+A post published next to existing posts changes their links too. :py:func:`add_neighbours` adds the posts now next to changed posts, overall and within each of their tags, to the :py:class:`~websauna.blog.events.PostsChanged` event, before cached pages are dropped, proxies purged and the change broadcast. They are found with the same keyset queries as the links. The former neighbours of a post which moved, was retracted or was deleted link to the post, so their cached neighbours and pages carry its key and are dropped with it. Scheduled posts going live are covered by limiting cache times to the schedule.
+"""
+
+# Standard Library
+import typing as t
+import uuid
+
+# Pyramid
+import transaction
+
+# SQLAlchemy
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+# Websauna
+from websauna.system.http import Request
+from websauna.system.model.meta import create_dbsession
+from websauna.utils.time import now
+
+from .cache import get_cache
+from .cache import post_key
+from .cache import tag_key
+from .events import PostsChanged
+from .interfaces import IPurgeBackend
+from .models import AssociationPostsTags
+from .models import Post
+from .models import Tag
+from .pagecache import get_cache_ttl
+from .replica import get_read_dbsession
+from .slugcache import PostSummary
+
+
+def neighbours_key(post_id: uuid.UUID, tag: t.Optional[str] = None) -> str:
+    return "neighbours:{}:{}".format(post_id, tag or "")
+
+
+def find_adjacent(query, published_at, post_id: uuid.UUID) -> tuple:
+    """Keyset probes for the rows before and after a position in a query of published posts.
+
+    :return: Tuple (previous, next), rows or ``None``
+    """
+    position = sa.tuple_(Post.published_at, Post.id)
+    current = sa.tuple_(published_at, post_id)
+    previous = query.filter(position < current).order_by(Post.published_at.desc(), Post.id.desc()).first()
+    next_ = query.filter(position > current).order_by(Post.published_at.asc(), Post.id.asc()).first()
+    return previous, next_
+
+
+def get_neighbours(dbsession: Session, summary: PostSummary, tag: t.Optional[str] = None) -> dict:
+    """Find the published posts before and after a post.
+
+    :return: Dict with ``previous``, ``next`` and ``tag``. Neighbours are dicts with ``id``, ``title`` and ``slug``, or ``None``.
+    """
+    neighbours = {"previous": None, "next": None, "tag": tag}
+    if summary.published_at is None:
+        return neighbours
+
+    q = dbsession.query(Post.id, Post.title, Post.slug).filter(Post.published_clause(now()))
+    if tag:
+        q = q.filter(Post.tags.any(Tag.title == tag))
+
+    previous, next_ = find_adjacent(q, summary.published_at, summary.id)
+    neighbours["previous"] = previous._asdict() if previous else None
+    neighbours["next"] = next_._asdict() if next_ else None
+    return neighbours
+
+
+def lookup_neighbours(request: Request, summary: PostSummary, tag: t.Optional[str] = None) -> dict:
+    """Neighbours of a post from the cache, or the database when not cached."""
+    cache = get_cache(request.registry)
+    key = neighbours_key(summary.id, tag)
+
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    neighbours = get_neighbours(get_read_dbsession(request), summary, tag)
+
+    if cache is not None:
+        tags = [post_key(summary.id)] + [post_key(neighbour["id"]) for neighbour in (neighbours["previous"], neighbours["next"]) if neighbour]
+        if tag:
+            tags.append(tag_key(tag))
+        cache.set(key, neighbours, get_cache_ttl(request, cache), tags=tags)
+
+    return neighbours
+
+
+def get_adjacent_ids(dbsession: Session, post_ids: t.Iterable[uuid.UUID]) -> t.Set[uuid.UUID]:
+    """Published posts next to the given posts among all published posts and within each of their tags.
+
+    Two index probes per post and tag, unpublished and deleted posts have no neighbours.
+    """
+    post_ids = set(post_ids)
+    if not post_ids:
+        return set()
+
+    published = Post.published_clause(now())
+    positions = dbsession.query(Post.id, Post.published_at).filter(Post.id.in_(post_ids), published).all()
+
+    tag_ids = {}
+    for post_id, tag_id in dbsession.query(AssociationPostsTags.post_id, AssociationPostsTags.tag_id).filter(AssociationPostsTags.post_id.in_([post_id for post_id, published_at in positions])):
+        tag_ids.setdefault(post_id, []).append(tag_id)
+
+    overall = dbsession.query(Post.id).filter(published)
+    adjacent = set()
+    for post_id, published_at in positions:
+        queries = [overall]
+        for tag_id in tag_ids.get(post_id, []):
+            tagged = sa.select([AssociationPostsTags.post_id]).where(AssociationPostsTags.tag_id == tag_id)
+            queries.append(overall.filter(Post.id.in_(tagged)))
+
+        for q in queries:
+            adjacent.update(row.id for row in find_adjacent(q, published_at, post_id) if row)
+
+    return adjacent - post_ids
+
+
+def add_neighbours(event: PostsChanged):
+    """Include the posts next to changed posts in the change, as their links may now point to the changed posts.
+
+    Must be subscribed before the subscribers dropping cached content. Remote events were extended by the process which made the change.
+    """
+    registry = event.registry
+    if event.remote or not event.post_ids:
+        return
+
+    if get_cache(registry) is None and registry.queryUtility(IPurgeBackend) is None:
+        return
+
+    tm = transaction.TransactionManager()
+    dbsession = create_dbsession(registry, manager=tm)
+    try:
+        with tm:
+            adjacent = get_adjacent_ids(dbsession, event.post_ids)
+    finally:
+        dbsession.close()
+
+    event.update(post_ids=adjacent)
@@ -0,0 +1,211 @@
+"""Whole page cache of the public blog pages.
+
+Pages rendered for anonymous visitors are stored in the configured :py:mod:`cache backend <websauna.blog.cache>` for ``blog.cache.ttl`` seconds (default one hour). Pages are dropped when a :py:class:`~websauna.blog.events.PostsChanged` event touches posts or tags they show.
+
+Page bodies are compressed with gzip, and with brotli if the ``brotli`` package is installed, when they are stored. Cached pages are served in the best encoding the client accepts, so compression is paid once per content change.
+
+Scheduled posts go live without any event. Every cached page therefore expires at the latest when the next scheduled post becomes published, so long TTLs do not delay timed launches.
+"""
+
+# Standard Library
+import datetime
+import functools
+import gzip
+import math
+import typing as t
+from urllib.parse import urlencode
+
+# Pyramid
+from pyramid.registry import Registry
+from pyramid.response import Response
+
+# SQLAlchemy
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+# Websauna
+from websauna.system.http import Request
+from websauna.utils.time import now
+
+from .cache import ROLL_KEY
+from .cache import get_cache
+from .cache import get_changed_keys
+from .cache import post_key
+from .cache import tag_key
+from .events import PostsChanged
+from .interfaces import IBlogCache
+from .models import Post
+from .replica import get_read_dbsession
+
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+#: Cache key of the publishing time of the next scheduled post
+SCHEDULE_KEY = "schedule"
+
+#: Query parameters that change the page content, all others are ignored
+PAGE_PARAMS = ("batch_num", "batch_size", "multicolumn", "tag")
+
+#: Bodies shorter than this are not worth compressing, bytes
+MIN_COMPRESS_SIZE = 512
+
+
+def get_default_ttl(registry: Registry) -> int:
+    return int(registry.settings.get("blog.cache.ttl", 3600))
+
+
+def get_next_publish_time(dbsession: Session, timestamp: t.Optional[datetime.datetime] = None) -> t.Optional[datetime.datetime]:
+    """When the next scheduled post goes live, ``None`` if nothing is scheduled."""
+    return dbsession.query(sa.func.min(Post.published_at)).filter(Post.published_at > (timestamp or now())).scalar()
+
+
+def seconds_until(timestamp: datetime.datetime, current: datetime.datetime) -> int:
+    return max(1, math.ceil((timestamp - current).total_seconds()))
+
+
+def limit_to_schedule(request: Request, ttl: int, cache: t.Optional[IBlogCache] = None) -> int:
+    """Shorten ``ttl`` seconds if a scheduled post goes live sooner.
+
+    With ``cache`` the schedule is cached too, so this costs one database query per schedule change.
+    """
+    current = now()
+
+    schedule = cache.get(SCHEDULE_KEY) if cache else None
+    if schedule is None or (schedule["next"] and schedule["next"] <= current):
+        schedule = {"next": get_next_publish_time(get_read_dbsession(request), current)}
+        if cache:
+            schedule_ttl = seconds_until(schedule["next"], current) if schedule["next"] else ttl
+            cache.set(SCHEDULE_KEY, schedule, max(1, min(ttl, schedule_ttl)), tags=[ROLL_KEY])
+
+    if schedule["next"]:
+        ttl = min(ttl, seconds_until(schedule["next"], current))
+
+    return ttl
+
+
+def get_cache_ttl(request: Request, cache: IBlogCache) -> int:
+    """How long content rendered now can be cached: the default TTL, or less if a scheduled post goes live sooner."""
+    return limit_to_schedule(request, get_default_ttl(request.registry), cache)
+
+
+def is_cacheable_request(request: Request) -> bool:
+    """Only anonymous page loads are cached, logged in users may see drafts and admin controls."""
+    return request.method in ("GET", "HEAD") and request.authenticated_userid is None
+
+
+def get_page_key(request: Request) -> str:
+    params = sorted((key, value) for key, value in request.GET.items() if key in PAGE_PARAMS)
+    if params:
+        return "page:{}?{}".format(request.path, urlencode(params))
+    return "page:{}".format(request.path)
+
+
+def get_page_tags(context, request: Request) -> t.List[str]:
+    """Cache tags of a page: the post, its tags and its neighbours on post pages, the roll on listing pages."""
+    post = getattr(context, "summary", None)
+    if post is not None:
+        neighbours = context.neighbours
+        tags = [post_key(post.id)] + [tag_key(title) for title in post.tags]
+        return tags + [post_key(neighbour["id"]) for neighbour in (neighbours["previous"], neighbours["next"]) if neighbour]
+
+    tags = [ROLL_KEY]
+    if request.matchdict and "tag" in request.matchdict:
+        tags.append(tag_key(request.matchdict["tag"]))
+    return tags
+
+
+def compress_body(body: bytes) -> t.Dict[str, bytes]:
+    """Create compressed variants of a page body.
+
+    :return: Map of content encoding to compressed body, only variants smaller than the body
+    """
+    variants = {}
+    if len(body) < MIN_COMPRESS_SIZE:
+        return variants
+
+    variants["gzip"] = gzip.compress(body, compresslevel=9)
+    if brotli:
+        variants["br"] = brotli.compress(body)
+
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(body)}
+
+
+def get_accepted_encodings(request: Request) -> t.Set[str]:
+    """Content encodings listed in ``Accept-Encoding`` without ``q=0``."""
+    accepted = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        name, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        name = name.strip().lower()
+        if name and quality > 0:
+            accepted.add(name)
+    return accepted
+
+
+def make_response(request: Request, entry: dict) -> Response:
+    """Serve a cache entry in the best encoding the client accepts."""
+    accepted = get_accepted_encodings(request)
+    for encoding in ("br", "gzip"):
+        body = entry["encoded"].get(encoding)
+        if body is not None and (encoding in accepted or "*" in accepted):
+            response = Response(body=body, headerlist=[("Content-Type", entry["content_type"])])
+            response.content_encoding = encoding
+            break
+    else:
+        response = Response(body=entry["body"], headerlist=[("Content-Type", entry["content_type"])])
+
+    response.vary = ("Accept-Encoding",)
+    return response
+
+
+def page_cache(view):
+    """View decorator serving anonymous visitors from the page cache.
+
+    Use as ``@view_config(decorator=page_cache)``. Permissions are checked before the decorator is called, so cached pages are only served to those allowed to view them.
+    """
+
+    @functools.wraps(view)
+    def wrapper(context, request: Request):
+        cache = get_cache(request.registry)
+        if cache is None or not is_cacheable_request(request):
+            return view(context, request)
+
+        key = get_page_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            response = make_response(request, entry)
+            response.headers["X-Blog-Cache"] = "hit"
+            return response
+
+        response = view(context, request)
+
+        # Do not share pages which set a session or other cookie
+        if response.status_code == 200 and "Set-Cookie" not in response.headers and not response.content_encoding:
+            body = response.body
+            entry = {"body": body, "encoded": compress_body(body), "content_type": response.headers["Content-Type"]}
+            cache.set(key, entry, get_cache_ttl(request, cache), tags=get_page_tags(context, request))
+            response = make_response(request, entry)
+            response.headers["X-Blog-Cache"] = "miss"
+
+        return response
+
+    return wrapper
+
+
+def invalidate_changed(event: PostsChanged):
+    """Drop cached pages showing changed posts or tags."""
+    cache = get_cache(event.registry)
+    if cache is not None:
+        cache.invalidate_tags(get_changed_keys(event))
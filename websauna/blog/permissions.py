@@ -0,0 +1,65 @@
+"""Per-request memo of permission checks on blog resources.
+
+Rolls check the ``view`` permission of every listed post and templates check ``edit`` again for admin controls. Each ``request.has_permission()`` call goes through the authentication policy for the principals and walks the ACLs of the resource lineage.
+
+With ACL authorization the answer depends only on the principals, which stay the same for the request, and on the ACLs along the lineage. :py:func:`has_permission` remembers answers on the request by the permission and the ACLs, so all published posts in a roll, which share an ACL, are checked once. Other authorization policies are asked every time.
+"""
+
+# Standard Library
+import typing as t
+
+# Pyramid
+from pyramid.authorization import ACLAuthorizationPolicy
+from pyramid.interfaces import IAuthorizationPolicy
+from pyramid.location import lineage
+from pyramid.security import ALL_PERMISSIONS
+
+# Websauna
+from websauna.system.http import Request
+
+
+def get_acl_signature(context) -> tuple:
+    """ACLs of a resource and its parents as a hashable value."""
+    signature = []
+    for location in lineage(context):
+        acl = getattr(location, "__acl__", None)
+        if acl is None:
+            continue
+        if callable(acl):
+            acl = acl()
+
+        aces = []
+        for action, principal, permissions in acl:
+            if permissions is not ALL_PERMISSIONS and not isinstance(permissions, str):
+                permissions = tuple(permissions)
+            aces.append((action, principal, permissions))
+        signature.append(tuple(aces))
+
+    return tuple(signature)
+
+
+def has_permission(request: Request, permission: str, context: t.Optional[object] = None):
+    """Memoized ``request.has_permission()``.
+
+    :param context: Defaults to the context of the request
+    """
+    if context is None:
+        context = request.context
+
+    if not isinstance(request.registry.queryUtility(IAuthorizationPolicy), ACLAuthorizationPolicy):
+        return request.has_permission(permission, context)
+
+    memo = getattr(request, "_blog_permissions", None)
+    if memo is None:
+        memo = request._blog_permissions = {}
+
+    try:
+        key = (permission, get_acl_signature(context))
+        allowed = memo.get(key)
+    except TypeError:
+        # Unhashable principals or permissions in a custom ACL
+        return request.has_permission(permission, context)
+
+    if allowed is None:
+        allowed = memo[key] = request.has_permission(permission, context)
+    return allowed
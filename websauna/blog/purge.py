@@ -0,0 +1,110 @@
+"""Purge changed pages from a caching proxy such as Varnish or a CDN.
+
+Configured with ``blog.purge`` settings::
+
+    # off (default) or http
+    blog.purge = http
+
+    # Proxies receiving purge requests, whitespace separated
+    blog.purge.urls = http://varnish1/ http://varnish2/
+
+    # HTTP method of purge requests, PURGE or BAN
+    blog.purge.method = PURGE
+
+    # Header listing the keys to purge, defaults to the surrogate key header
+    blog.purge.header = xkey-purge
+
+After a transaction changing posts commits, every proxy gets requests listing the surrogate keys of changed posts and tags, see :py:func:`websauna.blog.cache.get_changed_keys`. Requests are sent from a background thread, so slow or unreachable proxies do not hold up the request which made the change.
+"""
+
+# Standard Library
+import logging
+import threading
+import typing as t
+import urllib.request
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+
+# Pyramid
+from pyramid.registry import Registry
+from zope.interface import implementer
+
+from .cache import get_changed_keys
+from .events import PostsChanged
+from .httpcaching import get_surrogate_key_header
+from .interfaces import IPurgeBackend
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+@implementer(IPurgeBackend)
+class HTTPPurger:
+    """Send purge requests with keys in a header."""
+
+    #: Keys per request, to keep the header size within proxy limits
+    max_keys = 100
+
+    def __init__(self, urls: t.List[str], method: str = "PURGE", header: str = "Surrogate-Key", timeout: float = 5.0):
+        self.urls = urls
+        self.method = method
+        self.header = header
+        self.timeout = timeout
+
+    def send(self, url: str, keys: t.List[str]):
+        request = urllib.request.Request(url, method=self.method, headers={self.header: " ".join(keys)})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def purge(self, keys: t.Iterable[str]):
+        """Purge keys from every proxy. Failures are logged, a proxy being down must not fail the request which changed the content."""
+        keys = list(keys)
+        for url in self.urls:
+            for idx in range(0, len(keys), self.max_keys):
+                chunk = keys[idx:idx + self.max_keys]
+                try:
+                    self.send(url, chunk)
+                except OSError as e:
+                    logger.error("Could not purge %d keys from %s: %s", len(chunk), url, e)
+
+
+def create_purger(registry: Registry) -> t.Optional[IPurgeBackend]:
+    """Create the purge backend configured in the settings."""
+    settings = registry.settings
+    backend = settings.get("blog.purge", "off")
+
+    if backend == "http":
+        return HTTPPurger(
+            urls=settings.get("blog.purge.urls", "").split(),
+            method=settings.get("blog.purge.method", "PURGE"),
+            header=settings.get("blog.purge.header", get_surrogate_key_header(registry)),
+            timeout=float(settings.get("blog.purge.timeout", 5)))
+    elif backend == "off":
+        return None
+
+    raise RuntimeError("Unknown blog.purge backend: {}".format(backend))
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Background thread created on first use, so that it runs in the forked web server worker."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1)
+        return _executor
+
+
+def purge_changed(event: PostsChanged) -> t.Optional[Future]:
+    """Purge pages showing changed posts or tags from the proxies in the background.
+
+    Remote events were purged by the process which made the change.
+
+    :return: Future of the purge, ``None`` if nothing is purged
+    """
+    purger = event.registry.queryUtility(IPurgeBackend)
+    if purger is None or event.remote:
+        return None
+    return get_executor().submit(purger.purge, get_changed_keys(event))
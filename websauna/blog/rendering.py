@@ -0,0 +1,184 @@
+"""Markdown rendering in a bounded process pool.
+
+A pathological body, like a huge table or deeply nested lists, can keep ``markdown`` busy for seconds. Rendering runs in a pool of ``blog.rendering.processes`` worker processes (default 2, ``0`` renders in the calling thread) and waits at most ``blog.rendering.timeout`` seconds (default 5). Bodies longer than ``blog.rendering.max_size`` characters (default 500000) are not rendered at all. With ``blog.rendering.highlight`` fenced code blocks are syntax highlighted, see :py:mod:`websauna.blog.highlight`.
+
+At most one render per worker is handed to the pool at a time, so a render starts right away and the timeout only counts the rendering. Callers wait for a free worker at most ``blog.rendering.queue_timeout`` seconds (default 30).
+
+A failed, too slow or too large render degrades to the escaped body text. On a timeout new renders go to a fresh pool, and the old pool with the stuck worker is killed once the renders still running in it have finished.
+"""
+
+# Standard Library
+import atexit
+import html
+import logging
+import multiprocessing
+import multiprocessing.pool
+import threading
+import typing as t
+
+# Pyramid
+from pyramid.registry import Registry
+from pyramid.settings import asbool
+from zope.interface import implementer
+
+from .interfaces import IMarkdownRenderer
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Markdown extensions used for post bodies
+EXTENSIONS = ["markdown.extensions.toc"]
+
+#: Extra Markdown extensions used when code is highlighted
+HIGHLIGHT_EXTENSIONS = ["markdown.extensions.fenced_code", "websauna.blog.highlight:HighlightExtension"]
+
+
+def render_markdown(text: str, highlight: bool = False) -> t.Tuple[str, t.List[dict]]:
+    """Render Markdown in the current process.
+
+    :param highlight: Highlight fenced code blocks
+    :return: Tuple (HTML, table of contents tokens)
+    """
+    # Imported on first use, most processes never render
+    import markdown
+
+    md = markdown.Markdown(extensions=EXTENSIONS + HIGHLIGHT_EXTENSIONS if highlight else EXTENSIONS)
+    body_html = md.convert(text or "")
+    return body_html, getattr(md, "toc_tokens", [])
+
+
+def render_as_text(text: str) -> str:
+    """Fallback rendering when Markdown cannot be rendered."""
+    return '<pre class="body-text">{}</pre>'.format(html.escape(text or ""))
+
+
+class RenderFailed(Exception):
+    """Markdown could not be rendered in time or at all."""
+
+
+@implementer(IMarkdownRenderer)
+class PoolRenderer:
+    """Render Markdown in worker processes with a size limit and a timeout."""
+
+    def __init__(self, processes: int = 2, timeout: float = 5.0, max_size: int = 500000, highlight: bool = False, queue_timeout: float = 30.0):
+        self.processes = processes
+        self.timeout = timeout
+        self.max_size = max_size
+        self.highlight = highlight
+        self.queue_timeout = queue_timeout
+        self.pool = None
+        self.lock = threading.Lock()
+        #: One slot per worker, taken for the whole render
+        self.slots = threading.BoundedSemaphore(max(processes, 1))
+        #: Renders in progress by pool
+        self.running = {}
+        #: Replaced pools to terminate when their last render is done
+        self.retired = set()
+        self.atexit_registered = False
+
+    def checkout_pool(self) -> multiprocessing.pool.Pool:
+        """Pool for a render, started on first use so that it belongs to the forked web server worker. Pair with :py:meth:`release_pool`."""
+        with self.lock:
+            if self.pool is None:
+                # Spawned processes do not inherit database connections or threads of the web process
+                self.pool = multiprocessing.get_context("spawn").Pool(self.processes)
+                if not self.atexit_registered:
+                    atexit.register(self.close)
+                    self.atexit_registered = True
+            pool = self.pool
+            self.running[pool] = self.running.get(pool, 0) + 1
+            return pool
+
+    def release_pool(self, pool: multiprocessing.pool.Pool):
+        """Render in the pool is done, terminate the pool if it was retired and this was its last render."""
+        with self.lock:
+            if pool not in self.running:
+                # Closed meanwhile
+                return
+            self.running[pool] -= 1
+            if self.running[pool]:
+                return
+            del self.running[pool]
+            if pool not in self.retired:
+                return
+            self.retired.remove(pool)
+        pool.terminate()
+
+    def retire_pool(self, pool: multiprocessing.pool.Pool):
+        """Send new renders to a fresh pool, leaving the renders running in this one to finish."""
+        with self.lock:
+            if self.pool is pool:
+                self.pool = None
+                self.retired.add(pool)
+                pool.close()
+
+    def close(self):
+        with self.lock:
+            pools = set(self.running) | self.retired | ({self.pool} if self.pool else set())
+            self.pool = None
+            self.running = {}
+            self.retired = set()
+        for pool in pools:
+            pool.terminate()
+
+    def render_strict(self, text: str) -> t.Tuple[str, t.List[dict]]:
+        """Render or raise :py:class:`RenderFailed`."""
+        text = text or ""
+        if len(text) > self.max_size:
+            raise RenderFailed("Body is {} characters, the limit is {}".format(len(text), self.max_size))
+
+        if not self.processes:
+            return render_markdown(text, self.highlight)
+
+        # Wait for a free worker here, so that the render starts as soon as it is handed to the pool
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            raise RenderFailed("No free rendering process in {} seconds".format(self.queue_timeout))
+
+        try:
+            pool = self.checkout_pool()
+            try:
+                # Workers live as long as the pool, so their cache of highlighted code blocks is reused
+                result = pool.apply_async(render_markdown, (text, self.highlight))
+                return result.get(self.timeout)
+            except multiprocessing.TimeoutError as e:
+                # The worker is stuck, leave it behind with the pool
+                self.retire_pool(pool)
+                raise RenderFailed("Rendering took over {} seconds".format(self.timeout)) from e
+            except Exception as e:
+                raise RenderFailed(str(e)) from e
+            finally:
+                self.release_pool(pool)
+        finally:
+            self.slots.release()
+
+    def render(self, text: str) -> t.Tuple[str, t.List[dict], bool]:
+        """Render Markdown, degrading to escaped text.
+
+        :return: Tuple (HTML, table of contents tokens, whether rendering succeeded)
+        """
+        try:
+            body_html, toc = self.render_strict(text)
+            return body_html, toc, True
+        except RenderFailed as e:
+            logger.warning("Showing Markdown as plain text: %s", e)
+            return render_as_text(text), [], False
+
+
+def create_renderer(registry: Registry) -> IMarkdownRenderer:
+    settings = registry.settings
+    return PoolRenderer(
+        processes=int(settings.get("blog.rendering.processes", 2)),
+        timeout=float(settings.get("blog.rendering.timeout", 5)),
+        max_size=int(settings.get("blog.rendering.max_size", 500000)),
+        highlight=asbool(settings.get("blog.rendering.highlight", False)),
+        queue_timeout=float(settings.get("blog.rendering.queue_timeout", 30)))
+
+
+#: Used when the addon has not been configured, e.g. in scripts
+_default_renderer = PoolRenderer(processes=0)
+
+
+def get_renderer(registry: t.Optional[Registry]) -> IMarkdownRenderer:
+    renderer = registry.queryUtility(IMarkdownRenderer) if registry is not None else None
+    return renderer or _default_renderer
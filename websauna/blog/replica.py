@@ -0,0 +1,112 @@
+"""Read replica for public blog views.
+
+When ``blog.read_replica_url`` is set, the blog roll, tag rolls, post pages and feeds read through :py:func:`get_read_dbsession`, which gives a read-only session of the replica instead of ``request.dbsession`` of the primary. Admin views and writes always use the primary.
+
+A replica lags behind the primary, so reads go to the primary for ``blog.read_replica.sticky_seconds`` (default 10) after content changes:
+
+* in the browser which made the change, marked with a cookie, so an editor who just published sees the post
+
+* in every process which received the :py:class:`~websauna.blog.events.PostsChanged` event, so a dropped cache entry is not filled again from stale replica data
+
+The replica engine runs ``REPEATABLE READ`` transactions, as hot standby servers do not support ``SERIALIZABLE``, and every transaction is read-only, so the replica can be tested with a second database or even the primary itself.
+"""
+
+# Standard Library
+import threading
+import time
+import typing as t
+
+# Pyramid
+from pyramid.registry import Registry
+from zope.interface import implementer
+
+# SQLAlchemy
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+# Websauna
+from websauna.system.http import Request
+from websauna.system.model.json import json_serializer
+
+from .events import PostsChanged
+from .interfaces import IReadReplica
+
+
+#: Cookie telling until when the browser reads from the primary, UNIX time
+STICKY_COOKIE = "blog_primary_until"
+
+
+@implementer(IReadReplica)
+class ReadReplica:
+    """Engine of the replica database and the time until which this process prefers the primary."""
+
+    def __init__(self, url: str, sticky_seconds: int = 10):
+        self.engine = sa.create_engine(
+            url,
+            connect_args={"options": "-c timezone=utc -c default_transaction_read_only=on"},
+            client_encoding="utf8",
+            isolation_level="REPEATABLE READ",
+            json_serializer=json_serializer)
+        self.sticky_seconds = sticky_seconds
+        self.primary_until = 0
+        self.lock = threading.Lock()
+
+    def create_dbsession(self) -> Session:
+        return Session(bind=self.engine, autoflush=False)
+
+    def stick_to_primary(self) -> float:
+        """Read from the primary for a while in this process.
+
+        :return: UNIX time until reads go to the primary
+        """
+        with self.lock:
+            self.primary_until = max(self.primary_until, time.time() + self.sticky_seconds)
+            return self.primary_until
+
+    def is_stale(self) -> bool:
+        return time.time() < self.primary_until
+
+
+def create_read_replica(registry: Registry) -> t.Optional[IReadReplica]:
+    """Create a read replica if ``blog.read_replica_url`` is set."""
+    settings = registry.settings
+    url = settings.get("blog.read_replica_url", "").strip()
+    if not url:
+        return None
+    return ReadReplica(url, int(settings.get("blog.read_replica.sticky_seconds", 10)))
+
+
+def is_sticky(request: Request) -> bool:
+    """Did the browser change content a moment ago."""
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def get_read_dbsession(request: Request) -> Session:
+    """Session for public read-only views: the replica if configured and fresh enough, otherwise the primary."""
+    replica = request.registry.queryUtility(IReadReplica)
+    if replica is None or replica.is_stale() or is_sticky(request):
+        return request.dbsession
+
+    dbsession = getattr(request, "_blog_read_dbsession", None)
+    if dbsession is None:
+        dbsession = request._blog_read_dbsession = replica.create_dbsession()
+        request.add_finished_callback(lambda request: dbsession.close())
+    return dbsession
+
+
+def stick_to_primary(event: PostsChanged):
+    """Route reads to the primary while the replica catches up with the change."""
+    replica = event.registry.queryUtility(IReadReplica)
+    if replica is None:
+        return
+
+    primary_until = replica.stick_to_primary()
+    if event.request is not None:
+
+        def set_cookie(request, response):
+            response.set_cookie(STICKY_COOKIE, "{:.0f}".format(primary_until), max_age=replica.sticky_seconds, httponly=True)
+
+        event.request.add_response_callback(set_cookie)
@@ -0,0 +1,144 @@
+"""Delta compressed revision history of post bodies.
+
+Each saved body is stored as a list of line based edit operations against the previous revision:
+
+* ``["=", n]`` copy next ``n`` lines of the previous revision
+
+* ``["-", n]`` skip next ``n`` lines of the previous revision
+
+* ``["+", [line, ...]]`` insert lines
+
+Every ``blog.revisions.snapshot_interval`` revisions (default 10) the full body is stored instead, so rebuilding any revision applies at most that many deltas.
+"""
+
+# Standard Library
+import difflib
+import typing as t
+import uuid
+
+# Pyramid
+from pyramid.registry import Registry
+
+# SQLAlchemy
+import sqlalchemy as sa
+from sqlalchemy.orm import Query
+from sqlalchemy.orm import Session
+
+from .models import Post
+from .models import PostRevision
+
+
+def compute_delta(old: str, new: str) -> t.List[list]:
+    """Compute edit operations turning ``old`` text to ``new``."""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+
+    delta = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append(["=", i2 - i1])
+        else:
+            if i2 > i1:
+                delta.append(["-", i2 - i1])
+            if j2 > j1:
+                delta.append(["+", new_lines[j1:j2]])
+    return delta
+
+
+def apply_delta(old: str, delta: t.List[list]) -> str:
+    """Apply edit operations created by :py:func:`compute_delta`."""
+    old_lines = old.splitlines(keepends=True)
+    result = []
+    pos = 0
+    for op, arg in delta:
+        if op == "=":
+            result.extend(old_lines[pos:pos + arg])
+            pos += arg
+        elif op == "-":
+            pos += arg
+        elif op == "+":
+            result.extend(arg)
+        else:
+            raise ValueError("Unknown delta operation: {}".format(op))
+    return "".join(result)
+
+
+def get_snapshot_interval(registry: Registry) -> int:
+    return int(registry.settings.get("blog.revisions.snapshot_interval", 10))
+
+
+def get_revisions(dbsession: Session, post_id: uuid.UUID) -> Query:
+    """List revisions of a post, latest first, without loading snapshot or delta data.
+
+    :return: Query of tuples (revision, is snapshot)
+    """
+    q = dbsession.query(PostRevision, PostRevision.snapshot.isnot(None).label("is_snapshot")).filter_by(post_id=post_id)
+    return q.options(sa.orm.defer("snapshot"), sa.orm.defer("delta")).order_by(PostRevision.revision.desc())
+
+
+def _add_revision(dbsession: Session, post: Post, number: int, body: str, previous_body: t.Optional[str], snapshot_interval: int, author: t.Optional[str]) -> PostRevision:
+    revision = PostRevision(post_id=post.id, revision=number, author=author, size=len(body))
+    if previous_body is None or (number - 1) % snapshot_interval == 0:
+        revision.snapshot = body
+    else:
+        revision.delta = compute_delta(previous_body, body)
+    dbsession.add(revision)
+    return revision
+
+
+def record_revision(dbsession: Session, post: Post, previous_body: t.Optional[str], snapshot_interval: int = 10, author: t.Optional[str] = None) -> t.Optional[PostRevision]:
+    """Store the current body of a post as a new revision.
+
+    Call after the post body has been changed. The post row is locked until the transaction ends, so concurrent saves of the same post get consecutive revision numbers.
+
+    :param previous_body: Body before the change. ``None`` for new posts. Only used for posts without revisions, otherwise the delta is computed against the latest stored revision, which may come from a concurrent save.
+    :return: The new revision or ``None`` if the body did not change
+    """
+    assert post.id, "Post must be flushed before recording revisions"
+
+    dbsession.query(Post.id).filter(Post.id == post.id).with_for_update().one()
+
+    latest = dbsession.query(sa.func.max(PostRevision.revision)).filter_by(post_id=post.id).scalar() or 0
+    body = post.body or ""
+
+    if latest:
+        base = rebuild_body(dbsession, post.id, latest)
+        if base == body:
+            return None
+    elif previous_body is not None and previous_body != body:
+        # Post written before the revision history existed, keep what it was
+        _add_revision(dbsession, post, 1, previous_body, None, snapshot_interval, author=None)
+        latest = 1
+        base = previous_body
+    else:
+        base = None
+
+    return _add_revision(dbsession, post, latest + 1, body, base, snapshot_interval, author)
+
+
+def rebuild_body(dbsession: Session, post_id: uuid.UUID, number: int) -> str:
+    """Get post body as it was in a revision.
+
+    :raise KeyError: If there is no such revision
+    """
+    snapshot_number = dbsession.query(sa.func.max(PostRevision.revision)).filter(
+        PostRevision.post_id == post_id,
+        PostRevision.snapshot != None,  # noQA
+        PostRevision.revision <= number).scalar()
+
+    if not snapshot_number:
+        raise KeyError(number)
+
+    revisions = dbsession.query(PostRevision.revision, PostRevision.snapshot, PostRevision.delta).filter(
+        PostRevision.post_id == post_id,
+        PostRevision.revision >= snapshot_number,
+        PostRevision.revision <= number).order_by(PostRevision.revision).all()
+
+    if revisions[-1].revision != number:
+        raise KeyError(number)
+
+    body = revisions[0].snapshot
+    for revision in revisions[1:]:
+        body = apply_delta(body, revision.delta)
+    return body
@@ -0,0 +1 @@
+"""Command line scripts of the blog addon."""
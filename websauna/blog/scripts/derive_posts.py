@@ -0,0 +1,40 @@
+"""ws-blog-derive script.
+
+Compute the derived values of existing posts, see :py:mod:`websauna.blog.derivatives`.
+"""
+# Standard Library
+import argparse
+import sys
+import typing as t
+
+# Websauna
+from websauna.blog.derivatives import BATCH_SIZE
+from websauna.blog.derivatives import run_update
+from websauna.blog.models import Post
+from websauna.system.devop.cmdline import init_websauna
+from websauna.system.devop.cmdline import prepare_config_uri
+
+
+def main(argv: t.List[str] = sys.argv):
+    """Compute post derivatives from command line.
+
+    :param argv: Command line arguments, second one needs to be the uri to a configuration file.
+    :raises sys.SystemExit:
+    """
+    parser = argparse.ArgumentParser(description="Compute rendered HTML, reading time, table of contents and excerpts of posts whose values are missing or out of date.")
+    parser.add_argument("config_uri", help="Configuration file, e.g. ws://conf/production.ini")
+    parser.add_argument("--force", action="store_true", help="Recompute up to date posts too")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Posts updated per transaction")
+    args = parser.parse_args(argv[1:])
+
+    request = init_websauna(prepare_config_uri(args.config_uri))
+
+    with request.tm:
+        post_ids = [post_id for post_id, in request.dbsession.query(Post.id).order_by(Post.id)]
+
+    updated = run_update(request.registry, post_ids, force=args.force, batch_size=args.batch_size)
+    print("Updated derived values of {} of {} posts".format(updated, len(post_ids)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
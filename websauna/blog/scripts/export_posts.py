@@ -0,0 +1,56 @@
+"""ws-blog-export script.
+
+Export blog posts as JSON Lines or as a directory of Markdown files with YAML front matter.
+"""
+# Standard Library
+import argparse
+import datetime
+import sys
+import typing as t
+
+# Websauna
+from websauna.blog.exporter import export_jsonl
+from websauna.blog.exporter import export_markdown
+from websauna.blog.importer import parse_date
+from websauna.system.devop.cmdline import init_websauna
+from websauna.system.devop.cmdline import prepare_config_uri
+
+
+def parse_since(value: str) -> datetime.datetime:
+    try:
+        return parse_date(value)
+    except Exception as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main(argv: t.List[str] = sys.argv):
+    """Export blog posts from command line.
+
+    :param argv: Command line arguments, second one needs to be the uri to a configuration file.
+    :raises sys.SystemExit:
+    """
+    parser = argparse.ArgumentParser(description="Export blog posts with their tags and metadata.")
+    parser.add_argument("config_uri", help="Configuration file, e.g. ws://conf/production.ini")
+    parser.add_argument("output", help="Output file for jsonl format (- for stdout), output directory for markdown format")
+    parser.add_argument("--format", choices=("jsonl", "markdown"), default="jsonl")
+    parser.add_argument("--since", type=parse_since, default=None, help="Only export posts created or updated since this UTC time, e.g. 2018-05-01 or 2018-05-01T12:00:00")
+    parser.add_argument("--batch-size", type=int, default=500, help="Posts fetched from the database at a time")
+    args = parser.parse_args(argv[1:])
+
+    request = init_websauna(prepare_config_uri(args.config_uri))
+
+    # Server side cursors must run inside a transaction
+    with request.tm:
+        if args.format == "markdown":
+            count = export_markdown(request.dbsession, args.output, since=args.since, batch_size=args.batch_size)
+        elif args.output == "-":
+            count = export_jsonl(request.dbsession, sys.stdout, since=args.since, batch_size=args.batch_size)
+        else:
+            with open(args.output, "wt", encoding="utf-8") as out:
+                count = export_jsonl(request.dbsession, out, since=args.since, batch_size=args.batch_size)
+
+    print("Exported {} posts".format(count), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""ws-blog-import script.
+
+Import a directory of Markdown files with YAML front matter as blog posts.
+"""
+# Standard Library
+import argparse
+import sys
+import time
+import typing as t
+
+# Websauna
+from websauna.blog.importer import ImportStats
+from websauna.blog.importer import import_archive
+from websauna.system.devop.cmdline import init_websauna
+from websauna.system.devop.cmdline import prepare_config_uri
+from websauna.system.devop.scripts import feedback_and_exit
+
+
+def main(argv: t.List[str] = sys.argv):
+    """Import blog posts from command line.
+
+    :param argv: Command line arguments, second one needs to be the uri to a configuration file.
+    :raises sys.SystemExit:
+    """
+    parser = argparse.ArgumentParser(description="Import Markdown files with YAML front matter as blog posts. Posts with an existing slug are skipped, so the import can be resumed by running it again. Cached pages are refreshed and derived values of imported posts are computed with the configured blog.derivatives.runner.")
+    parser.add_argument("config_uri", help="Configuration file, e.g. ws://conf/production.ini")
+    parser.add_argument("directory", help="Directory tree of Markdown files")
+    parser.add_argument("--batch-size", type=int, default=200, help="Posts inserted per transaction")
+    args = parser.parse_args(argv[1:])
+
+    request = init_websauna(prepare_config_uri(args.config_uri))
+    started = time.time()
+
+    def progress(stats: ImportStats):
+        rate = stats.processed / max(time.time() - started, 0.001)
+        print("{} ({:.0f} files/s)".format(stats, rate), flush=True)
+
+    stats = import_archive(request.dbsession, args.directory, batch_size=args.batch_size, tm=request.tm, progress=progress, registry=request.registry)
+    feedback_and_exit(str(stats), status_code=1 if stats.failed else None, display_border=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Slug to post lookup shared across requests.
+
+Traversing to a post needs only a few of its fields: the id, publishing time for permissions, and timestamps and tags for HTTP validators and cache keys. These are kept as :py:class:`PostSummary` in the :py:mod:`blog cache <websauna.blog.cache>` under the slug, and the full post is loaded only when a page is actually rendered.
+
+Former slugs resolve to :py:class:`MovedSlug` of the post's current slug. The slug history is read only when no post has the slug. Unknown slugs are cached too, for ``blog.cache.negative_ttl`` seconds (default one minute), so floods of bad URLs do not reach the database. Summaries are dropped with the post and tag keys, and entries of slugs listed in :py:class:`~websauna.blog.events.PostsChanged` are deleted, so new posts and slug edits show up immediately.
+"""
+
+# Standard Library
+import datetime
+import typing as t
+import uuid
+
+# Pyramid
+from pyramid.registry import Registry
+
+# Websauna
+from websauna.system.http import Request
+from websauna.utils.time import now
+
+from .cache import get_cache
+from .cache import post_key
+from .cache import tag_key
+from .events import PostsChanged
+from .models import Post
+from .pagecache import get_default_ttl
+from .replica import get_read_dbsession
+from .slughistory import find_moved_post
+
+
+#: Cached value of slugs without a post
+NOT_FOUND = False
+
+
+class PostSummary:
+    """Fields of a post needed before the post itself is loaded."""
+
+    __slots__ = ("id", "slug", "created_at", "published_at", "updated_at", "tags")
+
+    def __init__(self, id: uuid.UUID, slug: str, created_at: datetime.datetime, published_at: t.Optional[datetime.datetime], updated_at: t.Optional[datetime.datetime], tags: t.List[str]):
+        self.id = id
+        self.slug = slug
+        self.created_at = created_at
+        self.published_at = published_at
+        self.updated_at = updated_at
+
+        #: Tag titles
+        self.tags = tags
+
+    @classmethod
+    def from_post(cls, post: Post) -> "PostSummary":
+        return cls(post.id, post.slug, post.created_at, post.published_at, post.updated_at, [tag.title for tag in post.tags])
+
+    def is_published(self, timestamp: t.Optional[datetime.datetime] = None) -> bool:
+        """Same as :py:meth:`websauna.blog.models.Post.is_published`."""
+        return self.published_at is not None and self.published_at <= (timestamp or now())
+
+    def __repr__(self):
+        return "<PostSummary {} {}>".format(self.id, self.slug)
+
+
+class MovedSlug:
+    """Former slug of a post."""
+
+    __slots__ = ("post_id", "slug")
+
+    def __init__(self, post_id: uuid.UUID, slug: str):
+        self.post_id = post_id
+
+        #: Current slug of the post
+        self.slug = slug
+
+    def __repr__(self):
+        return "<MovedSlug {} {}>".format(self.post_id, self.slug)
+
+
+def slug_key(slug: str) -> str:
+    return "slug:{}".format(slug)
+
+
+def get_negative_ttl(registry: Registry) -> int:
+    return int(registry.settings.get("blog.cache.negative_ttl", 60))
+
+
+def lookup_slug(request: Request, slug: str) -> t.Tuple[t.Union[PostSummary, MovedSlug, None], t.Optional[Post]]:
+    """Find a post by its current or former slug.
+
+    :return: Tuple (summary, post). Post is given only if it had to be loaded. For former slugs the summary is :py:class:`MovedSlug`. ``(None, None)`` if there is no such post.
+    """
+    cache = get_cache(request.registry)
+    key = slug_key(slug)
+
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is NOT_FOUND:
+            return None, None
+        elif cached is not None:
+            return cached, None
+
+    dbsession = get_read_dbsession(request)
+    post = dbsession.query(Post).filter_by(slug=slug).one_or_none()
+    if post:
+        summary = PostSummary.from_post(post)
+        tags = [post_key(summary.id)] + [tag_key(title) for title in summary.tags]
+    else:
+        moved = find_moved_post(dbsession, slug)
+        summary = MovedSlug(*moved) if moved else None
+        tags = [post_key(summary.post_id)] if moved else []
+
+    if cache is not None:
+        if summary:
+            cache.set(key, summary, get_default_ttl(request.registry), tags=tags)
+        else:
+            cache.set(key, NOT_FOUND, get_negative_ttl(request.registry))
+
+    return summary, post
+
+
+def invalidate_slugs(event: PostsChanged):
+    """Forget cached lookups of slugs that changed owner."""
+    cache = get_cache(event.registry)
+    if cache is not None:
+        for slug in event.slugs:
+            cache.delete(slug_key(slug))
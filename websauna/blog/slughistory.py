@@ -0,0 +1,47 @@
+"""Former slugs of posts.
+
+When a slug is edited the old one is stored in :py:class:`~websauna.blog.models.PostSlugHistory` and keeps redirecting to the post. Former slugs of a post cannot be taken by other posts, but the post itself can return to one.
+"""
+
+# Standard Library
+import typing as t
+import uuid
+
+# SQLAlchemy
+import sqlalchemy.dialects.postgresql as psql
+from sqlalchemy.orm import Session
+
+# Websauna
+from websauna.utils.time import now
+
+from .models import Post
+from .models import PostSlugHistory
+
+
+def record_slug_change(dbsession: Session, post: Post, previous_slug: t.Optional[str]):
+    """Remember the previous slug of an edited post."""
+    if previous_slug and previous_slug != post.slug:
+        table = PostSlugHistory.__table__
+        stmt = psql.insert(table).values(slug=previous_slug, post_id=post.id, changed_at=now())
+        dbsession.execute(stmt.on_conflict_do_update(index_elements=["slug"], set_={"post_id": stmt.excluded.post_id, "changed_at": stmt.excluded.changed_at}))
+
+    # The post took back one of its former slugs
+    dbsession.query(PostSlugHistory).filter_by(slug=post.slug, post_id=post.id).delete(synchronize_session=False)
+
+
+def find_moved_post(dbsession: Session, slug: str) -> t.Optional[t.Tuple[uuid.UUID, str]]:
+    """Find the post which used to have a slug.
+
+    :return: Tuple (post id, current slug) or ``None``
+    """
+    return dbsession.query(Post.id, Post.slug).join(PostSlugHistory, PostSlugHistory.post_id == Post.id).filter(PostSlugHistory.slug == slug).first()
+
+
+def is_slug_taken(dbsession: Session, slug: str, post_id: t.Optional[uuid.UUID] = None) -> bool:
+    """Is the slug used now or earlier by a post other than ``post_id``."""
+    q = dbsession.query(Post.id).filter(Post.slug == slug)
+    history = dbsession.query(PostSlugHistory.post_id).filter(PostSlugHistory.slug == slug)
+    if post_id:
+        q = q.filter(Post.id != post_id)
+        history = history.filter(PostSlugHistory.post_id != post_id)
+    return dbsession.query(q.exists()).scalar() or dbsession.query(history.exists()).scalar()
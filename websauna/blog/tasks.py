@@ -0,0 +1,21 @@
+"""Celery tasks of the blog addon, scanned only when ``blog.derivatives.runner = celery``."""
+
+# Standard Library
+import uuid
+
+# Websauna
+from websauna.system.task.tasks import RetryableTransactionTask
+from websauna.system.task.tasks import task
+
+from .derivatives import update_derivatives
+from .events import notify_posts_changed
+from .images import get_image_processor
+from .rendering import get_renderer
+
+
+@task(base=RetryableTransactionTask, bind=True)
+def update_post_derivatives(self: RetryableTransactionTask, post_ids: list):
+    """Compute derivatives of saved posts."""
+    request = self.get_request()
+    updated = update_derivatives(request.dbsession, [uuid.UUID(post_id) for post_id in post_ids], get_renderer(request.registry), get_image_processor(request.registry))
+    notify_posts_changed(request, post_ids=updated)
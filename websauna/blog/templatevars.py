@@ -3,6 +3,7 @@
 # Pyramid
 from pyramid.events import BeforeRender
 
+from .permissions import has_permission
 from .views import blog_container_factory
 
 
@@ -16,5 +17,6 @@ def includeme(config):
     def on_before_render(event):
         request = event["request"]
         event["blog_container"] = blog_container(request)
+        event["blog_has_permission"] = lambda permission, context=None: has_permission(request, permission, context)
 
     config.add_subscriber(on_before_render, BeforeRender)
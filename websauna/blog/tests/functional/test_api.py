@@ -0,0 +1,77 @@
+"""JSON API functional tests."""
+# Pyramid
+import transaction
+
+# SQLAlchemy
+from sqlalchemy.orm.session import Session
+
+# Thirdparty Library
+import requests
+
+
+def test_posts_fields_and_cursor(web_server: str, dbsession: Session, fakefactory):
+    """Posts are listed with the requested fields only, page by page, without drafts."""
+
+    with transaction.manager:
+        posts = [fakefactory.PostFactory(public=True) for i in range(5)]
+        fakefactory.PostFactory()
+        slugs = [post.slug for post in sorted(posts, key=lambda post: (post.published_at, post.id), reverse=True)]
+        dbsession.expunge_all()
+
+    url = "{}/blog/api/posts".format(web_server)
+    seen = []
+    params = {"fields": "slug,title", "limit": 2}
+    while True:
+        resp = requests.get(url, params=params)
+        assert resp.status_code == 200
+        data = resp.json()
+        assert all(set(item) == {"slug", "title"} for item in data["items"])
+        seen += [item["slug"] for item in data["items"]]
+        if not data["next"]:
+            break
+        params["cursor"] = data["next"]
+
+    assert seen == slugs
+
+    assert requests.get(url, params={"fields": "slug,password"}).status_code == 400
+    assert requests.get(url, params={"cursor": "xxx"}).status_code == 400
+
+
+def test_post(web_server: str, dbsession: Session, fakefactory):
+    """Single post is shown with its rendered body, drafts are not found."""
+
+    with transaction.manager:
+        post = fakefactory.PostFactory(public=True)
+        draft = fakefactory.PostFactory()
+        dbsession.expunge_all()
+
+    resp = requests.get("{}/blog/api/posts/{}".format(web_server, post.slug))
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["title"] == post.title
+    assert data["url"].endswith("/blog/{}/".format(post.slug))
+    assert "<" in data["body_html"]
+
+    etag = resp.headers["ETag"]
+    resp = requests.get("{}/blog/api/posts/{}".format(web_server, post.slug), headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+    assert requests.get("{}/blog/api/posts/{}".format(web_server, draft.slug)).status_code == 404
+    assert requests.get("{}/blog/api/posts/xxx".format(web_server)).status_code == 404
+
+
+def test_tags(web_server: str, dbsession: Session, fakefactory):
+    """Tags are counted by visible posts and list their posts."""
+
+    with transaction.manager:
+        tag = fakefactory.TagFactory()
+        post = fakefactory.PostFactory(public=True, tags=[tag])
+        fakefactory.PostFactory(tags=[tag])
+        title = tag.title
+        dbsession.expunge_all()
+
+    items = requests.get("{}/blog/api/tags".format(web_server)).json()["items"]
+    assert {"title": title, "posts": 1, "url": "{}/blog/api/tags/{}/posts".format(web_server, title)} in items
+
+    data = requests.get("{}/blog/api/tags/{}/posts".format(web_server, title)).json()
+    assert [item["slug"] for item in data["items"]] == [post.slug]
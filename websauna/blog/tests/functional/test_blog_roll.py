@@ -128,3 +128,15 @@ def test_title_and_breadcrumbs(
     browser.visit(web_server + "/blog/")
     assert browser.find_by_css('h1').text == blog_title
     assert browser.find_by_css('.breadcrumb').text.endswith(blog_title)
+
+
+def test_scheduled_posts_not_in_blog_roll(web_server: str, browser: DriverAPI, dbsession: Session, fakefactory):
+    """Visitors do not see posts scheduled to be published in the future."""
+
+    with transaction.manager:
+        post = fakefactory.PostFactory(public=True)
+        fakefactory.PostFactory(published_at=arrow.utcnow().shift(days=1).datetime)
+        dbsession.expunge_all()
+
+    browser.visit(web_server + "/blog/")
+    assert [i.text for i in browser.find_by_css(".post h2")] == [post.title]
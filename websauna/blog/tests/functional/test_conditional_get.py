@@ -0,0 +1,86 @@
+"""Conditional GET functional tests."""
+import requests
+import transaction
+
+
+def test_post_not_modified(web_server: str, fakefactory, dbsession):
+    """Post page is not sent again until the post is edited."""
+
+    with transaction.manager:
+        post = fakefactory.PostFactory(public=True)
+        dbsession.expunge_all()
+
+    url = "{}/blog/{}".format(web_server, post.slug)
+    resp = requests.get(url)
+    assert resp.status_code == 200
+    etag = resp.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    resp = requests.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert not resp.content
+
+    resp = requests.get(url, headers={"If-Modified-Since": resp.headers["Last-Modified"]})
+    assert resp.status_code == 304
+
+    with transaction.manager:
+        dbsession.merge(post).title = "Changed"
+
+    resp = requests.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert "Changed" in resp.text
+
+
+def test_roll_not_modified(web_server: str, fakefactory, dbsession):
+    """Blog roll ETag changes when posts are added."""
+
+    with transaction.manager:
+        fakefactory.PostFactory(public=True)
+
+    url = "{}/blog/".format(web_server)
+    etag = requests.get(url).headers["ETag"]
+    assert requests.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    with transaction.manager:
+        fakefactory.PostFactory(public=True)
+
+    assert requests.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_roll_retagged(web_server: str, fakefactory, dbsession):
+    """Roll ETag changes when tags of listed posts change without editing the posts."""
+
+    with transaction.manager:
+        tag = fakefactory.TagFactory()
+        fakefactory.PostFactory(public=True, tags=[tag])
+
+    url = "{}/blog/".format(web_server)
+    etag = requests.get(url).headers["ETag"]
+
+    with transaction.manager:
+        dbsession.merge(tag).title = "renamed"
+
+    assert requests.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_data_roll_not_modified(web_server: str, fakefactory, dbsession):
+    """Metadata roll ETag describes the posts of the roll only."""
+
+    with transaction.manager:
+        post = fakefactory.PostFactory(public=True, other_data={"series": "pyramid-tips"})
+        other = fakefactory.PostFactory(public=True, other_data={"series": "other"})
+        dbsession.expunge_all()
+
+    url = "{}/blog/by/series/pyramid-tips".format(web_server)
+    etag = requests.get(url).headers["ETag"]
+    assert etag != requests.get("{}/blog/by/series/other".format(web_server)).headers["ETag"]
+
+    with transaction.manager:
+        dbsession.merge(other).title = "Changed"
+
+    assert requests.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    with transaction.manager:
+        dbsession.merge(post).other_data = {"series": "other"}
+
+    assert requests.get(url, headers={"If-None-Match": etag}).status_code == 200
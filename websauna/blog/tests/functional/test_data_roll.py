@@ -0,0 +1,37 @@
+"""Metadata roll functional tests."""
+# Pyramid
+import transaction
+
+# SQLAlchemy
+from sqlalchemy.orm.session import Session
+
+# Thirdparty Library
+from splinter.driver import DriverAPI
+
+
+def test_series_roll(web_server: str, browser: DriverAPI, dbsession: Session, fakefactory):
+    """Published posts of a series are listed oldest first, a page at a time."""
+
+    with transaction.manager:
+        series = [fakefactory.PostFactory(public=True, other_data={"series": "pyramid-tips", "part": i}) for i in range(3)]
+        fakefactory.PostFactory(other_data={"series": "pyramid-tips"})
+        fakefactory.PostFactory(public=True, other_data={"series": "other"})
+        titles = [post.title for post in series]
+        dbsession.expunge_all()
+
+    browser.visit(web_server + "/blog/by/series/pyramid-tips")
+    assert browser.find_by_css("#heading-data").text == "Series: pyramid-tips"
+    assert [link.text for link in browser.find_by_css("div.post a.post-link")] == titles
+
+    browser.visit(web_server + "/blog/by/series/pyramid-tips?batch_size=2&batch_num=1")
+    assert [link.text for link in browser.find_by_css("div.post a.post-link")] == titles[2:]
+
+
+def test_data_roll_unlisted_key(web_server: str, browser: DriverAPI, dbsession: Session, fakefactory):
+    """Keys not in blog.data_rolls cannot be browsed."""
+
+    with transaction.manager:
+        fakefactory.PostFactory(public=True, other_data={"feature": "yes"})
+
+    browser.visit(web_server + "/blog/by/feature/yes")
+    assert not browser.is_element_present_by_css("#heading-data")
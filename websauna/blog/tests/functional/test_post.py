@@ -1,4 +1,5 @@
 """Functional tests."""
+import requests
 import transaction
 
 # SQLAlchemy
@@ -6,6 +7,9 @@ from sqlalchemy.orm.session import Session
 
 from splinter.driver import DriverAPI
 
+# Websauna
+from websauna.blog.slughistory import record_slug_change
+
 
 def test_published_post(web_server: str, browser: DriverAPI, dbsession: Session, fakefactory):
     """User can view blog posts."""
@@ -21,3 +25,47 @@ def test_published_post(web_server: str, browser: DriverAPI, dbsession: Session,
     b.find_by_css(".post-link").click()
 
     assert b.is_element_present_by_css("#heading-post")
+
+
+def test_former_slug_redirects(web_server: str, dbsession: Session, fakefactory):
+    """Old post URLs redirect permanently to the current one."""
+    with transaction.manager:
+        post = fakefactory.PostFactory(public=True, slug="old-slug")
+        post.slug = "new-slug"
+        record_slug_change(dbsession, post, "old-slug")
+
+    resp = requests.get(web_server + "/blog/old-slug", allow_redirects=False)
+    assert resp.status_code == 301
+    assert resp.headers["Location"] == web_server + "/blog/new-slug/"
+
+    assert requests.get(web_server + "/blog/no-such-slug", allow_redirects=False).status_code == 404
+
+
+def test_former_slug_of_draft(web_server: str, dbsession: Session, fakefactory):
+    """Former URLs of posts visitors cannot view do not reveal the current slug."""
+    with transaction.manager:
+        post = fakefactory.PostFactory(published_at=None, slug="old-draft")
+        post.slug = "secret-draft"
+        record_slug_change(dbsession, post, "old-draft")
+
+    assert requests.get(web_server + "/blog/old-draft", allow_redirects=False).status_code == 404
+    assert requests.get(web_server + "/blog/api/posts/old-draft", allow_redirects=False).status_code == 404
+
+
+def test_post_neighbours(web_server: str, browser: DriverAPI, dbsession: Session, fakefactory):
+    """Post page links to the previous and next published posts."""
+    with transaction.manager:
+        older = fakefactory.PostFactory(public=True)
+        dbsession.flush()
+        post = fakefactory.PostFactory(public=True)
+        dbsession.flush()
+        newer = fakefactory.PostFactory(public=True)
+        dbsession.expunge_all()
+
+    browser.visit("{}/blog/{}/".format(web_server, post.slug))
+    assert browser.find_by_css("#post-neighbours .previous a").text == "← {}".format(older.title)
+    assert browser.find_by_css("#post-neighbours .next a").text == "{} →".format(newer.title)
+
+    browser.find_by_css("#post-neighbours .next a").click()
+    assert browser.find_by_css("#heading-post").text == newer.title
+    assert not browser.is_element_present_by_css("#post-neighbours .next")
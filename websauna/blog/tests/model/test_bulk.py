@@ -0,0 +1,191 @@
+"""Set based bulk operation tests."""
+# Standard Library
+import datetime
+
+# Pyramid
+import transaction
+
+# Websauna
+from websauna.blog import bulk
+from websauna.blog.events import PostsChanged
+from websauna.blog.events import notify_posts_changed
+from websauna.blog.models import AssociationPostsTags
+from websauna.blog.models import Post
+from websauna.blog.models import Tag
+from websauna.utils.time import now
+
+
+def test_publish_and_unpublish(dbsession, fakefactory):
+    """Publishing keeps the publishing time of already published posts."""
+
+    with transaction.manager:
+        drafts = fakefactory.PostFactory.create_batch(3, private=True)
+        published = fakefactory.PostFactory(public=True)
+        published_at = published.published_at
+        ids = [post.id for post in drafts] + [published.id]
+
+    with transaction.manager:
+        assert bulk.publish_posts(dbsession, ids) == 3
+
+    with transaction.manager:
+        assert dbsession.query(Post).filter(Post.published_at != None).count() == 4  # noQA
+        assert dbsession.query(Post).get(published.id).published_at == published_at
+
+    with transaction.manager:
+        assert bulk.unpublish_posts(dbsession, ids[:2]) == 2
+
+    with transaction.manager:
+        assert dbsession.query(Post).filter(Post.published_at == None).count() == 2  # noQA
+
+
+def test_add_and_remove_tag(dbsession, fakefactory):
+    """Tags are added once per post and created on demand."""
+
+    with transaction.manager:
+        posts = fakefactory.PostFactory.create_batch(3, tags=[])
+        ids = [post.id for post in posts]
+
+    with transaction.manager:
+        assert bulk.add_tag(dbsession, ids[:2], "python") == 2
+
+    with transaction.manager:
+        assert bulk.add_tag(dbsession, ids, "python") == 1
+
+    with transaction.manager:
+        tag = dbsession.query(Tag).filter_by(title="python").one()
+        assert len(tag.posts) == 3
+        assert bulk.get_post_tags(dbsession, ids) == {"python"}
+
+    with transaction.manager:
+        assert bulk.remove_tag(dbsession, ids[1:], "python") == 2
+
+    with transaction.manager:
+        assert dbsession.query(AssociationPostsTags).count() == 1
+
+
+def test_delete_posts(dbsession, fakefactory):
+    """Posts are deleted with their tag associations."""
+
+    with transaction.manager:
+        posts = fakefactory.PostFactory.create_batch(3)
+        ids = [post.id for post in posts]
+
+    with transaction.manager:
+        assert bulk.delete_posts(dbsession, ids[:2]) == 2
+
+    with transaction.manager:
+        assert dbsession.query(Post).count() == 1
+        assert {post_id for post_id, in dbsession.query(AssociationPostsTags.post_id)} == {ids[2]}
+
+
+def test_notify_once_per_transaction(test_request, registry):
+    """Changes within a transaction are fired as one event after commit."""
+
+    events = []
+    registry.registerHandler(events.append, (PostsChanged,))
+    try:
+        with transaction.manager:
+            notify_posts_changed(test_request, tags=["python"], slugs=["foo"])
+            notify_posts_changed(test_request, tags=["websauna"])
+            assert not events
+
+        assert len(events) == 1
+        assert events[0].tags == {"python", "websauna"}
+        assert events[0].slugs == {"foo"}
+
+        with transaction.manager:
+            notify_posts_changed(test_request, tags=["python"])
+            transaction.abort()
+
+        assert len(events) == 1
+    finally:
+        registry.unregisterHandler(events.append, (PostsChanged,))
+
+
+def make_tags(fakefactory, *titles) -> dict:
+    return {title: fakefactory.TagFactory(title=title) for title in titles}
+
+
+def test_tag_post_counts(dbsession, fakefactory):
+    """Tag counts include drafts in the total only."""
+
+    with transaction.manager:
+        tags = make_tags(fakefactory, "python", "draft")
+        fakefactory.PostFactory.create_batch(2, public=True, tags=[tags["python"]])
+        fakefactory.PostFactory(private=True, tags=[tags["python"], tags["draft"]])
+        python_id, draft_id = tags["python"].id, tags["draft"].id
+
+    with transaction.manager:
+        counts = bulk.get_tag_post_counts(dbsession)
+        assert counts[python_id] == (3, 2)
+        assert counts[draft_id] == (1, 0)
+
+
+def test_merge_tags(dbsession, fakefactory):
+    """Posts tagged with both merged tags end up with one association."""
+
+    with transaction.manager:
+        tags = make_tags(fakefactory, "py", "python", "Python3")
+        fakefactory.PostFactory(tags=[tags["py"], tags["python"]])
+        fakefactory.PostFactory(tags=[tags["py"]])
+        fakefactory.PostFactory(tags=[tags["Python3"]])
+        ids = [tags["py"].id, tags["Python3"].id]
+
+    with transaction.manager:
+        bulk.merge_tags(dbsession, ids, "python")
+
+    with transaction.manager:
+        assert [title for title, in dbsession.query(Tag.title)] == ["python"]
+        assert dbsession.query(AssociationPostsTags).count() == 3
+
+
+def test_rename_tag(dbsession, fakefactory):
+    """Renaming to an existing title merges the tags."""
+
+    with transaction.manager:
+        tags = make_tags(fakefactory, "py", "python", "web")
+        fakefactory.PostFactory(tags=[tags["py"]])
+        fakefactory.PostFactory(tags=[tags["python"], tags["web"]])
+        py_id, web_id = tags["py"].id, tags["web"].id
+
+    with transaction.manager:
+        assert bulk.rename_tag(dbsession, web_id, "websauna") == web_id
+        bulk.rename_tag(dbsession, py_id, "python")
+
+    with transaction.manager:
+        assert {title for title, in dbsession.query(Tag.title)} == {"python", "websauna"}
+        assert len(dbsession.query(Tag).filter_by(title="python").one().posts) == 2
+
+
+def test_delete_orphan_tags(dbsession, fakefactory):
+    """Only tags without posts are deleted."""
+
+    with transaction.manager:
+        tags = make_tags(fakefactory, "python", "unused")
+        fakefactory.PostFactory(tags=[tags["python"]])
+
+    with transaction.manager:
+        assert bulk.delete_orphan_tags(dbsession) == {"unused"}
+
+    with transaction.manager:
+        assert [title for title, in dbsession.query(Tag.title)] == ["python"]
+
+
+def test_scheduled_posts(dbsession, fakefactory):
+    """Scheduled posts are not published yet: publishing makes them live now, unpublishing leaves them scheduled and tag counts skip them."""
+
+    with transaction.manager:
+        tag = fakefactory.TagFactory()
+        scheduled = fakefactory.PostFactory.create_batch(2, published_at=now() + datetime.timedelta(days=1), tags=[tag])
+        ids = [post.id for post in scheduled]
+        tag_id = tag.id
+
+    with transaction.manager:
+        assert bulk.get_tag_post_counts(dbsession)[tag_id] == (2, 0)
+        assert bulk.unpublish_posts(dbsession, ids) == 0
+        assert bulk.publish_posts(dbsession, ids[:1]) == 1
+
+    with transaction.manager:
+        assert bulk.get_tag_post_counts(dbsession)[tag_id] == (2, 1)
+        assert dbsession.query(Post).get(ids[0]).is_published()
+        assert dbsession.query(Post).get(ids[1]).is_scheduled()
@@ -0,0 +1,97 @@
+"""Invalidation bus tests."""
+# Standard Library
+import json
+import time
+import uuid
+
+# Pyramid
+from pyramid.events import NewRequest
+from pyramid.request import Request
+
+# Websauna
+from websauna.blog.bus import MAX_MESSAGE_SIZE
+from websauna.blog.bus import PostgresBus
+from websauna.blog.bus import decode_event
+from websauna.blog.bus import encode_messages
+from websauna.blog.bus import receive
+from websauna.blog.bus import start_listener
+from websauna.blog.cache import MemoryCache
+from websauna.blog.events import PostsChanged
+from websauna.blog.interfaces import IBlogCache
+from websauna.blog.interfaces import IInvalidationBus
+from websauna.blog.warmup import WARMUP_ENVIRON_KEY
+
+
+def from_other_process(message: str) -> str:
+    data = json.loads(message)
+    data["origin"] = "other"
+    return json.dumps(data)
+
+
+def test_encode_event(registry):
+    """Events are sent as remote events to other processes only."""
+    post_id = uuid.uuid4()
+    messages = encode_messages(PostsChanged(registry, post_ids=[post_id], tags=["python"], slugs=["old", "new"]))
+
+    assert len(messages) == 1
+    assert decode_event(registry, messages[0]) is None
+
+    event = decode_event(registry, from_other_process(messages[0]))
+    assert event.remote
+    assert event.post_ids == {post_id}
+    assert event.tags == {"python"}
+    assert event.slugs == {"old", "new"}
+
+
+def test_encode_large_event(registry):
+    """Large events are split to messages fitting PostgreSQL notifications."""
+    slugs = {"slug-{}-{}".format(idx, "x" * 50) for idx in range(500)}
+    messages = encode_messages(PostsChanged(registry, slugs=slugs))
+
+    assert len(messages) > 1
+    assert all(len(message) <= MAX_MESSAGE_SIZE for message in messages)
+    assert set().union(*(decode_event(registry, from_other_process(message)).slugs for message in messages)) == slugs
+
+
+def test_lost_messages(registry):
+    """Local memory cache is cleared when messages may have been lost."""
+    cache = MemoryCache()
+    cache.set("page:/blog/", "cached", 60)
+    registry.registerUtility(cache, IBlogCache)
+    try:
+        receive(registry, None)
+    finally:
+        registry.unregisterUtility(provided=IBlogCache)
+
+    assert cache.get("page:/blog/") is None
+
+
+def test_postgres_bus(registry):
+    """Messages go through PostgreSQL LISTEN/NOTIFY."""
+    bus = PostgresBus(registry, "blog_invalidate_test")
+    received = []
+    bus.ensure_listener(received.append)
+    try:
+        # Publish until the listener has subscribed
+        deadline = time.time() + 10
+        while not received and time.time() < deadline:
+            bus.publish(["hello"])
+            time.sleep(0.2)
+    finally:
+        bus.close()
+
+    assert received[0] == "hello"
+
+
+def test_no_listener_for_warmup(registry):
+    """Warm-up requests, made before workers are forked, do not start the listener thread."""
+    bus = PostgresBus(registry, "blog_invalidate_test")
+    registry.registerUtility(bus, IInvalidationBus)
+    try:
+        request = Request.blank("/blog/", environ={WARMUP_ENVIRON_KEY: True})
+        request.registry = registry
+        start_listener(NewRequest(request))
+    finally:
+        registry.unregisterUtility(provided=IInvalidationBus)
+
+    assert bus.listener is None
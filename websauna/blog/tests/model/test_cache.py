@@ -0,0 +1,97 @@
+"""Content cache and page cache expiry tests."""
+# Standard Library
+import datetime
+import gzip
+import time
+
+# Pyramid
+import transaction
+from pyramid.testing import DummyRequest
+
+# Websauna
+from websauna.blog.cache import ROLL_KEY
+from websauna.blog.cache import MemoryCache
+from websauna.blog.cache import post_key
+from websauna.blog.cache import tag_key
+from websauna.blog.pagecache import SCHEDULE_KEY
+from websauna.blog.pagecache import compress_body
+from websauna.blog.pagecache import get_cache_ttl
+from websauna.blog.pagecache import get_next_publish_time
+from websauna.blog.pagecache import make_response
+from websauna.utils.time import now
+
+
+def test_memory_cache_expiry_and_lru():
+    """Entries expire after their TTL and least recently used entries are dropped first."""
+    cache = MemoryCache(max_entries=2)
+
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    assert cache.get("a") == 1
+    cache.set("c", 3, ttl=60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    cache.set("d", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("d") is None
+
+
+def test_memory_cache_tags():
+    """Invalidating a tag drops every entry stored with it and nothing else."""
+    cache = MemoryCache()
+
+    cache.set("roll", "roll page", ttl=60, tags=[ROLL_KEY])
+    cache.set("post", "post page", ttl=60, tags=[post_key(1), tag_key("python")])
+    cache.set("other", "other post page", ttl=60, tags=[post_key(2), tag_key("python")])
+
+    cache.invalidate_tags([post_key(1)])
+    assert cache.get("post") is None
+    assert cache.get("other") == "other post page"
+    assert cache.get("roll") == "roll page"
+
+    cache.invalidate_tags([tag_key("python"), ROLL_KEY])
+    assert not cache.entries
+    assert not cache.tags
+
+
+def test_cache_ttl_follows_schedule(test_request, dbsession, fakefactory):
+    """Cached content expires when the next scheduled post is published."""
+    cache = MemoryCache()
+
+    with transaction.manager:
+        assert get_cache_ttl(test_request, cache) == 3600
+        assert cache.get(SCHEDULE_KEY) == {"next": None}
+
+    publish_at = now() + datetime.timedelta(minutes=10)
+    with transaction.manager:
+        fakefactory.PostFactory(published_at=publish_at)
+        fakefactory.PostFactory(published_at=publish_at + datetime.timedelta(minutes=10))
+
+    # Schedule changes are picked up when the roll is invalidated
+    cache.invalidate_tags([ROLL_KEY])
+
+    with transaction.manager:
+        assert get_next_publish_time(dbsession) == publish_at
+        assert 590 <= get_cache_ttl(test_request, cache) <= 600
+        assert cache.get(SCHEDULE_KEY) == {"next": publish_at}
+
+
+def test_precompressed_response():
+    """Cached pages are served in an encoding the client accepts."""
+    body = b"<p>Hello world</p>" * 100
+    entry = {"body": body, "encoded": compress_body(body), "content_type": "text/html; charset=UTF-8"}
+
+    response = make_response(DummyRequest(headers={"Accept-Encoding": "gzip, deflate"}), entry)
+    assert response.content_encoding == "gzip"
+    assert gzip.decompress(response.body) == body
+    assert response.vary == ("Accept-Encoding",)
+
+    response = make_response(DummyRequest(headers={"Accept-Encoding": "gzip;q=0"}), entry)
+    assert response.content_encoding is None
+    assert response.body == body
+
+    # Small bodies are not compressed
+    assert compress_body(b"<p>Hello</p>") == {}
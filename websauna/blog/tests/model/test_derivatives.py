@@ -0,0 +1,107 @@
+"""Post derivative computation tests."""
+# Pyramid
+import transaction
+
+# Websauna
+from websauna.blog.derivatives import compute_derivatives
+from websauna.blog.derivatives import is_fresh
+from websauna.blog.derivatives import update_derivatives
+from websauna.blog.models import Post
+from websauna.blog.rendering import PoolRenderer
+from websauna.blog.views import blog_container_factory
+
+
+BODY = """# Installing
+
+Install the package with pip and add it to your application.
+
+## Configuring
+
+Edit the settings.
+"""
+
+
+def test_compute_derivatives():
+    """Body is rendered with heading anchors and summarized."""
+    body_html, derived = compute_derivatives(BODY)
+
+    assert '<h1 id="installing">Installing</h1>' in body_html
+    assert derived["word_count"] == 16
+    assert derived["reading_time"] == 1
+    assert derived["toc"] == [
+        {"level": 1, "id": "installing", "name": "Installing"},
+        {"level": 2, "id": "configuring", "name": "Configuring"},
+    ]
+    assert derived["excerpt"] == "Install the package with pip and add it to your application."
+
+
+def test_update_derivatives(dbsession, fakefactory):
+    """Derivatives are stored once per body change without touching the edit time."""
+
+    with transaction.manager:
+        post = fakefactory.PostFactory(public=True, body=BODY)
+        post_id = post.id
+
+    with transaction.manager:
+        updated_at = dbsession.query(Post).get(post_id).updated_at
+        assert update_derivatives(dbsession, [post_id]) == [post_id]
+
+    with transaction.manager:
+        post = dbsession.query(Post).get(post_id)
+        assert is_fresh(post)
+        assert post.updated_at == updated_at
+        assert post.body_html.startswith('<h1 id="installing">')
+        assert update_derivatives(dbsession, [post_id]) == []
+
+    with transaction.manager:
+        dbsession.query(Post).get(post_id).body = "Changed"
+
+    with transaction.manager:
+        assert not is_fresh(dbsession.query(Post).get(post_id))
+        assert update_derivatives(dbsession, [post_id]) == [post_id]
+
+    with transaction.manager:
+        assert update_derivatives(dbsession, [post_id]) == []
+        assert update_derivatives(dbsession, [post_id], force=True) == [post_id]
+
+
+def test_degraded_derivatives_not_stored(dbsession, fakefactory):
+    """A body which could not be rendered is retried instead of being stored as up to date."""
+
+    with transaction.manager:
+        post = fakefactory.PostFactory(public=True, body=BODY)
+        post_id = post.id
+
+    with transaction.manager:
+        assert update_derivatives(dbsession, [post_id], renderer=PoolRenderer(processes=0, max_size=10)) == []
+
+    with transaction.manager:
+        post = dbsession.query(Post).get(post_id)
+        assert post.derived is None
+        assert not is_fresh(post)
+        assert update_derivatives(dbsession, [post_id]) == [post_id]
+
+
+def test_feed_posts(test_request, dbsession, fakefactory):
+    """Feed lists the newest posts with their stored HTML, even from an earlier body."""
+
+    with transaction.manager:
+        posts = [fakefactory.PostFactory(public=True, body=BODY) for i in range(3)]
+        dbsession.flush()
+        post_ids = [post.id for post in posts]
+        update_derivatives(dbsession, post_ids)
+
+    with transaction.manager:
+        for post_id in post_ids:
+            dbsession.query(Post).get(post_id).body = "Changed"
+
+    settings = test_request.registry.settings
+    settings["blog.rss_feed_limit"] = "2"
+    try:
+        with transaction.manager:
+            feed_posts = list(blog_container_factory(test_request).get_feed_posts())
+            assert len(feed_posts) == 2
+            assert all(resource.get_body_as_html(allow_stale=True).startswith('<h1 id="installing">') for resource in feed_posts)
+            assert all(resource.get_body_as_html() == "<p>Changed</p>" for resource in feed_posts)
+    finally:
+        del settings["blog.rss_feed_limit"]
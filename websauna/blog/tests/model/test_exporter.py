@@ -0,0 +1,81 @@
+"""Post export tests."""
+# Standard Library
+import datetime
+import io
+import json
+
+# Pyramid
+import transaction
+
+# Websauna
+from websauna.blog.exporter import export_jsonl
+from websauna.blog.exporter import export_markdown
+from websauna.blog.importer import parse_markdown_file
+from websauna.utils.time import now
+
+
+def test_export_jsonl(dbsession, fakefactory):
+    """Every post is exported with its tags, batch boundaries do not matter."""
+
+    with transaction.manager:
+        posts = fakefactory.PostFactory.create_batch(5, public=True)
+        expected = {post.slug: sorted(tag.title for tag in post.tags) for post in posts}
+
+    out = io.StringIO()
+    with transaction.manager:
+        assert export_jsonl(dbsession, out, batch_size=2) == 5
+
+    exported = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert {post["slug"]: post["tags"] for post in exported} == expected
+    assert all(post["published_at"] for post in exported)
+
+
+def test_export_since(dbsession, fakefactory):
+    """Incremental export only includes recently changed posts."""
+
+    with transaction.manager:
+        old = fakefactory.PostFactory(created_at=now() - datetime.timedelta(days=10))
+        fakefactory.PostFactory(created_at=now() - datetime.timedelta(days=10), updated_at=now())
+        fakefactory.PostFactory(created_at=now())
+        old_slug = old.slug
+
+    out = io.StringIO()
+    with transaction.manager:
+        assert export_jsonl(dbsession, out, since=now() - datetime.timedelta(days=1)) == 2
+
+    assert old_slug not in out.getvalue()
+
+
+def test_export_markdown_roundtrip(dbsession, fakefactory, tmpdir):
+    """Markdown export can be read back by the importer."""
+
+    with transaction.manager:
+        post = fakefactory.PostFactory(public=True, other_data={"series": "tutorial"})
+        slug, title, body = post.slug, post.title, post.body
+        tags = sorted(tag.title for tag in post.tags)
+
+    with transaction.manager:
+        assert export_markdown(dbsession, str(tmpdir)) == 1
+
+    entry = parse_markdown_file(str(tmpdir.join(slug + ".md")))
+    assert entry["slug"] == slug
+    assert entry["title"] == title
+    assert entry["body"] == body
+    assert sorted(entry["tags"]) == tags
+    assert entry["published_at"]
+    assert entry["other_data"] == {"series": "tutorial"}
+
+
+def test_export_markdown_unsafe_slug(dbsession, fakefactory, tmpdir):
+    """Slugs are never used to write outside the export directory."""
+
+    with transaction.manager:
+        fakefactory.PostFactory(slug="../escaped")
+        fakefactory.PostFactory(slug="safe")
+
+    target = tmpdir.mkdir("export")
+    with transaction.manager:
+        assert export_markdown(dbsession, str(target)) == 1
+
+    assert target.join("safe.md").check()
+    assert not tmpdir.join("escaped.md").check()
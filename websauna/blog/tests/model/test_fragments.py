@@ -0,0 +1,48 @@
+"""Template fragment cache tests."""
+# Standard Library
+import datetime
+
+# Pyramid
+import transaction
+from jinja2 import Environment
+
+# Websauna
+from websauna.blog.cache import MemoryCache
+from websauna.blog.cache import post_key
+from websauna.blog.fragments import FragmentCacheExtension
+from websauna.blog.interfaces import IBlogCache
+from websauna.utils.time import now
+
+
+TEMPLATE = '{% cache "title", post %}{{ post.title }} {{ extra }}{% endcache %}'
+
+
+def test_fragment_cache(test_request, dbsession, fakefactory):
+    """Fragments are reused until the post is edited or invalidated."""
+
+    with transaction.manager:
+        post = fakefactory.PostFactory(public=True, title="Hello")
+
+    cache = MemoryCache()
+    test_request.registry.registerUtility(cache, IBlogCache)
+    template = Environment(extensions=[FragmentCacheExtension]).from_string(TEMPLATE)
+    try:
+        with transaction.manager:
+            post = dbsession.merge(post)
+            assert template.render(post=post, request=test_request, extra="first") == "Hello first"
+            assert template.render(post=post, request=test_request, extra="second") == "Hello first"
+
+            # Edited post has a new key
+            post.updated_at = now() + datetime.timedelta(seconds=1)
+            assert template.render(post=post, request=test_request, extra="third") == "Hello third"
+
+            cache.invalidate_tags([post_key(post.id)])
+            assert template.render(post=post, request=test_request, extra="fourth") == "Hello fourth"
+    finally:
+        test_request.registry.unregisterUtility(provided=IBlogCache)
+
+
+def test_no_cache(test_request):
+    """Without a configured cache fragments are always rendered."""
+    template = Environment(extensions=[FragmentCacheExtension]).from_string(TEMPLATE)
+    assert template.render(post=None, request=test_request, extra="x") == " x"
@@ -0,0 +1,55 @@
+"""Code highlighting tests."""
+# Websauna
+from websauna.blog.highlight import block_cache
+from websauna.blog.highlight import get_block_key
+from websauna.blog.rendering import render_markdown
+
+
+BODY = """Example:
+
+```python
+if a < b:
+    print("Hello")
+```
+
+```unknown-language
+<b>as is</b>
+```
+"""
+
+
+def test_highlight():
+    """Fenced code blocks in known languages are highlighted."""
+    body_html, toc = render_markdown(BODY, highlight=True)
+
+    assert '<div class="codehilite"><pre>' in body_html
+    assert '<span class="k">if</span>' in body_html
+    assert '<pre><code class="language-unknown-language">&lt;b&gt;as is&lt;/b&gt;\n</code></pre>' in body_html
+
+
+def test_raw_html_not_highlighted():
+    """Code blocks written as raw HTML are kept as they are."""
+    raw = '<pre><code class="python">if a &lt; b: <b>pass</b></code></pre>'
+    body_html, toc = render_markdown(BODY + "\n" + raw + "\n", highlight=True)
+
+    assert '<span class="k">if</span>' in body_html
+    assert raw in body_html
+
+
+def test_highlight_cached():
+    """Highlighted blocks are reused."""
+    key = get_block_key("python", 'if a < b:\n    print("Hello")\n')
+    block_cache.set(key, "<div>cached</div>")
+    try:
+        body_html, toc = render_markdown(BODY, highlight=True)
+    finally:
+        block_cache.entries.pop(key)
+
+    assert "<div>cached</div>" in body_html
+
+
+def test_no_highlight():
+    """Without highlighting fenced code is not rendered as a code block."""
+    body_html, toc = render_markdown(BODY)
+
+    assert "codehilite" not in body_html
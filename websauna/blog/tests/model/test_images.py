@@ -0,0 +1,61 @@
+"""Responsive image tests."""
+# Standard Library
+import os
+
+import PIL.Image
+
+# Websauna
+from websauna.blog.images import ImageProcessor
+
+
+def make_processor(tmpdir) -> ImageProcessor:
+    PIL.Image.new("RGB", (2000, 1000), "red").save(str(tmpdir.join("photo.jpg")))
+    return ImageProcessor("/images/", str(tmpdir), widths=[480, 960, 1600, 2400])
+
+
+def test_responsive_image(tmpdir):
+    """Local images get resized variants, dimensions and lazy loading."""
+    processor = make_processor(tmpdir)
+    body_html, image = processor.process('<p><img alt="Photo" src="/images/photo.jpg" /></p>')
+
+    variants = sorted(os.listdir(str(tmpdir.join("_variants"))))
+    assert len(variants) == 3
+    assert variants[0].endswith("-1600.jpg")
+
+    assert 'alt="Photo"' in body_html
+    assert 'width="2000" height="1000"' in body_html
+    assert 'loading="lazy"' in body_html
+    assert "/images/_variants/{} 480w".format(variants[1]) in body_html
+    assert "/images/photo.jpg 2000w" in body_html
+
+    assert image == {"url": "/images/_variants/{}".format(variants[2]), "width": 960, "height": 480}
+
+
+def test_variants_generated_once(tmpdir):
+    """Variants are not written again for the same content."""
+    processor = make_processor(tmpdir)
+    processor.process('<img src="/images/photo.jpg" />')
+    variant = str(tmpdir.join("_variants").listdir()[0])
+    os.utime(variant, (0, 0))
+
+    processor.process('<img src="/images/photo.jpg" />')
+
+    assert os.stat(variant).st_mtime == 0
+
+
+def test_external_image(tmpdir):
+    """Images outside the image folder are only lazy loaded."""
+    processor = make_processor(tmpdir)
+    body_html, image = processor.process('<img src="/images/../photo.jpg" /><img src="https://example.com/a.png" />')
+
+    assert body_html == '<img src="/images/../photo.jpg" loading="lazy" /><img src="https://example.com/a.png" loading="lazy" />'
+    assert image is None
+
+
+def test_unquoted_attributes(tmpdir):
+    """Attributes in single quotes, without quotes and without values are kept."""
+    processor = make_processor(tmpdir)
+    body_html, image = processor.process("<img src='/images/photo.jpg' alt=Photo ismap>")
+
+    assert body_html.startswith("<img src='/images/photo.jpg' alt=Photo ismap loading=\"lazy\" width=\"2000\" height=\"1000\" srcset=")
+    assert image["width"] == 960
@@ -0,0 +1,119 @@
+"""Import time budget of the addon.
+
+Processes which never render a post, like Celery workers, shells and migrations, import the addon views through ``config.scan``. Markdown, feed and image libraries must load on first use instead.
+"""
+# Standard Library
+import json
+import subprocess
+import sys
+import typing as t
+
+import pytest
+
+
+#: Modules imported by including the addon
+ADDON_MODULES = ["websauna.blog", "websauna.blog.views", "websauna.blog.rss", "websauna.blog.adminviews"]
+
+#: Libraries which must not be imported by the addon modules
+LAZY_MODULES = ["markdown", "rfeed", "pygments", "PIL"]
+
+#: Budget of the addon modules themselves, excluding the frameworks they import, in microseconds
+BUDGET = 150000
+
+#: Imports modules timing each source module without its nested imports, like ``-X importtime`` of Python 3.7, and prints them as JSON
+IMPORT_SCRIPT = """
+import importlib.machinery, json, sys, time
+
+times = {{}}
+nested = []
+
+
+class TimingFinder:
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        # Source loaders are created per module, so their exec_module can be wrapped
+        if isinstance(spec.loader, importlib.machinery.SourceFileLoader):
+            exec_module = spec.loader.exec_module
+
+            def timed_exec_module(module):
+                nested.append(0.0)
+                start = time.perf_counter()
+                try:
+                    exec_module(module)
+                finally:
+                    elapsed = time.perf_counter() - start
+                    times[name] = int((elapsed - nested.pop()) * 1000000)
+                    if nested:
+                        nested[-1] += elapsed
+
+            spec.loader.exec_module = timed_exec_module
+        return spec
+
+
+sys.meta_path.insert(0, TimingFinder())
+import {modules}
+print(json.dumps({{"times": times, "loaded": sorted(sys.modules)}}))
+"""
+
+
+def measure_imports(modules: t.List[str]) -> t.List[t.Tuple[str, int]]:
+    """Import modules in a fresh interpreter with ``-X importtime``.
+
+    :return: List of (imported module, self time in microseconds)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import {}".format(", ".join(modules))], stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative_time, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_time)))
+    return imports
+
+
+def measure_imports_with_finder(modules: t.List[str]) -> t.Tuple[t.Dict[str, int], t.Set[str]]:
+    """Import modules in a fresh interpreter with a timing import hook, works on all Python versions.
+
+    :return: Tuple (self time in microseconds by source module, all loaded module names)
+    """
+    result = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT.format(modules=", ".join(modules))], stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    return data["times"], set(data["loaded"])
+
+
+def is_addon_module(name: str) -> bool:
+    return name == "websauna.blog" or name.startswith("websauna.blog.")
+
+
+def test_import_budget():
+    """Including the addon does not load heavy libraries and stays within the time budget, on all Python versions."""
+    times, loaded = measure_imports_with_finder(ADDON_MODULES)
+
+    for module in LAZY_MODULES:
+        assert module not in loaded, "{} is loaded when the addon is included".format(module)
+
+    addon_time = sum(self_time for name, self_time in times.items() if is_addon_module(name))
+    assert addon_time < BUDGET, "Importing the addon took {} ms, the budget is {} ms".format(addon_time // 1000, BUDGET // 1000)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="-X importtime needs Python 3.7")
+def test_import_time():
+    """The budget holds when measured by the interpreter itself."""
+    imports = measure_imports(ADDON_MODULES)
+    imported = {name for name, self_time in imports}
+
+    for module in LAZY_MODULES:
+        assert module not in imported, "{} is imported when the addon is included".format(module)
+
+    addon_time = sum(self_time for name, self_time in imports if is_addon_module(name))
+    assert addon_time < BUDGET, "Importing the addon took {} ms, the budget is {} ms".format(addon_time // 1000, BUDGET // 1000)
@@ -0,0 +1,122 @@
+"""Markdown archive import tests."""
+# Pyramid
+import transaction
+
+# Websauna
+from websauna.blog.events import PostsChanged
+from websauna.blog.importer import import_archive
+from websauna.blog.models import Post
+from websauna.blog.models import Tag
+
+
+POST = """---
+title: {title}
+slug: {slug}
+author: Mikko Ohtamaa
+tags: [python, websauna]
+date: 2017-05-01 10:00:00
+excerpt: Short excerpt.
+series: tutorial
+---
+
+# Heading
+
+Body of {title}.
+"""
+
+
+def write_archive(path, count):
+    for i in range(count):
+        path.join("post-{}.md".format(i)).write_text(POST.format(title="Post {}".format(i), slug="post-{}".format(i)), encoding="utf-8")
+
+
+def test_import_archive(dbsession, tmpdir):
+    """Posts, tags and associations are imported in batches."""
+
+    write_archive(tmpdir, 5)
+    tmpdir.join("draft.md").write_text("---\ntitle: Draft\ndraft: true\ntags: python\n---\nDraft body", encoding="utf-8")
+    tmpdir.join("broken.md").write_text("---\ntitle: [unterminated\n---\n", encoding="utf-8")
+    tmpdir.join("notes.txt").write_text("Not a post", encoding="utf-8")
+
+    progress = []
+    stats = import_archive(dbsession, str(tmpdir), batch_size=2, progress=lambda stats: progress.append(stats.processed))
+
+    assert stats.imported == 6
+    assert stats.failed == 1
+    assert len(progress) == 3
+
+    with transaction.manager:
+        assert dbsession.query(Post).count() == 6
+        assert dbsession.query(Tag).count() == 2
+
+        post = dbsession.query(Post).filter_by(slug="post-3").one()
+        assert post.title == "Post 3"
+        assert post.body.startswith("# Heading")
+        assert post.published_at.year == 2017
+        assert post.other_data == {"series": "tutorial"}
+        assert sorted(tag.title for tag in post.tags) == ["python", "websauna"]
+
+        draft = dbsession.query(Post).filter_by(slug="draft").one()
+        assert draft.published_at is None
+
+
+def test_import_is_idempotent(dbsession, tmpdir):
+    """Running the import again skips existing posts."""
+
+    write_archive(tmpdir, 3)
+    import_archive(dbsession, str(tmpdir), batch_size=2)
+
+    write_archive(tmpdir, 4)
+    stats = import_archive(dbsession, str(tmpdir), batch_size=2)
+    assert stats.imported == 1
+    assert stats.skipped == 3
+
+    with transaction.manager:
+        assert dbsession.query(Post).count() == 4
+
+
+def test_import_bad_front_matter(dbsession, tmpdir):
+    """Slugs are slugified, files with bad dates or slugs fail alone."""
+
+    tmpdir.join("escape.md").write_text("---\ntitle: Escape\nslug: ../../Etc Passwd\n---\nBody", encoding="utf-8")
+    tmpdir.join("number.md").write_text("---\ntitle: Number\ndate: 20170501\n---\nBody", encoding="utf-8")
+    tmpdir.join("empty.md").write_text("---\ntitle: Empty\nslug: '???'\n---\nBody", encoding="utf-8")
+
+    stats = import_archive(dbsession, str(tmpdir))
+    assert stats.imported == 1
+    assert stats.failed == 2
+
+    with transaction.manager:
+        assert [slug for slug, in dbsession.query(Post.slug)] == ["etc-passwd"]
+
+
+def test_import_rejected_row(dbsession, tmpdir):
+    """Values too long for their columns fail their file, a row the database rejects fails alone instead of its batch."""
+
+    write_archive(tmpdir, 2)
+    tmpdir.join("long.md").write_text("---\ntitle: {}\n---\nBody".format("x" * 300), encoding="utf-8")
+    tmpdir.join("author.md").write_text("---\ntitle: Author\nauthor: [a, b]\n---\nBody", encoding="utf-8")
+    # PostgreSQL does not store NUL characters in text
+    tmpdir.join("nul.md").write_text("---\ntitle: Nul\n---\nBody\x00", encoding="utf-8")
+
+    stats = import_archive(dbsession, str(tmpdir), batch_size=10)
+    assert stats.imported == 2
+    assert stats.failed == 3
+
+    with transaction.manager:
+        assert sorted(slug for slug, in dbsession.query(Post.slug)) == ["post-0", "post-1"]
+
+
+def test_import_notifies_changes(dbsession, registry, tmpdir):
+    """Each committed batch fires PostsChanged for its posts."""
+    events = []
+    registry.registerHandler(events.append, (PostsChanged,))
+    try:
+        write_archive(tmpdir, 3)
+        import_archive(dbsession, str(tmpdir), batch_size=2, registry=registry)
+    finally:
+        registry.unregisterHandler(events.append, (PostsChanged,))
+
+    assert len(events) == 2
+    assert set().union(*(event.slugs for event in events)) == {"post-0", "post-1", "post-2"}
+    assert events[0].tags == {"python", "websauna"}
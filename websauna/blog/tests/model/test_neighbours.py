@@ -0,0 +1,82 @@
+"""Previous and next post tests."""
+# Standard Library
+import datetime
+
+# Pyramid
+import transaction
+
+# Websauna
+from websauna.blog.cache import MemoryCache
+from websauna.blog.cache import get_changed_keys
+from websauna.blog.events import PostsChanged
+from websauna.blog.interfaces import IBlogCache
+from websauna.blog.neighbours import add_neighbours
+from websauna.blog.neighbours import get_adjacent_ids
+from websauna.blog.neighbours import get_neighbours
+from websauna.blog.neighbours import lookup_neighbours
+from websauna.blog.slugcache import PostSummary
+from websauna.utils.time import now
+
+
+def make_posts(dbsession, fakefactory, tag):
+    """Three published posts a day apart, the middle one without the tag, and a draft."""
+    start = now() - datetime.timedelta(days=10)
+    posts = [fakefactory.PostFactory(published_at=start + datetime.timedelta(days=i), tags=[tag] if i != 1 else []) for i in range(3)]
+    fakefactory.PostFactory(published_at=None, tags=[tag])
+    dbsession.flush()
+    return posts
+
+
+def test_neighbours(dbsession, fakefactory):
+    """Neighbours are the adjacent published posts, optionally within a tag."""
+    with transaction.manager:
+        tag = fakefactory.TagFactory()
+        first, middle, last = make_posts(dbsession, fakefactory, tag)
+
+        neighbours = get_neighbours(dbsession, PostSummary.from_post(middle))
+        assert neighbours["previous"]["slug"] == first.slug
+        assert neighbours["next"] == {"id": last.id, "title": last.title, "slug": last.slug}
+
+        neighbours = get_neighbours(dbsession, PostSummary.from_post(first), tag=tag.title)
+        assert neighbours["previous"] is None
+        assert neighbours["next"]["slug"] == last.slug
+        assert neighbours["tag"] == tag.title
+
+        assert get_adjacent_ids(dbsession, [middle.id]) == {first.id, last.id}
+        assert get_adjacent_ids(dbsession, [first.id]) == {middle.id, last.id}
+
+        # Retracted posts have no neighbours of their own, their former neighbours link to them and carry their key
+        last.published_at = None
+        dbsession.flush()
+        assert get_adjacent_ids(dbsession, [last.id]) == set()
+        assert get_adjacent_ids(dbsession, [first.id]) == {middle.id}
+
+
+def test_new_post_drops_cached_neighbours(test_request, dbsession, fakefactory):
+    """Publishing a post next to a cached post changes its neighbours."""
+    cache = MemoryCache()
+    test_request.registry.registerUtility(cache, IBlogCache)
+    try:
+        with transaction.manager:
+            tag = fakefactory.TagFactory()
+            first, middle, last = make_posts(dbsession, fakefactory, tag)
+            summary = PostSummary.from_post(last)
+            last_id = last.id
+
+        with transaction.manager:
+            assert lookup_neighbours(test_request, summary)["next"] is None
+
+        with transaction.manager:
+            newest = fakefactory.PostFactory(public=True, tags=[])
+            dbsession.flush()
+            newest_id = newest.id
+
+        event = PostsChanged(test_request.registry, post_ids=[newest_id])
+        add_neighbours(event)
+        assert last_id in event.post_ids
+        cache.invalidate_tags(get_changed_keys(event))
+
+        with transaction.manager:
+            assert lookup_neighbours(test_request, summary)["next"]["id"] == newest_id
+    finally:
+        test_request.registry.unregisterUtility(cache, IBlogCache)
@@ -1,9 +1,14 @@
+# Standard Library
+import datetime
+
 # Pyramid
 from pyramid.interfaces import IAuthorizationPolicy
 from pyramid.security import Everyone
 
 # Websauna
+from websauna.blog.permissions import has_permission
 from websauna.blog.views import blog_container_factory
+from websauna.utils.time import now
 import transaction
 
 
@@ -36,3 +41,46 @@ def test_published(test_request, fakefactory, dbsession):
 
     assert post_resource.post.published_at
     assert policy.permits(post_resource, Everyone, "view")
+
+
+def test_scheduled(test_request, fakefactory, dbsession):
+    """Posts published in the future stay drafts until their publishing time."""
+
+    with transaction.manager:
+        post = fakefactory.PostFactory(published_at=now() + datetime.timedelta(hours=1))
+        dbsession.expunge_all()
+
+    blog_container = blog_container_factory(test_request)
+    post_resource = blog_container[post.slug]
+    policy = test_request.registry.queryUtility(IAuthorizationPolicy)
+
+    assert post_resource.post.is_scheduled()
+    assert not post_resource.post.is_published()
+    assert post_resource.post.is_published(now() + datetime.timedelta(hours=2))
+    assert not policy.permits(post_resource, Everyone, "view")
+    assert policy.permits(post_resource, "group:admin", "view")
+
+
+def test_permission_memo(test_request, fakefactory, dbsession):
+    """Posts sharing an ACL are checked once per request."""
+
+    with transaction.manager:
+        for i in range(3):
+            fakefactory.PostFactory(public=True)
+        draft = fakefactory.PostFactory(private=True)
+        dbsession.expunge_all()
+
+    blog_container = blog_container_factory(test_request)
+    policy = test_request.registry.queryUtility(IAuthorizationPolicy)
+    permits = policy.permits
+    calls = []
+    policy.permits = lambda context, principals, permission: calls.append(permission) or permits(context, principals, permission)
+    try:
+        with transaction.manager:
+            assert len(list(blog_container.get_posts())) == 3
+            assert calls == ["edit", "view"]
+
+            assert not has_permission(test_request, "view", blog_container[draft.slug])
+            assert calls == ["edit", "view", "view"]
+    finally:
+        del policy.permits
@@ -0,0 +1,71 @@
+"""Caching proxy purge tests against a stub HTTP server."""
+# Standard Library
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+
+import pytest
+
+# Websauna
+from websauna.blog.events import PostsChanged
+from websauna.blog.interfaces import IPurgeBackend
+from websauna.blog.purge import HTTPPurger
+from websauna.blog.purge import purge_changed
+
+
+@pytest.fixture()
+def proxy():
+    """Stub caching proxy recording the purge requests it gets."""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_PURGE(self):
+            received.append((self.command, self.headers.get("Surrogate-Key")))
+            self.send_response(200)
+            self.end_headers()
+
+        do_BAN = do_PURGE
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield "http://127.0.0.1:{}/".format(server.server_port), received
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_purge_in_chunks(proxy):
+    """Keys are sent in the configured header, split to several requests when there are many."""
+    url, received = proxy
+    purger = HTTPPurger([url], method="BAN")
+    purger.max_keys = 2
+
+    purger.purge(["roll", "post-1", "tag-python"])
+    assert received == [("BAN", "roll post-1"), ("BAN", "tag-python")]
+
+
+def test_purge_changed_posts(proxy, registry):
+    """A change purges the roll and exactly the changed posts and tags."""
+    url, received = proxy
+    post_id = uuid.uuid4()
+    registry.registerUtility(HTTPPurger([url]), IPurgeBackend)
+    try:
+        purge_changed(PostsChanged(registry, post_ids=[post_id], tags=["Web Development"])).result()
+    finally:
+        registry.unregisterUtility(provided=IPurgeBackend)
+
+    assert received == [("PURGE", "roll post-{} tag-Web%20Development".format(post_id))]
+
+
+def test_proxy_down(caplog):
+    """Unreachable proxy is logged, not raised."""
+    purger = HTTPPurger(["http://127.0.0.1:9/"], timeout=1)
+    purger.purge(["roll"])
+    assert "Could not purge" in caplog.text
@@ -0,0 +1,53 @@
+"""Markdown rendering tests."""
+# Websauna
+from websauna.blog.rendering import PoolRenderer
+
+
+def test_render():
+    """Markdown is rendered with a table of contents."""
+    renderer = PoolRenderer(processes=0)
+    body_html, toc, ok = renderer.render("# Title\n\nText")
+
+    assert ok
+    assert '<h1 id="title">Title</h1>' in body_html
+    assert toc[0]["id"] == "title"
+
+
+def test_render_too_large():
+    """Bodies over the size limit are shown as escaped text."""
+    renderer = PoolRenderer(processes=0, max_size=10)
+    body_html, toc, ok = renderer.render("# <b>Very long title</b>")
+
+    assert not ok
+    assert toc == []
+    assert body_html == '<pre class="body-text"># &lt;b&gt;Very long title&lt;/b&gt;</pre>'
+
+
+def test_render_in_pool():
+    """Markdown is rendered in a worker process."""
+    renderer = PoolRenderer(processes=1, timeout=30)
+    try:
+        body_html, toc, ok = renderer.render("*Text*")
+    finally:
+        renderer.close()
+
+    assert ok
+    assert body_html == "<p><em>Text</em></p>"
+
+
+def test_render_timeout():
+    """A timed out render leaves its pool behind and later renders get a fresh one."""
+    renderer = PoolRenderer(processes=1, timeout=0.001)
+    try:
+        body_html, toc, ok = renderer.render("*Text*")
+        assert not ok
+        assert renderer.pool is None
+        assert not renderer.running
+        assert not renderer.retired
+
+        renderer.timeout = 30
+        body_html, toc, ok = renderer.render("*Text*")
+        assert ok
+        assert body_html == "<p><em>Text</em></p>"
+    finally:
+        renderer.close()
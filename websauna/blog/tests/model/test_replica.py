@@ -0,0 +1,68 @@
+"""Read replica routing tests.
+
+The test database doubles as the replica, reads through it are read-only transactions.
+"""
+# Pyramid
+import transaction
+from pyramid.response import Response
+
+# SQLAlchemy
+import sqlalchemy as sa
+
+import pytest
+
+# Websauna
+from websauna.blog.events import PostsChanged
+from websauna.blog.interfaces import IReadReplica
+from websauna.blog.models import Post
+from websauna.blog.replica import STICKY_COOKIE
+from websauna.blog.replica import ReadReplica
+from websauna.blog.replica import get_read_dbsession
+from websauna.blog.replica import stick_to_primary
+from websauna.system.http.utils import make_routable_request
+
+
+@pytest.fixture()
+def replica(registry):
+    replica = ReadReplica(registry.settings["sqlalchemy.url"], sticky_seconds=10)
+    registry.registerUtility(replica, IReadReplica)
+    try:
+        yield replica
+    finally:
+        registry.unregisterUtility(provided=IReadReplica)
+        replica.engine.dispose()
+
+
+def test_read_from_replica(replica, test_request, dbsession, fakefactory):
+    """Public reads use one read-only replica session per request."""
+    with transaction.manager:
+        post_id = fakefactory.PostFactory(public=True).id
+
+    read_dbsession = get_read_dbsession(test_request)
+    try:
+        assert read_dbsession is not dbsession
+        assert get_read_dbsession(test_request) is read_dbsession
+        assert read_dbsession.query(Post).get(post_id).id == post_id
+
+        with pytest.raises(sa.exc.InternalError):
+            read_dbsession.execute("UPDATE blog_post SET view_count = 1")
+    finally:
+        read_dbsession.close()
+
+
+def test_stick_to_primary(replica, test_request, dbsession, registry):
+    """After a change the process and the browser of the editor read from the primary."""
+    stick_to_primary(PostsChanged(registry, test_request))
+
+    assert replica.is_stale()
+    assert get_read_dbsession(make_routable_request(dbsession, registry)) is dbsession
+
+    response = Response()
+    test_request._process_response_callbacks(response)
+    assert STICKY_COOKIE in response.headers["Set-Cookie"]
+
+    # Another process only knows from the cookie
+    replica.primary_until = 0
+    request = make_routable_request(dbsession, registry)
+    request.cookies[STICKY_COOKIE] = response.headers["Set-Cookie"].split(";")[0].split("=", 1)[1]
+    assert get_read_dbsession(request) is dbsession
@@ -0,0 +1,61 @@
+"""Post revision history tests."""
+# Pyramid
+import transaction
+
+# Websauna
+from websauna.blog.models import PostRevision
+from websauna.blog.revisions import apply_delta
+from websauna.blog.revisions import compute_delta
+from websauna.blog.revisions import get_revisions
+from websauna.blog.revisions import rebuild_body
+from websauna.blog.revisions import record_revision
+
+
+def test_delta_roundtrip():
+    """Applying a computed delta gives back the new text."""
+
+    old = "# Title\n\nFirst paragraph.\n\nSecond paragraph.\nNo newline at end"
+    new = "# New title\n\nFirst paragraph.\n\nInserted.\n\nSecond paragraph.\n"
+    assert apply_delta(old, compute_delta(old, new)) == new
+    assert apply_delta(new, compute_delta(new, old)) == old
+    assert apply_delta("", compute_delta("", new)) == new
+
+
+def test_rebuild_revisions(dbsession, fakefactory):
+    """Every revision can be rebuilt and snapshots are taken every N revisions."""
+
+    bodies = ["Line {}\n".format(i) * (i + 1) for i in range(7)]
+
+    with transaction.manager:
+        post = fakefactory.PostFactory(body=bodies[0])
+        record_revision(dbsession, post, None, snapshot_interval=3)
+        for previous, body in zip(bodies, bodies[1:]):
+            post.body = body
+            record_revision(dbsession, post, previous, snapshot_interval=3)
+
+        # Saving without changes does not create a revision
+        assert record_revision(dbsession, post, post.body, snapshot_interval=3) is None
+        post_id = post.id
+
+    with transaction.manager:
+        revisions = dbsession.query(PostRevision).filter_by(post_id=post_id).order_by(PostRevision.revision).all()
+        assert [r.revision for r in revisions] == [1, 2, 3, 4, 5, 6, 7]
+        assert [r.is_snapshot() for r in revisions] == [True, False, False, True, False, False, True]
+        assert [is_snapshot for r, is_snapshot in get_revisions(dbsession, post_id)] == [True, False, False, True, False, False, True][::-1]
+
+        for number, body in enumerate(bodies, start=1):
+            assert rebuild_body(dbsession, post_id, number) == body
+
+
+def test_record_legacy_post(dbsession, fakefactory):
+    """The body of a post written before revision history is kept as the first revision."""
+
+    with transaction.manager:
+        post = fakefactory.PostFactory(body="Old body\n")
+        post.body = "New body\n"
+        record_revision(dbsession, post, "Old body\n")
+        post_id = post.id
+
+    with transaction.manager:
+        assert rebuild_body(dbsession, post_id, 1) == "Old body\n"
+        assert rebuild_body(dbsession, post_id, 2) == "New body\n"
@@ -1,5 +1,9 @@
 # Websauna
 from websauna.blog.models import Post
+from websauna.blog.models import PostSlugHistory
+from websauna.blog.slughistory import find_moved_post
+from websauna.blog.slughistory import is_slug_taken
+from websauna.blog.slughistory import record_slug_change
 
 
 def test_slugify(dbsession):
@@ -18,3 +22,32 @@ def test_slugify(dbsession):
     assert post.ensure_slug(dbsession) == "hello-world-2"
     dbsession.add(post)
     dbsession.flush()
+
+
+def test_slug_history(dbsession):
+    """Former slugs point to the post and stay reserved for it."""
+
+    post = Post(title="Hello world", slug="hello-world")
+    dbsession.add(post)
+    dbsession.flush()
+
+    post.slug = "hello-again"
+    record_slug_change(dbsession, post, "hello-world")
+    dbsession.flush()
+
+    assert find_moved_post(dbsession, "hello-world") == (post.id, "hello-again")
+    assert is_slug_taken(dbsession, "hello-world")
+    assert not is_slug_taken(dbsession, "hello-world", post.id)
+
+    # Generated slugs skip former slugs of other posts
+    other = Post(title="Hello world")
+    assert other.ensure_slug(dbsession) == "hello-world-2"
+
+    # Returning to a former slug removes it from the history
+    post.slug = "hello-world"
+    record_slug_change(dbsession, post, "hello-again")
+    dbsession.flush()
+
+    assert find_moved_post(dbsession, "hello-world") is None
+    assert find_moved_post(dbsession, "hello-again") == (post.id, "hello-world")
+    assert dbsession.query(PostSlugHistory).count() == 1
@@ -0,0 +1,53 @@
+"""Slug lookup cache tests."""
+# Pyramid
+import transaction
+
+# Websauna
+from websauna.blog.cache import MemoryCache
+from websauna.blog.cache import post_key
+from websauna.blog.events import PostsChanged
+from websauna.blog.interfaces import IBlogCache
+from websauna.blog.slugcache import invalidate_slugs
+from websauna.blog.slugcache import lookup_slug
+from websauna.blog.views import blog_container_factory
+
+
+def test_slug_lookup_cache(test_request, dbsession, fakefactory):
+    """Known and unknown slugs are answered from the cache until invalidated."""
+    cache = MemoryCache()
+    test_request.registry.registerUtility(cache, IBlogCache)
+    try:
+        with transaction.manager:
+            assert lookup_slug(test_request, "hello") == (None, None)
+
+        with transaction.manager:
+            post = fakefactory.PostFactory(public=True, slug="hello")
+            post_id = post.id
+
+        # Negative hit until the slug is announced
+        with transaction.manager:
+            assert lookup_slug(test_request, "hello") == (None, None)
+
+        invalidate_slugs(PostsChanged(test_request.registry, slugs=["hello"]))
+
+        with transaction.manager:
+            summary, post = lookup_slug(test_request, "hello")
+            assert summary.id == post_id
+            assert post.id == post_id
+
+        with transaction.manager:
+            summary, post = lookup_slug(test_request, "hello")
+            assert summary.id == post_id
+            assert post is None
+
+        # Post is loaded lazily from the summary
+        with transaction.manager:
+            resource = blog_container_factory(test_request)["hello"]
+            assert "post" not in resource.__dict__
+            assert resource.post.id == post_id
+
+        cache.invalidate_tags([post_key(post_id)])
+        with transaction.manager:
+            assert lookup_slug(test_request, "hello")[1].id == post_id
+    finally:
+        test_request.registry.unregisterUtility(provided=IBlogCache)
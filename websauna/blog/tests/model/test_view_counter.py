@@ -0,0 +1,62 @@
+"""Write-behind view counter tests."""
+# Standard Library
+import atexit
+
+# Pyramid
+import transaction
+
+# Websauna
+from websauna.blog.counters import MemoryViewCounter
+from websauna.blog.models import Post
+
+
+def test_flush_view_counts(dbsession, registry, fakefactory):
+    """Views of several posts are written in one flush and the pending counts are emptied."""
+
+    with transaction.manager:
+        post_a = fakefactory.PostFactory(public=True)
+        post_b = fakefactory.PostFactory(public=True)
+        post_a_id, post_b_id = post_a.id, post_b.id
+
+    counter = MemoryViewCounter(registry)
+    for i in range(3):
+        counter.pending[post_a_id] += 1
+    counter.pending[post_b_id] += 1
+
+    with transaction.manager:
+        assert counter.flush(dbsession) == 2
+
+    assert not counter.drain()
+
+    with transaction.manager:
+        assert dbsession.query(Post).get(post_a_id).view_count == 3
+        assert dbsession.query(Post).get(post_b_id).view_count == 1
+
+    # Counts accumulate over flushes
+    counter.pending[post_a_id] += 2
+    with transaction.manager:
+        counter.flush(dbsession)
+
+    with transaction.manager:
+        assert dbsession.query(Post).get(post_a_id).view_count == 5
+
+
+def test_flush_nothing(dbsession, registry):
+    """Empty flush does not touch the database."""
+
+    counter = MemoryViewCounter(registry)
+    with transaction.manager:
+        assert counter.flush(dbsession) == 0
+
+
+def test_restarted_flusher_registers_exit_once(registry, monkeypatch):
+    """Replacing a dead flush thread does not add another exit flush."""
+    registered = []
+    monkeypatch.setattr(atexit, "register", registered.append)
+
+    counter = MemoryViewCounter(registry, flush_interval=3600)
+    counter.ensure_flusher()
+    counter.flusher = None
+    counter.ensure_flusher()
+
+    assert registered == [counter.flush_now]
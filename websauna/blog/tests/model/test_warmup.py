@@ -0,0 +1,42 @@
+"""Startup warm-up tests."""
+# Standard Library
+import os
+
+# Pyramid
+import transaction
+
+# Websauna
+from websauna.blog.cache import MemoryCache
+from websauna.blog.interfaces import IBlogCache
+from websauna.blog.interfaces import IViewCounter
+from websauna.blog.warmup import TEMPLATE_DIR
+from websauna.blog.warmup import compile_templates
+from websauna.blog.warmup import warm_up
+
+
+def test_compile_templates(registry):
+    """All addon templates compile."""
+    templates = [filename for dirpath, dirnames, filenames in os.walk(TEMPLATE_DIR) for filename in filenames if filename.endswith(".html")]
+    assert compile_templates(registry) == len(templates)
+
+
+def test_warm_up(app, registry, dbsession, fakefactory):
+    """Roll, feed and latest posts are rendered to the cache without counting views."""
+    with transaction.manager:
+        post = fakefactory.PostFactory(public=True, slug="warm")
+        post_id = post.id
+
+    cache = MemoryCache()
+    registry.registerUtility(cache, IBlogCache)
+    try:
+        timings = warm_up(app, registry)
+    finally:
+        registry.unregisterUtility(provided=IBlogCache)
+
+    assert list(timings) == ["imports", "templates", "pages"]
+    assert cache.get("page:/blog/") is not None
+    assert cache.get("page:/blog/rss") is not None
+    assert cache.get("page:/blog/warm/") is not None
+
+    counter = registry.queryUtility(IViewCounter)
+    assert post_id not in counter.drain()
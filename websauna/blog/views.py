@@ -1,16 +1,24 @@
 # Standard Library
 import logging
 from typing import Iterable
+from typing import Optional
+from typing import Tuple
+from urllib.parse import urljoin
 
 # Pyramid
 from pyramid.decorator import reify
+from pyramid.httpexceptions import HTTPMovedPermanently
+from pyramid.httpexceptions import HTTPNotFound
 from pyramid.security import Allow
 from pyramid.security import Deny
 from pyramid.security import Everyone
+from pyramid.settings import aslist
 from pyramid.view import view_config
 from zope.interface import implementer
 
-import markdown
+# SQLAlchemy
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import undefer
 
 # Websauna
 from websauna.compat.typing import List
@@ -21,32 +29,120 @@ from websauna.system.core.traversal import Resource
 from websauna.system.core.views.redirect import redirect_view
 from websauna.system.crud.paginator import DefaultPaginator
 from websauna.system.http import Request
-
+from websauna.utils.time import now
+
+from .counters import counted
+from .derivatives import compute_derivatives
+from .derivatives import is_fresh
+from .httpcaching import cache_headers
+from .httpcaching import conditional_get
+from .httpcaching import data_roll_validator
+from .httpcaching import post_validator
+from .httpcaching import roll_validator
+from .images import get_image_processor
 from .models import Post
 from .models import Tag
+from .neighbours import lookup_neighbours
+from .pagecache import page_cache
+from .permissions import has_permission
+from .rendering import get_renderer
+from .replica import get_read_dbsession
+from .slugcache import MovedSlug
+from .slugcache import PostSummary
+from .slugcache import lookup_slug
 
 
 logger = logging.getLogger(__name__)
 
 
 class PostResource(Resource):
-    """Wrap SQLAlchemy Post model to traversing resource."""
+    """Wrap SQLAlchemy Post model to traversing resource.
+
+    The resource can be created from a cached :py:class:`~websauna.blog.slugcache.PostSummary` alone. Permissions and HTTP caching use the summary, the post is loaded from the database when first accessed. Resources created from a post make the summary only when it is needed.
+    """
 
-    def __init__(self, request: Request, post: Post):
+    def __init__(self, request: Request, post: Post = None, summary: PostSummary = None):
         super(PostResource, self).__init__(request)
-        self.post = post
+        assert post or summary, "Either post or summary is needed"
+        if post is not None:
+            self.__dict__["post"] = post
+        if summary is not None:
+            self.__dict__["summary"] = summary
+
+    @reify
+    def summary(self) -> PostSummary:
+        return PostSummary.from_post(self.post)
+
+    @reify
+    def post(self) -> Post:
+        post = get_read_dbsession(self.request).query(Post).get(self.summary.id)
+        if post is None:
+            # Deleted after the summary was cached
+            raise HTTPNotFound()
+        return post
 
     def get_title(self) -> str:
         return self.post.title
 
-    def get_body_as_html(self) -> str:
-        return markdown.markdown(self.post.body)
+    @reify
+    def inline_derivatives(self) -> Tuple[str, dict]:
+        """Derivatives computed on the spot, when the stored ones are not up to date."""
+        registry = self.request.registry
+        return compute_derivatives(self.post.body, get_renderer(registry), get_image_processor(registry))
+
+    def get_body_as_html(self, allow_stale: bool = False) -> str:
+        """Rendered body.
+
+        :param allow_stale: Use HTML stored from an earlier version of the body until the background update has run, rendering inline only when nothing is stored. For feeds, which list many posts.
+        """
+        post = self.post
+        if post.body_html is not None and (allow_stale or is_fresh(post)):
+            return post.body_html
+        return self.inline_derivatives[0]
+
+    @reify
+    def derived(self) -> dict:
+        """Word count, reading time, table of contents and plain text excerpt, see :py:mod:`websauna.blog.derivatives`."""
+        if is_fresh(self.post):
+            return self.post.derived
+        return self.inline_derivatives[1]
+
+    def get_excerpt(self, allow_stale: bool = False) -> str:
+        """Excerpt written by the author, or the beginning of the body.
+
+        :param allow_stale: See :py:meth:`get_body_as_html`
+        """
+        if self.post.excerpt:
+            return self.post.excerpt
+        derived = self.post.derived if allow_stale and self.post.derived else self.derived
+        return derived["excerpt"]
+
+    def get_social_image(self) -> Optional[dict]:
+        """Image for social media cards with ``url``, ``width`` and ``height``, see :py:mod:`websauna.blog.images`."""
+        image = self.derived.get("image")
+        if not image:
+            return None
+        return dict(image, url=urljoin(self.request.application_url + "/", image["url"]))
+
+    @reify
+    def neighbours(self) -> dict:
+        """Previous and next published post, within the tag given in ``tag`` parameter if the post has it, see :py:mod:`websauna.blog.neighbours`."""
+        tag = self.request.GET.get("tag")
+        return lookup_neighbours(self.request, self.summary, tag if tag in self.summary.tags else None)
+
+    def get_neighbour_url(self, neighbour: dict) -> str:
+        """Link to a neighbour, staying within the tag."""
+        tag = self.neighbours["tag"]
+        query = {"tag": tag} if tag else None
+        return self.request.resource_url(self.__parent__, neighbour["slug"], query=query)
 
     def get_heading_class(self) -> str:
-        """Visually separate draft posts from published posts when viewing blog roll as admin."""
+        """Visually separate draft and scheduled posts from published posts when viewing blog roll as admin."""
 
-        if self.post.published_at:
+        if self.post.is_published():
             return ""
+        elif self.post.published_at:
+            return "text-warning"
         else:
             return "text-danger"
 
@@ -54,8 +150,8 @@ class PostResource(Resource):
     def __acl__(self) -> List[tuple]:
         """Dynamically give blog post permissions."""
 
-        # Only published posts are viewable to the audience
-        if self.post.published_at:
+        # Only published posts are viewable to the audience, scheduled posts stay drafts until their time
+        if self.summary.is_published():
             return [
                 (Allow, Everyone, "view"),
             ]
@@ -67,6 +163,27 @@ class PostResource(Resource):
             ]
 
 
+class MovedPostResource(Resource):
+    """Former URL of a post, redirects to the current one."""
+
+    def __init__(self, request: Request, moved: MovedSlug):
+        super(MovedPostResource, self).__init__(request)
+        self.moved = moved
+
+    def get_target(self) -> Optional[PostResource]:
+        """The post under its current slug, or ``None`` if the current user cannot view it.
+
+        Redirecting without the check would reveal the slug of a draft.
+        """
+        try:
+            target = self.__parent__[self.moved.slug]
+        except KeyError:
+            return None
+        if isinstance(target, PostResource) and has_permission(self.request, "view", target):
+            return target
+        return None
+
+
 @implementer(IContainer)
 class BlogContainer(Resource):
     """Contains all posts, mounted at /blog/."""
@@ -79,6 +196,38 @@ class BlogContainer(Resource):
         title = self.request.registry.settings.get("blog.title", "Websauna blog")
         return title
 
+    @reify
+    def can_view_drafts(self) -> bool:
+        """Admins see drafts and scheduled posts in the rolls."""
+        return bool(has_permission(self.request, "edit", self))
+
+    def filter_visible(self, query):
+        """Limit a post query to posts the current user can view."""
+        if self.can_view_drafts:
+            return query
+        return query.filter(Post.published_clause(now()))
+
+    def filter_by_data(self, query, contains: Optional[dict] = None, has_key: Optional[str] = None):
+        """Limit a post query by values in ``Post.other_data``.
+
+        :param contains: Keys and values the data must contain, e.g. ``{"series": "Pyramid tips"}``. Uses the GIN index of ``other_data``.
+        :param has_key: Top level key the data must have with any value. Not covered by the ``jsonb_path_ops`` index, combine with ``contains`` on large blogs.
+        """
+        if contains:
+            query = query.filter(Post.other_data.contains(contains))
+        if has_key:
+            query = query.filter(Post.other_data.has_key(has_key))
+        return query
+
+    def query_posts_by_data(self, contains: Optional[dict] = None, has_key: Optional[str] = None):
+        """Query visible posts by their ``other_data``, oldest first, e.g. the posts of a series in reading order.
+
+        The query can be sliced and counted, so that paging happens in SQL.
+        """
+        dbsession = get_read_dbsession(self.request)
+        q = self.filter_by_data(self.filter_visible(dbsession.query(Post).options(selectinload(Post.tags))), contains, has_key)
+        return q.order_by(Post.published_at.asc(), Post.id.asc())
+
     def wrap_post(self, post: Post) -> "PostResource":
         """Convert raw SQLAlchemy Post instance to traverse and permission aware PostResource with its public URL."""
         res = PostResource(self.request, post)
@@ -90,23 +239,32 @@ class BlogContainer(Resource):
         We filter out by current user permissions.
         """
 
-        dbsession = self.request.dbsession
-        q = dbsession.query(Post).order_by(Post.published_at.desc())
+        dbsession = get_read_dbsession(self.request)
+        q = self.filter_visible(dbsession.query(Post).options(selectinload(Post.tags))).order_by(Post.published_at.desc())
 
         for post in q:
             resource = self.wrap_post(post)
-            if self.request.has_permission("view", resource):
+            if has_permission(self.request, "view", resource):
                 yield resource
 
     def get_posts_by_tag(self, tag: str) -> Iterable[PostResource]:
         """Lists all posts by a tag within the permissions of a current user."""
-        dbsession = self.request.dbsession
-        tag_obj = dbsession.query(Tag).filter_by(title=tag).one_or_none()
-        if tag_obj:
-            for post in tag_obj.posts:
-                resource = self.wrap_post(post)
-                if self.request.has_permission("view", resource):
-                    yield resource
+        dbsession = get_read_dbsession(self.request)
+        q = self.filter_visible(dbsession.query(Post).options(selectinload(Post.tags))).filter(Post.tags.any(Tag.title == tag)).order_by(Post.published_at.desc())
+        for post in q:
+            resource = self.wrap_post(post)
+            if has_permission(self.request, "view", resource):
+                yield resource
+
+    def get_feed_posts(self) -> Iterable[PostResource]:
+        """Newest posts for the feed, ``blog.rss_feed_limit`` of them (default 20), with their stored HTML."""
+        limit = int(self.request.registry.settings.get("blog.rss_feed_limit", 20))
+        dbsession = get_read_dbsession(self.request)
+        q = self.filter_visible(dbsession.query(Post).options(selectinload(Post.tags), undefer(Post.body_html)))
+        for post in q.order_by(Post.published_at.desc()).limit(limit):
+            resource = self.wrap_post(post)
+            if has_permission(self.request, "view", resource):
+                yield resource
 
     def items(self):
         """Sitemap support."""
@@ -123,24 +281,40 @@ class BlogContainer(Resource):
     def get_published_posts(self, limit=5) -> Iterable[PostResource]:
         """Iterate all published posts in this folder."""
 
-        dbsession = self.request.dbsession
-        q = dbsession.query(Post).filter(Post.published_at != None).order_by(Post.published_at.desc())  # noQA
+        dbsession = get_read_dbsession(self.request)
+        q = dbsession.query(Post).options(selectinload(Post.tags)).filter(Post.published_clause(now())).order_by(Post.published_at.desc()).limit(limit)
 
-        for post in q.all()[0:limit]:
+        for post in q:
             resource = self.wrap_post(post)
             yield resource
 
     def __getitem__(self, item: str) -> PostResource:
         """Traversing to blog post."""
 
-        dbsession = self.request.dbsession
-        item = dbsession.query(Post).filter_by(slug=item).one_or_none()
-        if item:
-            return self.wrap_post(item)
+        summary, post = lookup_slug(self.request, item)
+        if isinstance(summary, MovedSlug):
+            return Resource.make_lineage(self, MovedPostResource(self.request, summary), item)
+        elif summary:
+            res = PostResource(self.request, post=post, summary=summary)
+            return Resource.make_lineage(self, res, summary.slug)
 
         raise KeyError()
 
 
+class PostResourceSequence:
+    """Posts of a query wrapped to resources when sliced, for paginating in SQL."""
+
+    def __init__(self, blog_container: BlogContainer, query):
+        self.blog_container = blog_container
+        self.query = query
+
+    def __getitem__(self, item: slice) -> List[PostResource]:
+        return [self.blog_container.wrap_post(post) for post in self.query[item]]
+
+    def __len__(self) -> int:
+        return self.query.count()
+
+
 def blog_container_factory(request) -> BlogContainer:
     """Set up __parent__ and __name__ pointers for BlogContainer required for traversal."""
     folder = BlogContainer(request)
@@ -148,7 +322,7 @@ def blog_container_factory(request) -> BlogContainer:
     return Resource.make_lineage(root, folder, "blog")
 
 
-@view_config(route_name="blog", context=BlogContainer, name="", renderer="blog/blog_roll.html")
+@view_config(route_name="blog", context=BlogContainer, name="", renderer="blog/blog_roll.html", decorator=(cache_headers, conditional_get(roll_validator), page_cache))
 def blog_roll(blog_container, request):
     """Blog index view."""
     breadcrumbs = get_breadcrumbs(blog_container, request)
@@ -163,7 +337,7 @@ def blog_roll(blog_container, request):
     return locals()
 
 
-@view_config(route_name="blog_tag", renderer="blog/tag_roll.html")
+@view_config(route_name="blog_tag", renderer="blog/tag_roll.html", decorator=(cache_headers, conditional_get(roll_validator), page_cache))
 def tag(blog_container: BlogContainer, request: Request):
     """Tag roll."""
 
@@ -183,7 +357,33 @@ def tag(blog_container: BlogContainer, request: Request):
     return locals()
 
 
-@view_config(route_name="blog", context=PostResource, name="", renderer="blog/post.html")
+@view_config(route_name="blog_data", renderer="blog/data_roll.html", decorator=(cache_headers, conditional_get(data_roll_validator), page_cache))
+def data_roll(blog_container: BlogContainer, request: Request):
+    """Posts with a metadata value, e.g. ``/blog/by/series/pyramid-tips``.
+
+    Only keys listed in ``blog.data_rolls`` can be browsed.
+    """
+
+    key = request.matchdict["key"]
+    value = request.matchdict["value"]
+    if key not in aslist(request.registry.settings.get("blog.data_rolls", "series")):
+        raise HTTPNotFound()
+
+    current_view_url = request.url
+    current_view_name = "{}: {}".format(key.capitalize(), value)
+    breadcrumbs = get_breadcrumbs(blog_container, request, current_view_name=current_view_name, current_view_url=current_view_url)
+
+    # Get a hold to admin object so we can jump there
+    post_admin = request.admin["models"]["blog-posts"]
+
+    paginator = DefaultPaginator()
+    posts = PostResourceSequence(blog_container, blog_container.query_posts_by_data(contains={key: value}))
+    batch = paginator.paginate(posts, request, len(posts))
+
+    return locals()
+
+
+@view_config(route_name="blog", context=PostResource, name="", renderer="blog/post.html", decorator=(counted, cache_headers, conditional_get(post_validator), page_cache))
 def blog_post(post_resource, request):
     """Single blog post."""
     breadcrumbs = get_breadcrumbs(post_resource, request)
@@ -192,14 +392,24 @@ def blog_post(post_resource, request):
     return locals()
 
 
+@view_config(route_name="blog", context=MovedPostResource, name="")
+def moved_post(moved_post_resource, request):
+    """Redirect a former post URL to the current one."""
+    target = moved_post_resource.get_target()
+    if target is None:
+        raise HTTPNotFound()
+    return HTTPMovedPermanently(request.resource_url(target))
+
+
 def get_post_resource(request: Request, slug: str) -> PostResource:
     """Helper function to get easily URL mapped blog posts."""
 
     container = blog_container_factory(request)
     try:
-        return container[slug]
+        resource = container[slug]
     except KeyError:
         return None
+    return resource if isinstance(resource, PostResource) else None
 
 
 # Convenience redirect /blog -> /blog/
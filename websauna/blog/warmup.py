@@ -0,0 +1,165 @@
+"""Warm up a freshly started process before it takes traffic.
+
+The first requests after a deploy pay for importing Markdown and feed libraries, compiling templates and filling empty caches. With ``blog.warmup = true`` this is done when the application has been created:
+
+* heavy modules are imported
+
+* every template of ``websauna.blog:templates`` is compiled
+
+* the blog roll, the feed and ``blog.warmup.posts`` (default 10) latest posts are rendered as anonymous requests, which stores them in the :py:mod:`page cache <websauna.blog.pagecache>`. Disable with ``blog.warmup.pages = false``.
+
+The time of each step is logged. Warm-up requests are not counted as post views.
+
+When a preloaded application is forked to web server workers, the workers inherit the compiled templates and a memory cache. Database connections, rendering processes and the invalidation bus listener are closed, so that they are not shared with the forked workers. Warm-up requests do not start the listener.
+"""
+
+# Standard Library
+import importlib
+import logging
+import os
+import time
+import typing as t
+from collections import OrderedDict
+from urllib.parse import quote
+
+# Pyramid
+import transaction
+from pyramid.events import ApplicationCreated
+from pyramid.registry import Registry
+from pyramid.request import Request
+from pyramid.settings import asbool
+from pyramid_jinja2 import IJinja2Environment
+
+# Websauna
+from websauna.system.model.meta import create_dbsession
+from websauna.system.model.meta import get_default_engine
+
+from .interfaces import IInvalidationBus
+from .interfaces import IMarkdownRenderer
+from .interfaces import IReadReplica
+from .models import Post
+
+
+logger = logging.getLogger(__name__)
+
+
+#: WSGI environment key marking warm-up requests
+WARMUP_ENVIRON_KEY = "websauna.blog.warmup"
+
+#: Modules slow to import on the first rendered page
+MODULES = ["markdown", "markdown.extensions.toc", "websauna.blog.feed"]
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+
+
+def is_warmup_request(request: Request) -> bool:
+    return bool(request.environ.get(WARMUP_ENVIRON_KEY))
+
+
+def import_modules() -> int:
+    for name in MODULES:
+        importlib.import_module(name)
+    return len(MODULES)
+
+
+def compile_templates(registry: Registry) -> int:
+    """Compile all templates of this addon to the Jinja environment cache.
+
+    :return: Number of compiled templates
+    """
+    env = registry.queryUtility(IJinja2Environment, name=".html")
+    compiled = 0
+    for dirpath, dirnames, filenames in os.walk(TEMPLATE_DIR):
+        for filename in sorted(filenames):
+            if not filename.endswith(".html"):
+                continue
+            name = os.path.relpath(os.path.join(dirpath, filename), TEMPLATE_DIR).replace(os.sep, "/")
+            try:
+                env.get_template(name)
+                compiled += 1
+            except Exception as e:
+                logger.warning("Could not compile template %s: %s", name, e)
+    return compiled
+
+
+def get_latest_slugs(registry: Registry, limit: int) -> t.List[str]:
+    tm = transaction.TransactionManager()
+    dbsession = create_dbsession(registry, manager=tm)
+    try:
+        with tm:
+            q = dbsession.query(Post.slug).filter(Post.published_clause()).order_by(Post.published_at.desc()).limit(limit)
+            return [slug for slug, in q]
+    finally:
+        dbsession.close()
+
+
+def render_pages(app, registry: Registry, limit: int) -> int:
+    """Request the blog roll, the feed and the latest posts through the whole application.
+
+    :return: Number of pages rendered successfully
+    """
+    paths = ["/blog/", "/blog/rss"] + ["/blog/{}/".format(quote(slug)) for slug in get_latest_slugs(registry, limit)]
+    base_url = registry.settings.get("websauna.site_url")
+
+    rendered = 0
+    for path in paths:
+        request = Request.blank(path, base_url=base_url, environ={WARMUP_ENVIRON_KEY: True})
+        response = request.get_response(app)
+        if response.status_code == 200:
+            rendered += 1
+        else:
+            logger.warning("Warm-up request to %s got %s", path, response.status)
+    return rendered
+
+
+def release_resources(registry: Registry):
+    """Close connections, processes and threads, which must not be shared with forked workers."""
+    get_default_engine(registry).dispose()
+
+    replica = registry.queryUtility(IReadReplica)
+    if replica is not None:
+        replica.engine.dispose()
+
+    close = getattr(registry.queryUtility(IMarkdownRenderer), "close", None)
+    if close:
+        close()
+
+    bus = registry.queryUtility(IInvalidationBus)
+    if bus is not None:
+        bus.close()
+
+
+def warm_up(app, registry: Registry) -> t.Dict[str, float]:
+    """Run the warm-up steps.
+
+    :return: Seconds spent in each step
+    """
+    settings = registry.settings
+    steps = [
+        ("imports", import_modules),
+        ("templates", lambda: compile_templates(registry)),
+    ]
+    if asbool(settings.get("blog.warmup.pages", True)):
+        steps.append(("pages", lambda: render_pages(app, registry, int(settings.get("blog.warmup.posts", 10)))))
+
+    timings = OrderedDict()
+    try:
+        for name, step in steps:
+            started = time.perf_counter()
+            try:
+                count = step()
+            except Exception as e:
+                logger.exception(e)
+                logger.error("Blog warm-up step %s failed", name)
+                count = 0
+            timings[name] = time.perf_counter() - started
+            logger.info("Blog warm-up %s: %d done in %.0f ms", name, count, timings[name] * 1000)
+    finally:
+        release_resources(registry)
+
+    logger.info("Blog warm-up done in %.0f ms", sum(timings.values()) * 1000)
+    return timings
+
+
+def on_application_created(event: ApplicationCreated):
+    warm_up(event.app, event.app.registry)